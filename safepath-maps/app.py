@@ -11,9 +11,23 @@ import traceback
 import time
 import re
 import math
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import pandas as pd
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
+from crime_dataset import CrimeDataset
+from crime_loader import CRIME_DATA_PATH, DEFAULT_VIOLENT_CRIME_TYPES, load_processed_crime_data, parse_crime_csv
+from crime_tiles import MIN_TILE_ZOOM, MAX_TILE_ZOOM, TILE_BINS
+from crime_time import parse_crime_time
+from geo import path_length
+from road_graph import ROAD_GRAPH_PATH, RoadGraph
+from routing import ROUTING_ALGORITHMS, alternative_routes, find_route, route_matrix
+from http_client import HttpClient, Service
+from response_cache import ResponseCache, SingleFlight, open_cache_store
+from landmarks import LandmarkTables, build_lock, exposure_checksum, landmarks_path
+from route_optimizer import optimize_order, tour_cost
+from route_safety import (DEFAULT_CORRIDOR_FEET, DEFAULT_SAFETY_WEIGHT, MAX_CORRIDOR_FEET, MAX_SCORED_ROUTES,
+                          is_encoded_polyline, rank_directions_routes, rank_polylines, rank_routes_api_routes)
 
 load_dotenv()
 
@@ -33,9 +47,59 @@ ROUTES_API_KEY = os.getenv("ROUTES_KEY")
 conversation_history = {}
 user_plotted_points = {}
 
-# Cache for API responses to improve performance
-api_cache = {}
-CACHE_DURATION = 300  # 5 minutes
+# Cache for API responses to improve performance, bounded by entries and approximate bytes
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_MB", "64")) * 1024 * 1024
+CACHE_DURATION = 300  # 5 minutes, for responses that change often
+
+# Seconds each kind of response stays cached
+CACHE_TTLS = {
+    "geocode_place": 24 * 3600,
+    "geocode": 24 * 3600,
+    "place": 24 * 3600,
+    "suggestions": 3600,
+    "nearby": 15 * 60,
+    "news": CACHE_DURATION
+}
+
+# Shared by all workers and kept across restarts: Redis when CACHE_REDIS_URL is set, else
+# a SQLite file; CACHE_DB_PATH="" turns it off. Only these kinds are kept there, this long.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "safepath-maps/api_cache.sqlite3")
+CACHE_STORE_TTLS = {
+    "geocode_place": 7 * 24 * 3600,
+    "geocode": 7 * 24 * 3600,
+    "place": 7 * 24 * 3600,
+    "news": CACHE_DURATION
+}
+
+api_cache = ResponseCache(
+    CACHE_TTLS, CACHE_DURATION, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES,
+    store=open_cache_store(CACHE_REDIS_URL, CACHE_DB_PATH), store_ttls=CACHE_STORE_TTLS
+)
+api_cache.start_purging()
+
+# Concurrent identical calls to uncached external APIs share one request
+outbound_calls = SingleFlight()
+
+# /api/chat runs its independent network lookups (reverse geocoding, place geocoding,
+# news) at once on a bounded pool. Lookups still running after CHAT_LOOKUP_SECONDS are
+# answered without, and the model call gets what is left of CHAT_DEADLINE_SECONDS.
+CHAT_LOOKUP_WORKERS = 16
+CHAT_LOOKUP_SECONDS = 8
+CHAT_MODEL_TIMEOUT = 15
+CHAT_DEADLINE_SECONDS = 20
+chat_lookups = ThreadPoolExecutor(max_workers=CHAT_LOOKUP_WORKERS, thread_name_prefix="chat-lookup")
+
+# Pooled keep-alive connections to each external service, with its own timeouts and retries
+http_client = HttpClient({
+    "google_maps": Service("https://maps.googleapis.com/", timeout=(3.05, 15)),
+    # computeRoutes only reads, so a POST is safe to repeat
+    "google_routes": Service("https://routes.googleapis.com/", timeout=(3.05, 15), retry_methods=('POST',)),
+    "gnews": Service("https://gnews.io/", timeout=(3.05, 10), retries=1),
+    "nominatim": Service("https://nominatim.openstreetmap.org/", timeout=(3.05, 10),
+                         headers={'User-Agent': 'SafePath/1.0'})
+})
 
 def get_or_create_session_id():
     """Get existing session ID or create a new one"""
@@ -83,36 +147,19 @@ def remove_plotted_point(session_id, point_id):
     ]
     return True
 
-def calculate_distance_between_points(lat1, lng1, lat2, lng2):
-    """Calculate distance between two points using Haversine formula"""
-    # Convert latitude and longitude from degrees to radians
-    lat1, lng1, lat2, lng2 = map(math.radians, [lat1, lng1, lat2, lng2])
-    
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlng = lng2 - lng1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # Radius of earth in kilometers
-    r = 6371
-    
-    return c * r
+def reorder_plotted_points(session_id, order):
+    """Put a session's plotted points in the given order of their current indices"""
+    points = get_user_plotted_points(session_id)
+    user_plotted_points[session_id] = [points[i] for i in order]
 
 def calculate_total_route_distance(points):
     """Calculate total distance for a route through multiple points"""
     if len(points) < 2:
         return 0
     
-    total_distance = 0
-    for i in range(len(points) - 1):
-        distance = calculate_distance_between_points(
-            points[i]["lat"], points[i]["lng"],
-            points[i + 1]["lat"], points[i + 1]["lng"]
-        )
-        total_distance += distance
-    
-    return total_distance
+    lats = [float(point["lat"]) for point in points]
+    lngs = [float(point["lng"]) for point in points]
+    return path_length(lats, lngs)
 
 def add_to_conversation_history(session_id, user_message, bot_response, location):
     """Add a message pair to conversation history"""
@@ -130,37 +177,15 @@ def add_to_conversation_history(session_id, user_message, bot_response, location
     if len(conversation_history[session_id]) > 10:
         conversation_history[session_id] = conversation_history[session_id][-10:]
 
-def is_cache_valid(cache_key):
-    """Check if cached data is still valid"""
-    if cache_key not in api_cache:
-        return False
-    
-    cache_time = api_cache[cache_key].get('timestamp', 0)
-    return (time.time() - cache_time) < CACHE_DURATION
-
-def get_from_cache(cache_key):
-    """Get data from cache if valid"""
-    if is_cache_valid(cache_key):
-        return api_cache[cache_key]['data']
-    return None
-
-def set_cache(cache_key, data):
-    """Store data in cache with timestamp"""
-    api_cache[cache_key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
-
 def geocode_place(place_name):
     """Geocode a place name to coordinates using Google Geocoding API"""
     if not PLACES_API_KEY:
         return None
     
-    cache_key = f"geocode_place_{place_name}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    return api_cache.get_or_fetch("geocode_place", place_name, lambda: _fetch_geocode_place(place_name))
+
+def _fetch_geocode_place(place_name):
+    """Geocoding API lookup for geocode_place; None when not found"""
     try:
         url = "https://maps.googleapis.com/maps/api/geocode/json"
         params = {
@@ -168,7 +193,7 @@ def geocode_place(place_name):
             'key': PLACES_API_KEY
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get("google_maps", url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['status'] == 'OK' and data['results']:
@@ -180,7 +205,6 @@ def geocode_place(place_name):
                     'place_id': result.get('place_id', ''),
                     'types': result.get('types', [])
                 }
-                set_cache(cache_key, location_data)
                 return location_data
         return None
     except Exception as e:
@@ -192,11 +216,11 @@ def get_place_suggestions(query, location=None):
     if not PLACES_API_KEY:
         return []
     
-    cache_key = f"suggestions_{query}_{location}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    cache_key = f"{query}_{location}"
+    return api_cache.get_or_fetch("suggestions", cache_key, lambda: _fetch_place_suggestions(query, location)) or []
+
+def _fetch_place_suggestions(query, location):
+    """Autocomplete lookup for get_place_suggestions; None when it failed"""
     try:
         url = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
         params = {
@@ -210,7 +234,7 @@ def get_place_suggestions(query, location=None):
             params['location'] = f"{location['lat']},{location['lng']}"
             params['radius'] = 50000
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get("google_maps", url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['status'] == 'OK':
@@ -223,12 +247,11 @@ def get_place_suggestions(query, location=None):
                         'secondary_text': prediction['structured_formatting'].get('secondary_text', ''),
                         'types': prediction.get('types', [])
                     })
-                set_cache(cache_key, suggestions)
                 return suggestions
-        return []
+        return None
     except Exception as e:
         print(f"Places suggestions error: {e}")
-        return []
+        return None
 
 def detect_location_intent(message):
     """Detect if the user wants to navigate to a specific location using NLP patterns"""
@@ -309,17 +332,17 @@ def is_standalone_location(message):
 
 def reverse_geocode(lat, lng):
     """Reverse geocode coordinates to location name with caching"""
-    cache_key = f"geocode_{lat}_{lng}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    cache_key = f"{lat}_{lng}"
+    return api_cache.get_or_fetch("geocode", cache_key, lambda: _fetch_reverse_geocode(lat, lng)) or "unknown location"
+
+def _fetch_reverse_geocode(lat, lng):
+    """Nominatim lookup for reverse_geocode; None when it failed"""
     try:
         url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&zoom=10"
-        response = requests.get(url, headers={'User-Agent': 'SafePath/1.0'}, timeout=10)
+        response = http_client.get("nominatim", url)
         
         if response.status_code != 200:
-            return "unknown location"
+            return None
             
         data = response.json()
         address = data.get("address", {})
@@ -341,24 +364,21 @@ def reverse_geocode(lat, lng):
         if country:
             location_parts.append(country)
             
-        result = ", ".join(location_parts) if location_parts else "unknown location"
-        set_cache(cache_key, result)
-        return result
+        return ", ".join(location_parts) if location_parts else "unknown location"
         
     except Exception as e:
         print(f"Geocoding error: {str(e)}")
-        return "unknown location"
+        return None
 
 def get_place_details(place_id):
     """Get detailed information about a place using Google Places API"""
     if not PLACES_API_KEY:
         return None
     
-    cache_key = f"place_{place_id}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    return api_cache.get_or_fetch("place", place_id, lambda: _fetch_place_details(place_id))
+
+def _fetch_place_details(place_id):
+    """Place Details lookup for get_place_details; None when not found"""
     try:
         url = f"https://maps.googleapis.com/maps/api/place/details/json"
         params = {
@@ -367,13 +387,11 @@ def get_place_details(place_id):
             'key': PLACES_API_KEY
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_client.get("google_maps", url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['status'] == 'OK':
-                result = data['result']
-                set_cache(cache_key, result)
-                return result
+                return data['result']
         return None
     except Exception as e:
         print(f"Places API error: {e}")
@@ -384,11 +402,13 @@ def search_nearby_places(lat, lng, place_type="point_of_interest", radius=5000):
     if not PLACES_API_KEY:
         return []
     
-    cache_key = f"nearby_{lat}_{lng}_{place_type}_{radius}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    cache_key = f"{lat}_{lng}_{place_type}_{radius}"
+    return api_cache.get_or_fetch(
+        "nearby", cache_key, lambda: _fetch_nearby_places(lat, lng, place_type, radius)
+    ) or []
+
+def _fetch_nearby_places(lat, lng, place_type, radius):
+    """Nearby Search lookup for search_nearby_places; None when it failed"""
     try:
         url = f"https://maps.googleapis.com/maps/api/place/nearbysearch/json"
         params = {
@@ -398,23 +418,34 @@ def search_nearby_places(lat, lng, place_type="point_of_interest", radius=5000):
             'key': PLACES_API_KEY
         }
         
-        response = requests.get(url, params=params, timeout=15)
+        response = http_client.get("google_maps", url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['status'] == 'OK':
-                result = data['results'][:10]  # Return top 10 results
-                set_cache(cache_key, result)
-                return result
-        return []
+                return data['results'][:10]  # Return top 10 results
+        return None
     except Exception as e:
         print(f"Places search error: {e}")
-        return []
+        return None
+
+def _shared_outbound_call(name, function, *args):
+    """
+    Result of function(*args), shared with concurrent calls with the same
+    name and arguments. Callers rank routes in the payload in place, so each
+    gets its own shallow copy.
+    """
+    key = (name, json.dumps(args, sort_keys=True, default=str))
+    result = outbound_calls.do(key, lambda: function(*args))
+    return dict(result) if result else None
 
 def get_directions(origin, destination, mode='driving'):
     """Get directions using Google Directions API"""
     if not DIRECTIONS_API_KEY:
         return None
-    
+    return _shared_outbound_call("directions", _fetch_directions, origin, destination, mode)
+
+def _fetch_directions(origin, destination, mode):
+    """Directions API request for get_directions"""
     try:
         url = f"https://maps.googleapis.com/maps/api/directions/json"
         params = {
@@ -425,7 +456,7 @@ def get_directions(origin, destination, mode='driving'):
             'key': DIRECTIONS_API_KEY
         }
         
-        response = requests.get(url, params=params, timeout=15)
+        response = http_client.get("google_maps", url, params=params)
         if response.status_code == 200:
             data = response.json()
             if data['status'] == 'OK':
@@ -439,7 +470,10 @@ def get_routes(origin, destination, travel_mode='DRIVE'):
     """Get routes using Google Routes API (newer API)"""
     if not ROUTES_API_KEY:
         return None
-    
+    return _shared_outbound_call("routes", _fetch_routes, origin, destination, travel_mode)
+
+def _fetch_routes(origin, destination, travel_mode):
+    """Routes API request for get_routes"""
     try:
         url = f"https://routes.googleapis.com/directions/v2:computeRoutes"
         headers = {
@@ -470,7 +504,7 @@ def get_routes(origin, destination, travel_mode='DRIVE'):
             "computeAlternativeRoutes": True
         }
         
-        response = requests.post(url, json=data, headers=headers, timeout=15)
+        response = http_client.post("google_routes", url, json=data, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
@@ -480,14 +514,14 @@ def get_routes(origin, destination, travel_mode='DRIVE'):
 
 def fetch_crime_news(location=None, global_query=None):
     """Fetch recent crime and safety news with improved error handling and caching"""
-    cache_key = f"news_{location or 'global'}_{global_query or 'default'}"
-    cached_result = get_from_cache(cache_key)
-    if cached_result:
-        return cached_result
-    
+    cache_key = f"{location or 'global'}_{global_query or 'default'}"
+    return api_cache.get_or_fetch("news", cache_key, lambda: _fetch_crime_news(location, global_query)) or []
+
+def _fetch_crime_news(location, global_query):
+    """Articles for fetch_crime_news, or None when GNews failed and there is nothing worth caching"""
     if not GNEWS_API_KEY:
         print("GNews API key not configured")
-        return []
+        return None
         
     try:
         if global_query:
@@ -516,6 +550,7 @@ def fetch_crime_news(location=None, global_query=None):
             ]
         
         all_articles = []
+        failed = False
         
         for query in search_queries[:2]:  # Limit to first 2 queries to speed up
             try:
@@ -532,7 +567,7 @@ def fetch_crime_news(location=None, global_query=None):
                 if location and not global_query:
                     params["country"] = "us"
                 
-                response = requests.get(url, params=params, timeout=10)
+                response = http_client.get("gnews", url, params=params)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -552,23 +587,26 @@ def fetch_crime_news(location=None, global_query=None):
                             })
                 elif response.status_code == 429:
                     print("GNews API rate limit exceeded")
+                    failed = True
                     break
                 else:
                     print(f"GNews API error for query '{query}': {response.status_code}")
+                    failed = True
                     
             except requests.RequestException as e:
                 print(f"Network error fetching news for query '{query}': {str(e)}")
+                failed = True
                 continue
         
         # Sort by publication date (most recent first) and limit to 8 total
+        if failed and not all_articles:
+            return None
         all_articles.sort(key=lambda x: x["publishedAt"], reverse=True)
-        result = all_articles[:8]
-        set_cache(cache_key, result)
-        return result
+        return all_articles[:8]
         
     except Exception as e:
         print(f"News API error: {str(e)}")
-        return []
+        return None
 
 def extract_location_from_query(message):
     """Extract location mentions from user queries for global crime questions"""
@@ -677,6 +715,19 @@ def is_crime_or_safety_related(message):
     
     return any(keyword in message_lower for keyword in crime_safety_keywords)
 
+def chat_lookup_result(future, deadline, fallback, name):
+    """
+    Result of a lookup running on chat_lookups, or fallback when it failed or
+    is still running at the deadline (it finishes in the background).
+    """
+    try:
+        return future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeoutError:
+        print(f"Chat lookup {name} missed its deadline")
+    except Exception as e:
+        print(f"Chat lookup {name} failed: {e}")
+    return fallback
+
 @app.route("/api/chat", methods=["POST"])
 def chat():
     try:
@@ -696,9 +747,11 @@ def chat():
 
         # Get session ID
         session_id = get_or_create_session_id()
+        deadline = time.monotonic() + CHAT_DEADLINE_SECONDS
+        lookup_deadline = time.monotonic() + CHAT_LOOKUP_SECONDS
         
-        # Get location name
-        location = reverse_geocode(lat, lng)
+        # Get location name while working out what else the message needs
+        location_future = chat_lookups.submit(reverse_geocode, lat, lng)
         
         # Check for location navigation intent first
         detected_location = detect_location_intent(message)
@@ -706,13 +759,22 @@ def chat():
         
         if detected_location:
             print(f"Detected location intent: {detected_location}")
-            location_data = geocode_place(detected_location)
+            place_future = chat_lookups.submit(geocode_place, detected_location)
+            location_data = chat_lookup_result(place_future, lookup_deadline, None, "geocode_place")
+            location = chat_lookup_result(location_future, lookup_deadline, "unknown location", "reverse_geocode")
             
             if location_data:
                 print(f"Successfully geocoded: {location_data}")
+                # Only spend news quota on places that exist; the fetch runs while the place is snapped
+                news_future = chat_lookups.submit(fetch_crime_news, global_query=detected_location)
+                graph = get_road_graph()
+                if graph is not None:
+                    # Snap a copy; the geocode cache keeps the plain result
+                    location_data = dict(location_data)
+                    snap_to_road(graph, location_data)
                 # Get crime data for the requested location
                 requested_location = location_data['formatted_address']
-                crime_articles = fetch_crime_news(global_query=detected_location)
+                crime_articles = chat_lookup_result(news_future, lookup_deadline, [], "fetch_crime_news")
                 formatted_articles = format_news_for_ai(crime_articles)
                 
                 # Create response with location information
@@ -743,17 +805,21 @@ def chat():
         # Check if query is crime/safety related
         if not is_crime_or_safety_related(message):
             response_text = "I'm sorry, I can only answer questions related to crime and safety in your area. Please ask about local crime statistics, safety concerns, or security issues."
+            location = chat_lookup_result(location_future, lookup_deadline, "unknown location", "reverse_geocode")
             add_to_conversation_history(session_id, message, response_text, location)
             return jsonify({"response": response_text})
         
         # Check for global queries
         is_global, global_location = is_global_crime_query(message)
         
-        # Get crime and safety related news
+        # Get crime and safety related news; only local news has to wait for the location name
         if is_global and global_location:
-            crime_articles = fetch_crime_news(global_query=global_location)
+            news_future = chat_lookups.submit(fetch_crime_news, global_query=global_location)
+            location = chat_lookup_result(location_future, lookup_deadline, "unknown location", "reverse_geocode")
         else:
-            crime_articles = fetch_crime_news(location)
+            location = chat_lookup_result(location_future, lookup_deadline, "unknown location", "reverse_geocode")
+            news_future = chat_lookups.submit(fetch_crime_news, location)
+        crime_articles = chat_lookup_result(news_future, lookup_deadline, [], "fetch_crime_news")
             
         formatted_articles = format_news_for_ai(crime_articles)
 
@@ -824,7 +890,7 @@ If the user asks about their plotted points, routes, or distances, use the plott
             messages=messages,
             max_tokens=200,
             temperature=0.7,
-            timeout=15
+            timeout=min(CHAT_MODEL_TIMEOUT, max(1.0, deadline - time.monotonic()))
         )
 
         reply = response.choices[0].message.content.strip()
@@ -843,97 +909,240 @@ If the user asks about their plotted points, routes, or distances, use the plott
         print(traceback.format_exc())
         return jsonify({"response": "Sorry, I encountered an error. Please try rephrasing your question or try again later."}), 500
 
-# Global variable to store crime data (in production, use a database)
-crime_data = None
-violent_crime_types = {
-    # Common violent crime categories - adjust based on your dataset
-    'homicide', 'murder', 'manslaughter', 'assault', 'aggravated assault', 
-    'simple assault', 'robbery', 'armed robbery', 'rape', 'sexual assault',
-    'kidnapping', 'domestic violence', 'battery', 'shooting', 'stabbing',
-    'carjacking', 'purse snatching', 'strong arm robbery', 'other assault', 'theft'
+# Current crime dataset with its spatial index and tile pyramid (in production, use a database).
+# Replaced as a whole on reload, so read it into a local once per request.
+crime_dataset = None
+# Loading state reported by /api/health: loading, ready or failed
+crime_data_status = {
+    'state': 'loading',
+    'records': 0,
+    'violent_crimes': 0,
+    'source': None,
+    'load_seconds': None,
+    'loaded_at': None,
+    'error': None
 }
+crime_data_lock = threading.Lock()  # one load/reload/append at a time
+crime_data_loader = None
+crime_data_loader_lock = threading.Lock()
+CRIME_DATA_RETRY_AFTER = 5  # seconds clients should wait while data loads
+# After a failed load, requests wait this long before starting another one
+CRIME_DATA_FAILURE_BACKOFF = 6 * CRIME_DATA_RETRY_AFTER
+crime_data_failed_at = None  # time.monotonic() of the last failed load while nothing is loaded
+
+# Current violent crime categories, can be changed through /api/reclassify-crime-data
+violent_crime_types = set(DEFAULT_VIOLENT_CRIME_TYPES)
+
+# Columns copied into crime detail records when present
+CRIME_INFO_COLUMNS = ['description', 'crime_type', 'offense', 'incident_type', 'ucr_general', 'date', 'time']
+
+# Limits for /api/crimes-nearby/batch
+MAX_BATCH_POINTS = 5000
+MAX_BATCH_TOP_K = 50
+MAX_BATCH_RADIUS_FEET = 5280  # one mile; larger radii scan most of the dataset per point
+
+# Heatmap settings for /api/crime-density
+DENSITY_NORMALIZATIONS = ('fixed', 'max', 'log')
+DEFAULT_DENSITY_SATURATION = 10.0  # crimes per cell for full intensity with 'fixed'
+MAX_DENSITY_GRID_SIZE = 500
+
+# Road graph for /api/safe-route, loaded on first use and reopened when the file is replaced
+road_graph = None
+road_graph_file = None  # (inode, mtime, size) of the file road_graph was opened from
+road_graph_exposure = None  # (graph, dataset, per-edge violent crime exposure, its checksum)
+road_edge_time_cells = None  # (graph, dataset, each edge's row in the dataset's time profile)
+road_graph_lock = threading.Lock()
+
+# Landmark tables for A* on the current road graph, rebuilt in the background when stale
+road_landmarks = None  # (graph, LandmarkTables or None, (inode, mtime, size) of the tables file)
+road_landmarks_attempted = None  # time.monotonic() of the last build attempt
+road_landmarks_builder = None
+road_landmarks_lock = threading.Lock()
+# Only one process sharing the tables file builds at a time (see landmarks.build_lock); the
+# others retry this often. Set LANDMARK_BUILD_IN_PROCESS=0 to only use graph_builder's tables.
+LANDMARK_BUILD_RETRY_SECONDS = 10
+LANDMARK_BUILD_IN_PROCESS = os.getenv("LANDMARK_BUILD_IN_PROCESS", "1") != "0"
+
+# Route endpoints further than this from every road node are rejected rather than routed from far away
+MAX_SNAP_METERS = 2000
+
+# Most origins or destinations one /api/route-matrix request may have
+MAX_MATRIX_POINTS = 100
+
+# Alternatives /api/safe-route-alternatives returns by default and at most
+DEFAULT_ALTERNATIVES = 3
+MAX_ALTERNATIVES = 5
+
+# Average speeds in meters per second for duration estimates on the road graph
+TRAVEL_SPEEDS = {'walking': 1.4, 'bicycling': 4.5, 'driving': 11.0}
+
+def _run_crime_data_update(build):
+    """
+    Build a new CrimeDataset with `build(current_dataset)` and swap it in.
+    The swap is a single reference assignment, so readers see either the old
+    or the new dataset and never a half-built one.
+    """
+    global crime_dataset
+    with crime_data_lock:
+        started = time.time()
+        try:
+            dataset = build(crime_dataset)
+        except FileNotFoundError as e:
+            return _record_crime_data_failure(f"{os.path.basename(e.filename or CRIME_DATA_PATH)} not found")
+        except ValueError as e:
+            return _record_crime_data_failure(str(e))
+        except Exception as e:
+            return _record_crime_data_failure(f"Error loading crime data: {e}")
+        
+        crime_dataset = dataset
+        crime_data_status.update(dataset.status())
+        crime_data_status.update({
+            'state': 'ready',
+            'load_seconds': round(time.time() - started, 3),
+            'loaded_at': datetime.now().isoformat(),
+            'error': None
+        })
+        print(f"Loaded {len(dataset)} crime records from {dataset.source} in {crime_data_status['load_seconds']}s")
+        print(f"Violent crimes: {dataset.violent_count}")
+        return True
 
 def load_crime_data():
     """Load and process the Philadelphia crime dataset"""
-    global crime_data
-    try:
-        # Load the CSV file
-        df = pd.read_csv('safepath-maps/philly_crime_data.csv')
-        
-        # Extract lat/lng from columns 17 and 18 (0-indexed: 16 and 17)
-        if len(df.columns) >= 18:
-            # Assuming 0-based indexing
-            lat_col = df.columns[16]  # 17th column
-            lng_col = df.columns[17]  # 18th column
-            
-            # Clean and convert coordinates
-            df['latitude'] = pd.to_numeric(df[lat_col], errors='coerce')
-            df['longitude'] = pd.to_numeric(df[lng_col], errors='coerce')
-            
-            # Remove rows with invalid coordinates
-            df = df.dropna(subset=['latitude', 'longitude'])
-            
-            # Filter for Philadelphia area (rough bounds)
-            df = df[
-                (df['latitude'] >= 39.0) & (df['latitude'] <= 41.0) &
-                (df['longitude'] >= -76.0) & (df['longitude'] <= -74.0)
-            ]
-            
-            # Add violent crime classification
-            df['is_violent_crime'] = df.apply(classify_violent_crime, axis=1)
-            
-            crime_data = df
-            print(f"Loaded {len(crime_data)} crime records")
-            print(f"Violent crimes: {len(crime_data[crime_data['is_violent_crime']])}")
-            
-            return True
-        else:
-            print("CSV doesn't have enough columns")
-            return False
-            
-    except FileNotFoundError:
-        print("philly_crime_data.csv not found")
-        return False
-    except Exception as e:
-        print(f"Error loading crime data: {e}")
-        return False
+    def build(current):
+        # Processed columnar snapshot when current, otherwise parse the CSV (and write a snapshot)
+        df, category_table, source = load_processed_crime_data(CRIME_DATA_PATH, violent_crime_types)
+        return CrimeDataset(df, category_table, source)
+    
+    return _run_crime_data_update(build)
 
-def classify_violent_crime(row):
-    """Classify if a crime is violent based on description/category"""
-    # Check common crime description columns
-    description_cols = ['description', 'crime_type', 'offense', 'incident_type', 'ucr_general']
+def append_crime_data(delta_path=None):
+    """
+    Ingest new incidents without rebuilding the loaded dataset.
+    With delta_path, every row of that CSV is added. Otherwise the main CSV is
+    re-read and only rows newer than the latest loaded incident are added.
+    Returns the number of rows added, or None on failure.
+    """
+    added = {'rows': 0}
     
-    for col in description_cols:
-        if col in row.index and pd.notna(row[col]):
-            description = str(row[col]).lower()
-            if any(violent_type in description for violent_type in violent_crime_types):
-                return True
+    def build(current):
+        if current is None:
+            raise ValueError("Crime data must be loaded before appending")
+        
+        new_rows = parse_crime_csv(delta_path or CRIME_DATA_PATH)
+        if not delta_path:
+            new_rows = current.rows_after_last_timestamp(new_rows)
+        
+        added['rows'] = len(new_rows)
+        if new_rows.empty:
+            return current
+        return current.with_appended_rows(new_rows, violent_crime_types)
     
-    return False
+    if not _run_crime_data_update(build):
+        return None
+    return added['rows']
 
-def haversine_distance(lat1, lon1, lat2, lon2):
+def reclassify_violent_crimes(crime_types=None):
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    Returns distance in feet
+    Re-flag violent crimes in the loaded dataset without reparsing the CSV.
+    New crime types become the current ones under the same lock as the swap,
+    so appends never classify rows against types the dataset no longer uses.
     """
-    # Convert decimal degrees to radians
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
+    if crime_dataset is None:
+        return False
+    
+    def build(current):
+        global violent_crime_types
+        types = violent_crime_types if crime_types is None else set(crime_types)
+        dataset = current.reclassified(types)
+        violent_crime_types = types
+        return dataset
+    
+    return _run_crime_data_update(build)
+
+def _record_crime_data_failure(message):
+    global crime_data_failed_at
+    print(message)
+    crime_data_status['error'] = message
+    # A failed reload keeps serving the data that is already loaded
+    if crime_dataset is None:
+        crime_data_status['state'] = 'failed'
+        crime_data_failed_at = time.monotonic()
+    return False
+
+def start_crime_data_loading():
+    """Load crime data on a background thread unless a load is already running"""
+    global crime_data_loader
+    with crime_data_loader_lock:
+        if crime_data_loader is not None and crime_data_loader.is_alive():
+            return crime_data_loader
+        
+        if crime_dataset is None:
+            crime_data_status['state'] = 'loading'
+        crime_data_loader = threading.Thread(target=load_crime_data, name="crime-data-loader", daemon=True)
+        crime_data_loader.start()
+        return crime_data_loader
+
+def crime_data_unavailable_response():
+    """503 response for crime endpoints while the dataset isn't loaded, or None when it is"""
+    if crime_dataset is not None:
+        return None
+    
+    state = crime_data_status['state']
+    retry_after = CRIME_DATA_RETRY_AFTER
+    if state == 'failed':
+        # Try again in the background once the backoff has passed, so a broken
+        # file isn't reparsed back to back while requests keep coming
+        waited = time.monotonic() - (crime_data_failed_at or 0.0)
+        if crime_data_failed_at is None or waited >= CRIME_DATA_FAILURE_BACKOFF:
+            start_crime_data_loading()
+        else:
+            retry_after = max(CRIME_DATA_RETRY_AFTER, math.ceil(CRIME_DATA_FAILURE_BACKOFF - waited))
+        message = "Crime data failed to load"
+    else:
+        message = "Crime data is still loading"
+    
+    response = jsonify({
+        "error": message,
+        "crime_data": state
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(retry_after)
+    return response
+
+def build_crime_details(df, positions, distances):
+    """Detail records for crime rows, in the format returned by /api/crimes-nearby"""
+    rows = df.iloc[positions]
+    columns = {
+        col: rows[col].to_numpy(dtype=object)
+        for col in CRIME_INFO_COLUMNS if col in rows.columns
+    }
+    latitudes = rows['latitude'].to_numpy()
+    longitudes = rows['longitude'].to_numpy()
     
-    # Radius of earth in feet (approximately)
-    r = 20902231  # feet
+    crime_details = []
+    for i in range(len(rows)):
+        detail = {
+            'distance_feet': round(float(distances[i]), 1),
+            'latitude': float(latitudes[i]),
+            'longitude': float(longitudes[i])
+        }
+        
+        # Add available crime information
+        for col, values in columns.items():
+            if pd.notna(values[i]):
+                detail[col] = str(values[i])
+        
+        crime_details.append(detail)
     
-    return c * r
+    return crime_details
 
-def get_crimes_within_radius(lat, lng, radius_feet=500):
-    """Get violent crimes within specified radius of a point"""
-    if crime_data is None or crime_data.empty:
+def get_crimes_within_radius(lat, lng, radius_feet=500, at=None, recency=False):
+    """
+    Get violent crimes within specified radius of a point.
+    With a target time and/or recency, also a count weighted by time of week.
+    """
+    dataset = crime_dataset
+    if dataset is None or dataset.df.empty:
         return {
             'total_crimes': 0,
             'violent_crimes': 0,
@@ -942,44 +1151,31 @@ def get_crimes_within_radius(lat, lng, radius_feet=500):
         }
     
     try:
-        # Calculate distances for all crime points
-        distances = crime_data.apply(
-            lambda row: haversine_distance(lat, lng, row['latitude'], row['longitude']), 
-            axis=1
-        )
-        
-        # Filter crimes within radius
-        nearby_crimes = crime_data[distances <= radius_feet].copy()
-        nearby_crimes['distance_feet'] = distances[distances <= radius_feet]
+        # Look up candidate cells in the spatial index, exact distances only for those
+        positions, distances = dataset.index.query_radius(float(lat), float(lng), float(radius_feet))
         
         # Filter for violent crimes
-        violent_crimes = nearby_crimes[nearby_crimes['is_violent_crime']]
-        
-        # Prepare detailed crime information
-        crime_details = []
-        for _, crime in violent_crimes.head(10).iterrows():  # Limit to 10 most recent
-            detail = {
-                'distance_feet': round(crime['distance_feet'], 1),
-                'latitude': crime['latitude'],
-                'longitude': crime['longitude']
-            }
-            
-            # Add available crime information
-            info_cols = ['description', 'crime_type', 'offense', 'incident_type', 'ucr_general', 'date', 'time']
-            for col in info_cols:
-                if col in crime.index and pd.notna(crime[col]):
-                    detail[col] = str(crime[col])
-            
-            crime_details.append(detail)
+        violent = dataset.is_violent[positions]
+        violent_positions = positions[violent]
+        violent_distances = distances[violent]
         
-        return {
-            'total_crimes': len(nearby_crimes),
-            'violent_crimes': len(violent_crimes),
+        # Prepare detailed crime information, limited to the first 10
+        crime_details = build_crime_details(dataset.df, violent_positions[:10], violent_distances[:10])
+        
+        result = {
+            'total_crimes': len(positions),
+            'violent_crimes': len(violent_positions),
             'crime_details': crime_details,
             'radius_feet': radius_feet,
             'search_location': {'lat': lat, 'lng': lng}
         }
         
+        weight = dataset.time_weight(at, recency)
+        if weight is not None:
+            result['weighted_violent_crimes'] = round(float(weight(violent_positions).sum()), 2)
+            result['time_weighting'] = crime_time_summary(at, recency)
+        return result
+        
     except Exception as e:
         print(f"Error getting crimes within radius: {e}")
         return {
@@ -989,9 +1185,81 @@ def get_crimes_within_radius(lat, lng, radius_feet=500):
             'error': str(e)
         }
 
-def get_crime_density_map(bounds, grid_size=20):
-    """Get crime density data for map visualization"""
-    if crime_data is None:
+def get_crimes_within_radius_batch(points, top_k=5, at=None, recency=False):
+    """
+    Crime counts for many (lat, lng, radius_feet) points, one spatial index query per point,
+    with the crime details for all of them built in a single pass at the end.
+    Each result lists the top_k nearest violent crimes.
+    """
+    dataset = crime_dataset
+    if dataset is None:
+        return {'error': 'Crime data not loaded'}
+    
+    weight = dataset.time_weight(at, recency)
+    results = []
+    detail_positions = []
+    detail_distances = []
+    for lat, lng, radius_feet in points:
+        positions, distances = dataset.index.query_radius(lat, lng, radius_feet)
+        
+        violent = dataset.is_violent[positions]
+        violent_positions = positions[violent]
+        violent_distances = distances[violent]
+        
+        # Nearest first
+        nearest = np.argsort(violent_distances, kind='stable')[:top_k]
+        detail_positions.append(violent_positions[nearest])
+        detail_distances.append(violent_distances[nearest])
+        
+        results.append({
+            'lat': lat,
+            'lng': lng,
+            'radius_feet': radius_feet,
+            'total_crimes': len(positions),
+            'violent_crimes': len(violent_positions)
+        })
+        if weight is not None:
+            results[-1]['weighted_violent_crimes'] = round(float(weight(violent_positions).sum()), 2)
+    
+    # Fetch every point's detail rows from the DataFrame at once, then split them back up
+    crime_details = build_crime_details(
+        dataset.df, np.concatenate(detail_positions), np.concatenate(detail_distances)
+    )
+    offset = 0
+    for result, positions in zip(results, detail_positions):
+        result['crime_details'] = crime_details[offset:offset + len(positions)]
+        offset += len(positions)
+    
+    if weight is not None:
+        return {'results': results, 'time_weighting': crime_time_summary(at, recency)}
+    return {'results': results}
+
+def normalize_density_counts(counts, normalization='fixed', saturation=DEFAULT_DENSITY_SATURATION):
+    """Scale per-cell crime counts to 0-1 heatmap intensities"""
+    counts = np.asarray(counts, dtype=np.float64)
+    if len(counts) == 0:
+        return counts
+    
+    if normalization == 'fixed':
+        # A cell saturates once it reaches `saturation` crimes
+        return np.minimum(counts / float(saturation), 1.0)
+    if normalization == 'max':
+        # Relative to the busiest cell in view
+        return counts / counts.max()
+    if normalization == 'log':
+        # Log scale keeps a few extreme hotspots from washing out the rest
+        return np.log1p(counts) / np.log1p(counts.max())
+    
+    raise ValueError(f"Unknown normalization '{normalization}'")
+
+def get_crime_density_map(bounds, grid_size=20, normalization='fixed', saturation=DEFAULT_DENSITY_SATURATION,
+                          at=None, recency=False):
+    """
+    Get crime density data for map visualization.
+    With a target time and/or recency, cell counts are weighted by time of week.
+    """
+    dataset = crime_dataset
+    if dataset is None:
         return {'error': 'Crime data not loaded'}
     
     try:
@@ -1001,48 +1269,346 @@ def get_crime_density_map(bounds, grid_size=20):
         east = bounds['east']
         west = bounds['west']
         
-        # Filter crimes within bounds
-        bounded_crimes = crime_data[
-            (crime_data['latitude'] >= south) & (crime_data['latitude'] <= north) &
-            (crime_data['longitude'] >= west) & (crime_data['longitude'] <= east) &
-            (crime_data['is_violent_crime'] == True)
-        ]
+        # Candidate rows from the spatial index, then the exact bounds and violent filter
+        candidates = dataset.index.candidates_in_bounds(south, north, west, east)
+        lats = dataset.index.latitudes[candidates]
+        lngs = dataset.index.longitudes[candidates]
+        is_violent = dataset.is_violent[candidates]
         
-        if bounded_crimes.empty:
+        in_bounds = (
+            (lats >= south) & (lats <= north) &
+            (lngs >= west) & (lngs <= east) &
+            is_violent
+        )
+        lats = lats[in_bounds]
+        lngs = lngs[in_bounds]
+        weight = dataset.time_weight(at, recency)
+        
+        if len(lats) == 0:
             return {'density_points': []}
         
         # Create grid
         lat_step = (north - south) / grid_size
         lng_step = (east - west) / grid_size
         
-        density_points = []
+        # Assign every crime to its grid cell in one pass and count with a single bincount.
+        # Crimes exactly on the north/east edge fall outside the last cell, as before.
+        rows = np.floor((lats - south) / lat_step).astype(np.int64)
+        cols = np.floor((lngs - west) / lng_step).astype(np.int64)
+        in_grid = (rows < grid_size) & (cols < grid_size)
+        counts = np.bincount(
+            rows[in_grid] * grid_size + cols[in_grid],
+            weights=weight(candidates[in_bounds][in_grid]) if weight is not None else None,
+            minlength=grid_size * grid_size
+        )
+        if weight is not None:
+            counts = np.round(counts, 2)
         
-        for i in range(grid_size):
-            for j in range(grid_size):
-                grid_lat = south + (i + 0.5) * lat_step
-                grid_lng = west + (j + 0.5) * lng_step
-                
-                # Count crimes within this grid cell
-                cell_crimes = bounded_crimes[
-                    (bounded_crimes['latitude'] >= south + i * lat_step) &
-                    (bounded_crimes['latitude'] < south + (i + 1) * lat_step) &
-                    (bounded_crimes['longitude'] >= west + j * lng_step) &
-                    (bounded_crimes['longitude'] < west + (j + 1) * lng_step)
-                ]
-                
-                if len(cell_crimes) > 0:
-                    density_points.append({
-                        'lat': grid_lat,
-                        'lng': grid_lng,
-                        'count': len(cell_crimes),
-                        'intensity': min(len(cell_crimes) / 10.0, 1.0)  # Normalize to 0-1
-                    })
+        cells = np.flatnonzero(counts)
+        cell_counts = counts[cells]
+        intensities = normalize_density_counts(cell_counts, normalization, saturation)
+        
+        density_points = []
+        for cell, count, intensity in zip(cells.tolist(), cell_counts.tolist(), intensities.tolist()):
+            i, j = divmod(cell, grid_size)
+            density_points.append({
+                'lat': south + (i + 0.5) * lat_step,
+                'lng': west + (j + 0.5) * lng_step,
+                'count': count,
+                'intensity': intensity
+            })
         
+        if weight is not None:
+            return {'density_points': density_points, 'time_weighting': crime_time_summary(at, recency)}
         return {'density_points': density_points}
         
     except Exception as e:
         return {'error': str(e)}
 
+def parse_safety_weight(data):
+    """safety_weight from a request body, raising ValueError when it isn't a number from 0 to 1"""
+    try:
+        safety_weight = float(data.get("safety_weight", DEFAULT_SAFETY_WEIGHT))
+    except (TypeError, ValueError):
+        raise ValueError("safety_weight must be a number")
+    if not 0 <= safety_weight <= 1:
+        raise ValueError("safety_weight must be between 0 and 1")
+    return safety_weight
+
+def parse_route_safety_options(data):
+    """safety_weight and corridor_feet from a request body, raising ValueError when out of range"""
+    safety_weight = parse_safety_weight(data)
+    try:
+        corridor_feet = float(data.get("corridor_feet", DEFAULT_CORRIDOR_FEET))
+    except (TypeError, ValueError):
+        raise ValueError("corridor_feet must be a number")
+    
+    if not 0 < corridor_feet <= MAX_CORRIDOR_FEET:
+        raise ValueError(f"corridor_feet must be between 0 and {MAX_CORRIDOR_FEET}")
+    
+    return safety_weight, corridor_feet
+
+def parse_crime_time_options(data):
+    """
+    (at, recency) for weighting crimes by time of week from a request body:
+    "time" is an ISO 8601 date and time or "now", "recency" discounts old incidents.
+    Raises ValueError when invalid.
+    """
+    at = parse_crime_time(data["time"]) if data.get("time") is not None else None
+    recency = data.get("recency", False)
+    if not isinstance(recency, bool):
+        raise ValueError("recency must be true or false")
+    return at, recency
+
+def crime_time_summary(at, recency):
+    """How crimes were weighted, for responses"""
+    return {'time': at.isoformat() if at is not None else None, 'recency': recency}
+
+def parse_coordinates(point):
+    """
+    (lat, lng) of a {"lat", "lng"} point. Raises ValueError unless both are
+    finite and in range, and TypeError or KeyError when they are missing.
+    """
+    lat, lng = float(point["lat"]), float(point["lng"])
+    if not (math.isfinite(lat) and math.isfinite(lng)) or abs(lat) > 90 or abs(lng) > 180:
+        raise ValueError("Coordinates out of range")
+    return lat, lng
+
+def parse_route_endpoints(data):
+    """((lat, lng), (lat, lng)) of origin and destination in a request body, raising ValueError when missing"""
+    try:
+        return parse_coordinates(data.get("origin")), parse_coordinates(data.get("destination"))
+    except (TypeError, KeyError, ValueError):
+        raise ValueError("Origin and destination need valid lat and lng")
+
+def snap_route_endpoints(graph, data, endpoints):
+    """
+    ((node, meters), (node, meters)) of the road nodes nearest a request's
+    origin and destination, given their coordinates from parse_route_endpoints;
+    raises ValueError when either is more than MAX_SNAP_METERS from the road graph.
+    """
+    origin, destination = endpoints
+    snaps = snap_to_road(graph, data["origin"], origin), snap_to_road(graph, data["destination"], destination)
+    if max(meters for _, meters in snaps) > MAX_SNAP_METERS:
+        raise ValueError(f"Origin and destination must be within {MAX_SNAP_METERS} m of a road")
+    return snaps
+
+def snap_to_road(graph, point, coordinates=None):
+    """
+    (node, meters) of the road node nearest a {"lat", "lng"} point, or to
+    its already parsed (lat, lng) coordinates.
+    The node is stored on the point under "road_snap" along with the
+    coordinates and graph it was found for, so stored points and echoed-back
+    locations skip the lookup until they move or a different graph is deployed.
+    A stored node is only a hint: its distance is always measured here, and
+    one further than MAX_SNAP_METERS is looked up again.
+    """
+    lat, lng = coordinates if coordinates is not None else (float(point["lat"]), float(point["lng"]))
+    snap = point.get("road_snap")
+    if isinstance(snap, dict) and graph.checksum is not None and snap.get("graph") == graph.checksum:
+        try:
+            node = int(snap["node"])
+            same_point = float(snap["lat"]) == lat and float(snap["lng"]) == lng
+            if same_point and 0 <= node < graph.node_count:
+                meters = graph.node_distance(node, lat, lng)
+                if meters <= MAX_SNAP_METERS:
+                    point["road_snap"] = {"node": node, "meters": round(meters, 1), "lat": lat, "lng": lng,
+                                          "graph": graph.checksum}
+                    return node, meters
+        except (TypeError, KeyError, ValueError):
+            pass
+    
+    node, meters = graph.nearest_node(lat, lng)
+    point["road_snap"] = {"node": node, "meters": round(meters, 1), "lat": lat, "lng": lng, "graph": graph.checksum}
+    return node, meters
+
+def get_road_graph():
+    """
+    Road graph for in-process routing, or None when no graph file is deployed.
+    Deploys replace the file with a rename, so a new inode means a new graph;
+    requests already holding the old one keep using its mapping.
+    """
+    global road_graph, road_graph_file
+    try:
+        stat = os.stat(ROAD_GRAPH_PATH)
+    except FileNotFoundError:
+        return road_graph
+    
+    file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if file_id == road_graph_file:
+        return road_graph
+    
+    with road_graph_lock:
+        if file_id != road_graph_file:
+            # Remember the file even if it fails, so a bad deploy isn't re-verified on every request
+            road_graph_file = file_id
+            try:
+                road_graph = RoadGraph.load(ROAD_GRAPH_PATH)
+                road_graph.node_index()
+                print(f"Loaded road graph with {road_graph.node_count} nodes and {road_graph.edge_count} edges")
+            except ValueError as e:
+                print(f"Error loading road graph: {e}")
+    return road_graph
+
+def get_road_crime_exposure(graph, dataset):
+    """
+    Violent crime exposure of every road edge for the current crime data, and its checksum.
+    Uses the weights stored in the graph file when they were built from the
+    same data, otherwise computes them; recomputed when the crime data changes.
+    """
+    global road_graph_exposure
+    cached = road_graph_exposure
+    if cached is not None and cached[0] is graph and cached[1] is dataset:
+        return cached[2], cached[3]
+    
+    with road_graph_lock:
+        cached = road_graph_exposure
+        if cached is not None and cached[0] is graph and cached[1] is dataset:
+            return cached[2], cached[3]
+        if graph.crime_exposure is not None and graph.crime_data == dataset.fingerprint():
+            exposure = graph.crime_exposure
+        else:
+            exposure = graph.edge_crime_exposure(
+                dataset.index.latitudes[dataset.is_violent], dataset.index.longitudes[dataset.is_violent]
+            )
+        road_graph_exposure = (graph, dataset, exposure, exposure_checksum(exposure))
+        return road_graph_exposure[2], road_graph_exposure[3]
+
+def time_weighted_road_exposure(graph, dataset, exposure, at=None, recency=False):
+    """
+    Edge crime exposure weighted by time of week at each edge's midpoint.
+    Weighted exposure can be lower than the stored weights, so crime-weighted
+    landmark bounds don't hold for it; callers keep only the length tables.
+    """
+    global road_edge_time_cells
+    if at is None and not recency:
+        return exposure
+    
+    cached = road_edge_time_cells
+    if cached is None or cached[0] is not graph or cached[1] is not dataset:
+        middle_lats = (graph.node_lats[graph.sources] + graph.node_lats[graph.targets]) / 2.0
+        middle_lngs = (graph.node_lngs[graph.sources] + graph.node_lngs[graph.targets]) / 2.0
+        cached = road_edge_time_cells = (graph, dataset, dataset.time_profile.cell_rows(middle_lats, middle_lngs))
+    
+    factors = dataset.time_profile.cell_factors(at, recency)
+    return (exposure * factors[cached[2]]).astype(np.float32)
+
+def _landmarks_file_id(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def _load_road_landmarks(graph, path):
+    """Landmark tables from a file when they were built for this graph, else None"""
+    try:
+        tables = LandmarkTables.load(path)
+    except (OSError, ValueError) as e:
+        print(f"Error loading landmark tables: {e}")
+        return None
+    return tables if tables.graph_checksum == graph.checksum else None
+
+def get_road_landmarks(graph, exposure, checksum):
+    """
+    Landmark tables for A* on this graph with these crime weights, or None.
+    Tables are read from next to the graph file when they match it, and read
+    again whenever another process replaces the file. Missing or stale tables
+    are rebuilt in the background; meanwhile queries fall back to the
+    straight-line bound, or to the length tables alone.
+    """
+    global road_landmarks
+    path = landmarks_path(ROAD_GRAPH_PATH)
+    file_id = _landmarks_file_id(path)
+    cached = road_landmarks
+    if cached is None or cached[0] is not graph or cached[2] != file_id:
+        tables = _load_road_landmarks(graph, path) if file_id is not None else None
+        cached = road_landmarks = (graph, tables, file_id)
+    
+    tables = cached[1]
+    if tables is None or tables.exposure_checksum != checksum:
+        start_road_landmark_build(graph, exposure, checksum, tables)
+    return tables.usable_for(checksum) if tables is not None else None
+
+def start_road_landmark_build(graph, exposure, checksum, tables):
+    """
+    Compute landmark tables on a background thread, unless a build is already
+    running here, was tried in the last LANDMARK_BUILD_RETRY_SECONDS, or is
+    running in another worker. With LANDMARK_BUILD_IN_PROCESS off, tables
+    only come from graph_builder.
+    """
+    global road_landmarks_builder, road_landmarks_attempted
+    if not LANDMARK_BUILD_IN_PROCESS:
+        return
+    with road_landmarks_lock:
+        if road_landmarks_builder is not None and road_landmarks_builder.is_alive():
+            return
+        recently = road_landmarks_attempted is not None and (
+            time.monotonic() - road_landmarks_attempted < LANDMARK_BUILD_RETRY_SECONDS
+        )
+        if recently:
+            return
+        road_landmarks_attempted = time.monotonic()
+        
+        def build():
+            global road_landmarks
+            path = landmarks_path(ROAD_GRAPH_PATH)
+            try:
+                with build_lock(path) as acquired:
+                    if not acquired:
+                        # Another worker is building; its file is picked up once it lands
+                        return
+                    
+                    # Another worker may have written matching tables just before this one got the lock
+                    current = _load_road_landmarks(graph, path) if os.path.exists(path) else None
+                    if current is not None and current.exposure_checksum == checksum:
+                        return
+                    base = current if current is not None else tables
+                    
+                    started = time.time()
+                    if base is None:
+                        built = LandmarkTables.build(graph, exposure)
+                    else:
+                        # Same graph, new crime weights: only the exposure tables change
+                        built = base.with_crime_tables(graph, exposure)
+                    if road_graph is not graph:
+                        return
+                    built.save(path)
+                    road_landmarks = (graph, built, _landmarks_file_id(path))
+                    print(f"Built {len(built.nodes)} routing landmarks in {time.time() - started:.1f}s")
+            except Exception as e:
+                print(f"Error building routing landmarks: {e}")
+        
+        road_landmarks_builder = threading.Thread(target=build, name="road-landmark-builder", daemon=True)
+        road_landmarks_builder.start()
+
+def rank_route_alternatives(payload, safety_weight=DEFAULT_SAFETY_WEIGHT,
+                            corridor_feet=DEFAULT_CORRIDOR_FEET, routes_api=False, at=None, recency=False):
+    """
+    Score each alternative in a Google directions payload by violent crime
+    exposure along it and sort them by blended time/safety cost.
+    Routes are returned unranked while crime data isn't loaded.
+    """
+    dataset = crime_dataset
+    if dataset is None:
+        payload['safety_ranking'] = {'ranked': False, 'reason': 'Crime data not loaded'}
+        return payload
+    
+    started = time.perf_counter()
+    rank = rank_routes_api_routes if routes_api else rank_directions_routes
+    crime_weight = dataset.time_weight(at, recency)
+    rank(payload, dataset.index, dataset.is_violent, safety_weight, corridor_feet, crime_weight)
+    
+    payload['safety_ranking'] = {
+        'ranked': True,
+        'safety_weight': safety_weight,
+        'corridor_feet': corridor_feet,
+        'scoring_ms': round((time.perf_counter() - started) * 1000, 2)
+    }
+    if crime_weight is not None:
+        payload['safety_ranking']['time_weighting'] = crime_time_summary(at, recency)
+    return payload
+
 # API endpoint for crime data within radius
 @app.route("/api/crimes-nearby", methods=["POST"])
 def crimes_nearby():
@@ -1059,13 +1625,18 @@ def crimes_nearby():
         if lat is None or lng is None:
             return jsonify({"error": "Latitude and longitude are required"}), 400
         
-        # Load crime data if not already loaded
-        if crime_data is None:
-            if not load_crime_data():
-                return jsonify({"error": "Failed to load crime data"}), 500
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
         
         # Get crimes within radius
-        result = get_crimes_within_radius(lat, lng, radius)
+        result = get_crimes_within_radius(lat, lng, radius, at, recency)
         
         return jsonify(result)
         
@@ -1073,6 +1644,67 @@ def crimes_nearby():
         print(f"Error in crimes_nearby: {e}")
         return jsonify({"error": "Failed to get nearby crimes"}), 500
 
+# API endpoint for crime data around many points at once
+@app.route("/api/crimes-nearby/batch", methods=["POST"])
+def crimes_nearby_batch():
+    """
+    Get violent crime counts around many points in one request.
+    Points are {"lat", "lng", "radius"} objects or [lat, lng, radius] lists;
+    radius defaults to the request's "radius" (500 feet).
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        raw_points = data.get("points")
+        default_radius = data.get("radius", 500)
+        top_k = data.get("top_k", 5)
+        
+        if not isinstance(raw_points, list) or not raw_points:
+            return jsonify({"error": "points must be a non-empty list"}), 400
+        
+        if len(raw_points) > MAX_BATCH_POINTS:
+            return jsonify({"error": f"At most {MAX_BATCH_POINTS} points per request"}), 400
+        
+        try:
+            top_k = min(max(int(top_k), 0), MAX_BATCH_TOP_K)
+            points = []
+            for point in raw_points:
+                if isinstance(point, dict):
+                    lat, lng, radius = point["lat"], point["lng"], point.get("radius", default_radius)
+                else:
+                    lat, lng, radius = (list(point) + [default_radius])[:3]
+                points.append((float(lat), float(lng), float(radius)))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"error": "Each point needs numeric lat, lng and optional radius"}), 400
+        
+        for lat, lng, radius in points:
+            if not (math.isfinite(lat) and math.isfinite(lng)) or abs(lat) > 90 or abs(lng) > 180:
+                return jsonify({"error": "Each point needs a valid lat and lng"}), 400
+            if not 0 < radius <= MAX_BATCH_RADIUS_FEET:
+                return jsonify({"error": f"radius must be between 0 and {MAX_BATCH_RADIUS_FEET} feet"}), 400
+        
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        result = get_crimes_within_radius_batch(points, top_k, at, recency)
+        if 'error' in result:
+            return jsonify(result), 500
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        print(f"Error in crimes_nearby_batch: {e}")
+        return jsonify({"error": "Failed to get nearby crimes"}), 500
+
 # API endpoint for crime density heatmap
 @app.route("/api/crime-density", methods=["POST"])
 def crime_density():
@@ -1084,17 +1716,39 @@ def crime_density():
             
         bounds = data.get("bounds")
         grid_size = data.get("grid_size", 20)
+        normalization = data.get("normalization", "fixed")
+        saturation = data.get("saturation", DEFAULT_DENSITY_SATURATION)
         
         if not bounds:
             return jsonify({"error": "Map bounds are required"}), 400
         
-        # Load crime data if not already loaded
-        if crime_data is None:
-            if not load_crime_data():
-                return jsonify({"error": "Failed to load crime data"}), 500
+        try:
+            grid_size = int(grid_size)
+            saturation = float(saturation)
+        except (TypeError, ValueError):
+            return jsonify({"error": "grid_size and saturation must be numbers"}), 400
+        
+        if grid_size < 1 or grid_size > MAX_DENSITY_GRID_SIZE:
+            return jsonify({"error": f"grid_size must be between 1 and {MAX_DENSITY_GRID_SIZE}"}), 400
+        
+        if normalization not in DENSITY_NORMALIZATIONS:
+            return jsonify({"error": f"normalization must be one of {', '.join(DENSITY_NORMALIZATIONS)}"}), 400
+        
+        if saturation <= 0:
+            return jsonify({"error": "saturation must be positive"}), 400
+        
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
         
         # Get density data
-        result = get_crime_density_map(bounds, grid_size)
+        result = get_crime_density_map(bounds, grid_size, normalization, saturation, at, recency)
         
         return jsonify(result)
         
@@ -1102,30 +1756,159 @@ def crime_density():
         print(f"Error in crime_density: {e}")
         return jsonify({"error": "Failed to get crime density"}), 500
 
+# Cache headers for crime tiles: versioned URLs never change, unversioned ones only briefly
+TILE_CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+TILE_CACHE_CONTROL_DEFAULT = "public, max-age=300"
+
+@app.route("/api/crime-tiles/meta", methods=["GET"])
+def crime_tiles_meta():
+    """Describe the crime tile pyramid so clients can build versioned tile URLs"""
+    try:
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        tiles = crime_dataset.tiles
+        response = jsonify({
+            "version": tiles.version,
+            "min_zoom": MIN_TILE_ZOOM,
+            "max_zoom": MAX_TILE_ZOOM,
+            "bins": TILE_BINS,
+            "url_template": f"/api/crime-tiles/{{z}}/{{x}}/{{y}}?v={tiles.version}"
+        })
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+        
+    except Exception as e:
+        print(f"Error in crime_tiles_meta: {e}")
+        return jsonify({"error": "Failed to get crime tile metadata"}), 500
+
+# API endpoint for precomputed crime density tiles
+@app.route("/api/crime-tiles/<int:z>/<int:x>/<int:y>", methods=["GET"])
+def crime_tile(z, x, y):
+    """Get one XYZ tile of the violent crime density pyramid"""
+    try:
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        tiles = crime_dataset.tiles
+        etag = f"{tiles.version}-{z}-{x}-{y}"
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            try:
+                result = tiles.tile(z, x, y)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            response = jsonify(result)
+        
+        response.set_etag(etag)
+        if request.args.get("v") == tiles.version:
+            response.headers["Cache-Control"] = TILE_CACHE_CONTROL_IMMUTABLE
+        else:
+            response.headers["Cache-Control"] = TILE_CACHE_CONTROL_DEFAULT
+        return response
+        
+    except Exception as e:
+        print(f"Error in crime_tile: {e}")
+        return jsonify({"error": "Failed to get crime tile"}), 500
+
 # API endpoint to reload crime data
 @app.route("/api/reload-crime-data", methods=["POST"])
 def reload_crime_data():
-    """Reload the crime dataset"""
+    """
+    Reload the crime dataset.
+    mode "full" (default) rebuilds from the CSV. mode "append" ingests only new
+    incidents: rows of `delta_file` (a CSV next to the main dataset) if given,
+    otherwise rows of the main CSV newer than the latest loaded incident.
+    """
     try:
-        success = load_crime_data()
+        data = request.get_json(silent=True) or {}
+        mode = data.get("mode", "full")
+        
+        if mode == "full":
+            success = load_crime_data()
+            rows_added = None
+        elif mode == "append":
+            delta_path = None
+            delta_file = data.get("delta_file")
+            if delta_file:
+                # Only plain file names in the dataset directory; never arbitrary paths
+                if not isinstance(delta_file, str) or os.path.basename(delta_file) != delta_file or not delta_file.endswith(".csv"):
+                    return jsonify({"error": "delta_file must be a .csv file name in the crime data directory"}), 400
+                delta_path = os.path.join(os.path.dirname(CRIME_DATA_PATH), delta_file)
+            
+            unavailable = crime_data_unavailable_response()
+            if unavailable:
+                return unavailable
+            
+            rows_added = append_crime_data(delta_path)
+            success = rows_added is not None
+        else:
+            return jsonify({"error": "mode must be 'full' or 'append'"}), 400
+        
         if success:
-            return jsonify({
+            dataset = crime_dataset
+            result = {
                 "success": True, 
                 "message": "Crime data reloaded successfully",
-                "total_records": len(crime_data),
-                "violent_crimes": len(crime_data[crime_data['is_violent_crime']])
-            })
+                "mode": mode,
+                "total_records": len(dataset),
+                "violent_crimes": dataset.violent_count,
+                "tile_version": dataset.tiles.version
+            }
+            if rows_added is not None:
+                result["rows_added"] = rows_added
+            return jsonify(result)
         else:
-            return jsonify({"error": "Failed to reload crime data"}), 500
+            return jsonify({"error": "Failed to reload crime data", "details": crime_data_status['error']}), 500
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-# Initialize crime data when the app starts
+# API endpoint to re-flag violent crimes with a new list of crime types
+@app.route("/api/reclassify-crime-data", methods=["POST"])
+def reclassify_crime_data():
+    """Reclassify the loaded crime data against an updated set of violent crime types"""
+    try:
+        data = request.get_json() or {}
+        crime_types = data.get("violent_crime_types")
+        
+        if not isinstance(crime_types, list) or not all(isinstance(t, str) for t in crime_types):
+            return jsonify({"error": "violent_crime_types must be a list of strings"}), 400
+        
+        # Crime data loads in the background; answer right away instead of waiting for it
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        new_types = {t.strip().lower() for t in crime_types if t.strip()}
+        if not reclassify_violent_crimes(new_types):
+            return jsonify({"error": "Failed to reclassify crime data"}), 500
+        
+        dataset = crime_dataset
+        return jsonify({
+            "success": True,
+            "violent_crime_types": sorted(new_types),
+            "total_records": len(dataset),
+            "violent_crimes": dataset.violent_count,
+            "violent_categories": {
+                col: sorted(str(value) for value in table.index[table.to_numpy()])
+                for col, table in dataset.category_table.items()
+            }
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Start loading crime data in the background when the app starts
 try:
-    load_crime_data()
+    start_crime_data_loading()
 except Exception as e:
-    print(f"Failed to load crime data on startup: {e}")
+    print(f"Failed to start loading crime data: {e}")
 
 @app.route("/api/plot-point", methods=["POST"])
 def plot_point():
@@ -1155,6 +1938,9 @@ def plot_point():
         }
         
         point = add_plotted_point(session_id, point_data)
+        graph = get_road_graph()
+        if graph is not None:
+            snap_to_road(graph, point)
         
         # Calculate new total distance
         points = get_user_plotted_points(session_id)
@@ -1305,19 +2091,36 @@ def place_details():
 
 @app.route("/api/directions", methods=["POST"])
 def directions():
-    """Get directions using Google Directions API"""
+    """
+    Get directions using Google Directions API, with the alternatives ranked
+    by a blend of travel time and violent crime exposure.
+    Optional: safety_weight (0 = fastest, 1 = safest), corridor_feet, time and
+    recency to weight crimes by time of week, and "api": "routes" to use the
+    Routes API instead (travel_mode DRIVE/WALK/...).
+    """
     try:
         data = request.get_json()
         origin = data.get("origin")
         destination = data.get("destination")
         mode = data.get("mode", "driving")
+        routes_api = data.get("api") == "routes"
         
         if not origin or not destination:
             return jsonify({"error": "Origin and destination are required"}), 400
         
-        directions_result = get_directions(origin, destination, mode)
+        try:
+            safety_weight, corridor_feet = parse_route_safety_options(data)
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if routes_api:
+            directions_result = get_routes(origin, destination, data.get("travel_mode", "DRIVE"))
+        else:
+            directions_result = get_directions(origin, destination, mode)
         if directions_result:
-            return jsonify(directions_result)
+            return jsonify(rank_route_alternatives(directions_result, safety_weight, corridor_feet, routes_api,
+                                                   at, recency))
         else:
             return jsonify({"error": "Directions not found"}), 404
             
@@ -1325,6 +2128,391 @@ def directions():
         print(f"Directions error: {str(e)}")
         return jsonify({"error": "Failed to get directions"}), 500
 
+@app.route("/api/route-safety", methods=["POST"])
+def route_safety():
+    """
+    Score route alternatives the client already has, e.g. from the Maps JavaScript API.
+    Body: {"routes": [{"polyline": "<encoded>", "duration_seconds": 600}, ...]},
+    optionally with time and recency to weight crimes by time of week.
+    Returns their safety summaries sorted by blended cost; original_index maps back.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        routes = data.get("routes")
+        if not isinstance(routes, list) or not routes:
+            return jsonify({"error": "routes must be a non-empty list"}), 400
+        if len(routes) > MAX_SCORED_ROUTES:
+            return jsonify({"error": f"At most {MAX_SCORED_ROUTES} routes can be scored at once"}), 400
+        if not all(isinstance(route, dict) and is_encoded_polyline(route.get("polyline")) for route in routes):
+            return jsonify({"error": "Each route needs an encoded polyline"}), 400
+        
+        try:
+            safety_weight, corridor_feet = parse_route_safety_options(data)
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        dataset = crime_dataset
+        try:
+            ranked = rank_polylines(routes, dataset.index, dataset.is_violent, safety_weight, corridor_feet,
+                                    dataset.time_weight(at, recency))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify({
+            "routes": ranked,
+            "safety_weight": safety_weight,
+            "corridor_feet": corridor_feet,
+            "time_weighting": crime_time_summary(at, recency)
+        })
+        
+    except Exception as e:
+        print(f"Route safety error: {str(e)}")
+        return jsonify({"error": "Failed to score routes"}), 500
+
+@app.route("/api/safe-route", methods=["POST"])
+def safe_route():
+    """
+    Route between two points over the local road graph, trading distance
+    against violent crime exposure.
+    Body: {"origin": {"lat", "lng"}, "destination": {"lat", "lng"},
+           "safety_weight": 0-1, "algorithm": "astar" | "dijkstra",
+           "bidirectional": search from both ends (default for dijkstra only),
+           "time", "recency": weight crimes by time of week}
+    Points carrying a "road_snap" from a plotted point or chat location skip the node lookup.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        algorithm = data.get("algorithm", "astar")
+        bidirectional = data.get("bidirectional")
+        
+        try:
+            endpoints = parse_route_endpoints(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        try:
+            safety_weight = parse_safety_weight(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if algorithm not in ROUTING_ALGORITHMS:
+            return jsonify({"error": f"algorithm must be one of {', '.join(ROUTING_ALGORITHMS)}"}), 400
+        if bidirectional is not None and not isinstance(bidirectional, bool):
+            return jsonify({"error": "bidirectional must be true or false"}), 400
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        graph = get_road_graph()
+        if graph is None:
+            return jsonify({"error": "Road graph not available"}), 503
+        
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        started = time.perf_counter()
+        exposure, checksum = get_road_crime_exposure(graph, crime_dataset)
+        landmarks = get_road_landmarks(graph, exposure, checksum) if algorithm == 'astar' else None
+        if at is not None or recency:
+            exposure = time_weighted_road_exposure(graph, crime_dataset, exposure, at, recency)
+            landmarks = landmarks.usable_for(None) if landmarks is not None else None
+        try:
+            (source, origin_snap), (target, destination_snap) = snap_route_endpoints(graph, data, endpoints)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        route = find_route(graph, exposure, source, target, safety_weight, algorithm, landmarks, bidirectional)
+        if route is None:
+            return jsonify({"error": "No route found between these points"}), 404
+        
+        nodes = route['nodes']
+        return jsonify({
+            "path": [{"lat": lat, "lng": lng} for lat, lng in
+                     zip(graph.node_lats[nodes].tolist(), graph.node_lngs[nodes].tolist())],
+            "distance_meters": round(route['distance_meters'], 1),
+            "crime_exposure": round(route['crime_exposure'], 2),
+            "cost": round(route['cost'], 1),
+            "safety_weight": safety_weight,
+            "algorithm": algorithm,
+            "bidirectional": route['bidirectional'],
+            "origin_snap_meters": round(origin_snap, 1),
+            "destination_snap_meters": round(destination_snap, 1),
+            "settled_nodes": route['settled_nodes'],
+            "landmarks": landmarks is not None,
+            "time_weighting": crime_time_summary(at, recency),
+            "search_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+        
+    except Exception as e:
+        print(f"Safe route error: {str(e)}")
+        return jsonify({"error": "Failed to find a safe route"}), 500
+
+@app.route("/api/safe-route-alternatives", methods=["POST"])
+def safe_route_alternatives():
+    """
+    Several routes between two points over the local road graph, from the
+    shortest to the safest, none of them both longer and less safe than another.
+    Body: {"origin": {"lat", "lng"}, "destination": {"lat", "lng"},
+           "alternatives": how many (default 3), "mode": "walking" | "bicycling" | "driving",
+           "time", "recency": weight crimes by time of week}
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        try:
+            endpoints = parse_route_endpoints(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        count = data.get("alternatives", DEFAULT_ALTERNATIVES)
+        if not isinstance(count, int) or isinstance(count, bool) or not 1 <= count <= MAX_ALTERNATIVES:
+            return jsonify({"error": f"alternatives must be a whole number from 1 to {MAX_ALTERNATIVES}"}), 400
+        mode = data.get("mode", "walking")
+        if mode not in TRAVEL_SPEEDS:
+            return jsonify({"error": f"mode must be one of {', '.join(TRAVEL_SPEEDS)}"}), 400
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        graph = get_road_graph()
+        if graph is None:
+            return jsonify({"error": "Road graph not available"}), 503
+        
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        started = time.perf_counter()
+        exposure, checksum = get_road_crime_exposure(graph, crime_dataset)
+        landmarks = get_road_landmarks(graph, exposure, checksum)
+        if at is not None or recency:
+            exposure = time_weighted_road_exposure(graph, crime_dataset, exposure, at, recency)
+            landmarks = landmarks.usable_for(None) if landmarks is not None else None
+        try:
+            (source, origin_snap), (target, destination_snap) = snap_route_endpoints(graph, data, endpoints)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        routes = alternative_routes(graph, exposure, source, target, count, landmarks)
+        if routes is None:
+            return jsonify({"error": "No route found between these points"}), 404
+        
+        return jsonify({
+            "routes": [{
+                "path": [{"lat": lat, "lng": lng} for lat, lng in
+                         zip(graph.node_lats[route['nodes']].tolist(), graph.node_lngs[route['nodes']].tolist())],
+                "distance_meters": round(route['distance_meters'], 1),
+                "duration_seconds": round(route['distance_meters'] / TRAVEL_SPEEDS[mode]),
+                "crime_exposure": round(route['crime_exposure'], 2),
+                "safety_weight": round(route['safety_weight'], 3)
+            } for route in routes],
+            "mode": mode,
+            "origin_snap_meters": round(origin_snap, 1),
+            "destination_snap_meters": round(destination_snap, 1),
+            "landmarks": landmarks is not None,
+            "time_weighting": crime_time_summary(at, recency),
+            "search_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+        
+    except Exception as e:
+        print(f"Safe route alternatives error: {str(e)}")
+        return jsonify({"error": "Failed to find alternative routes"}), 500
+
+def _matrix_points(points, label):
+    """The {"lat", "lng"} dicts in a list, checked; raises ValueError naming the list"""
+    if not isinstance(points, list):
+        raise ValueError(f"{label} must be a list of points")
+    if len(points) > MAX_MATRIX_POINTS:
+        raise ValueError(f"{label} can have at most {MAX_MATRIX_POINTS} points")
+    try:
+        for point in points:
+            parse_coordinates(point)
+    except (TypeError, KeyError, ValueError):
+        raise ValueError(f"Every point in {label} needs valid lat and lng")
+    return points
+
+def _matrix_values(values, digits):
+    """Matrix rows for JSON, with null where there is no route"""
+    return [[None if np.isnan(value) else round(value, digits) for value in row] for row in values.tolist()]
+
+@app.route("/api/route-matrix", methods=["POST"])
+def route_matrix_endpoint():
+    """
+    Road distance and violent crime exposure between every origin and every
+    destination over the local road graph, without a Directions call per pair.
+    Body: {"origins": [{"lat", "lng"}], "destinations": [{"lat", "lng"}],
+           "safety_weight": 0-1, "time", "recency": weight crimes by time of week}
+    Without origins, the session's plotted points are used; without
+    destinations, the origins are.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        try:
+            if "origins" in data:
+                origins = _matrix_points(data["origins"], "origins")
+            else:
+                origins = _matrix_points(get_user_plotted_points(get_or_create_session_id()), "plotted points")
+            destinations = _matrix_points(data["destinations"], "destinations") if "destinations" in data else origins
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not origins or not destinations:
+            return jsonify({"error": "Need at least one origin and one destination"}), 400
+        
+        try:
+            safety_weight = parse_safety_weight(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        graph = get_road_graph()
+        if graph is None:
+            return jsonify({"error": "Road graph not available"}), 503
+        
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        started = time.perf_counter()
+        exposure, _ = get_road_crime_exposure(graph, crime_dataset)
+        exposure = time_weighted_road_exposure(graph, crime_dataset, exposure, at, recency)
+        origin_snaps = [snap_to_road(graph, point) for point in origins]
+        destination_snaps = [snap_to_road(graph, point) for point in destinations]
+        
+        matrix = route_matrix(
+            graph, exposure, [node for node, _ in origin_snaps], [node for node, _ in destination_snaps], safety_weight
+        )
+        
+        return jsonify({
+            "origins": [{"lat": float(point["lat"]), "lng": float(point["lng"]), "node": node, "snap_meters": round(snap, 1)}
+                        for point, (node, snap) in zip(origins, origin_snaps)],
+            "destinations": [{"lat": float(point["lat"]), "lng": float(point["lng"]), "node": node, "snap_meters": round(snap, 1)}
+                             for point, (node, snap) in zip(destinations, destination_snaps)],
+            "distance_meters": _matrix_values(matrix['distance_meters'], 1),
+            "crime_exposure": _matrix_values(matrix['crime_exposure'], 2),
+            "cost": _matrix_values(matrix['cost'], 1),
+            "safety_weight": safety_weight,
+            "time_weighting": crime_time_summary(at, recency),
+            "search_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+        
+    except Exception as e:
+        print(f"Route matrix error: {str(e)}")
+        return jsonify({"error": "Failed to compute route matrix"}), 500
+
+def _plotted_point_index(points, point_id, label):
+    """Index of the plotted point with this id, None when no id is given; raises ValueError when not found"""
+    if point_id is None:
+        return None
+    for i, point in enumerate(points):
+        if point["id"] == point_id:
+            return i
+    raise ValueError(f"{label} {point_id} is not one of the plotted points")
+
+@app.route("/api/optimize-route", methods=["POST"])
+def optimize_route():
+    """
+    Reorder the session's plotted points to minimize a blend of road distance
+    and violent crime exposure between consecutive points.
+    Body: {"safety_weight": 0-1, "start_point_id", "end_point_id",
+           "apply": store the new order in the session,
+           "time", "recency": weight crimes by time of week}
+    Giving the same start and end point id plans a round trip.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        session_id = get_or_create_session_id()
+        points = get_user_plotted_points(session_id)
+        
+        if len(points) > MAX_MATRIX_POINTS:
+            return jsonify({"error": f"Can optimize at most {MAX_MATRIX_POINTS} points"}), 400
+        try:
+            start = _plotted_point_index(points, data.get("start_point_id"), "start_point_id")
+            end = _plotted_point_index(points, data.get("end_point_id"), "end_point_id")
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        try:
+            safety_weight = parse_safety_weight(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if len(points) < 2:
+            return jsonify({"error": "Need at least 2 plotted points"}), 400
+        try:
+            at, recency = parse_crime_time_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        graph = get_road_graph()
+        if graph is None:
+            return jsonify({"error": "Road graph not available"}), 503
+        
+        unavailable = crime_data_unavailable_response()
+        if unavailable:
+            return unavailable
+        
+        started = time.perf_counter()
+        exposure, _ = get_road_crime_exposure(graph, crime_dataset)
+        exposure = time_weighted_road_exposure(graph, crime_dataset, exposure, at, recency)
+        nodes = [snap_to_road(graph, point)[0] for point in points]
+        matrix = route_matrix(graph, exposure, nodes, nodes, safety_weight)
+        
+        round_trip = start is not None and start == end
+        order = optimize_order(matrix['cost'], start, end)
+        cost = tour_cost(matrix['cost'], order, round_trip)
+        if cost == float('inf'):
+            return jsonify({"error": "Some plotted points can't be reached from each other by road"}), 404
+        
+        stops = order + [order[0]] if round_trip else order
+        legs = [{
+            "from_id": points[a]["id"],
+            "to_id": points[b]["id"],
+            "distance_meters": round(float(matrix['distance_meters'][a, b]), 1),
+            "crime_exposure": round(float(matrix['crime_exposure'][a, b]), 2)
+        } for a, b in zip(stops[:-1], stops[1:])]
+        current_cost = tour_cost(matrix['cost'], range(len(points)), round_trip)
+        
+        ordered = [points[i] for i in order]
+        if data.get("apply"):
+            reorder_plotted_points(session_id, order)
+        
+        return jsonify({
+            "points": ordered,
+            "order": [point["id"] for point in ordered],
+            "legs": legs,
+            "round_trip": round_trip,
+            "distance_meters": round(sum(leg["distance_meters"] for leg in legs), 1),
+            "crime_exposure": round(sum(leg["crime_exposure"] for leg in legs), 2),
+            "cost": round(cost, 1),
+            "current_order_cost": round(current_cost, 1) if current_cost != float('inf') else None,
+            "safety_weight": safety_weight,
+            "time_weighting": crime_time_summary(at, recency),
+            "applied": bool(data.get("apply")),
+            "search_ms": round((time.perf_counter() - started) * 1000, 2)
+        })
+        
+    except Exception as e:
+        print(f"Route optimization error: {str(e)}")
+        return jsonify({"error": "Failed to optimize route"}), 500
+
 @app.route("/api/calculate-route-distance", methods=["POST"])
 def calculate_route_distance():
     """Calculate total distance for a route through multiple points"""
@@ -1363,6 +2551,10 @@ def health_check():
             "timestamp": datetime.now().isoformat(),
             "services": services,
             "cache_size": len(api_cache),
+            "cache": api_cache.stats(),
+            "coalesced_calls": outbound_calls.stats(),
+            "external_calls": http_client.stats(),
+            "crime_data": dict(crime_data_status),
             "active_sessions": len(conversation_history),
             "total_plotted_points": sum(len(points) for points in user_plotted_points.values())
         })
@@ -1375,9 +2567,10 @@ def health_check():
 
 @app.route("/api/clear-cache", methods=["POST"])
 def clear_cache():
-    """Clear API cache"""
+    """Clear API cache, or only one namespace of it with {"namespace": ...}"""
     try:
-        api_cache.clear()
+        data = request.get_json(silent=True) or {}
+        api_cache.clear(data.get("namespace"))
         return jsonify({"message": "Cache cleared successfully"})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,114 @@
+from datetime import datetime
+
+import numpy as np
+
+from crime_index import CrimeGridIndex
+from crime_loader import append_crime_rows, classify_violent_crimes, crime_timestamps
+from crime_tiles import CrimeTilePyramid
+from crime_time import CrimeTimeProfile
+
+
+class CrimeDataset:
+    """
+    Loaded crime data together with everything derived from it.
+
+    A dataset is never modified after it is built. Reloads, appends and
+    reclassification build a new dataset off to the side and the app swaps
+    its single global reference, so a request that grabbed the old dataset
+    keeps a consistent DataFrame, index and tile pyramid to the end.
+    The hour-of-week profile of violent crimes is small and always rebuilt.
+    """
+
+    def __init__(self, df, category_table, source, index=None, tiles=None):
+        self.df = df
+        self.category_table = category_table
+        self.source = source
+        self.is_violent = df['is_violent_crime'].to_numpy(dtype=bool)
+        self.violent_count = int(self.is_violent.sum())
+
+        self.index = index if index is not None else CrimeGridIndex(
+            df['latitude'].to_numpy(), df['longitude'].to_numpy()
+        )
+        self.tiles = tiles if tiles is not None else CrimeTilePyramid(
+            df['latitude'].to_numpy()[self.is_violent], df['longitude'].to_numpy()[self.is_violent]
+        )
+
+        timestamps = crime_timestamps(df)
+        self.last_timestamp = timestamps.max() if timestamps is not None and timestamps.notna().any() else None
+        violent_timestamps = (timestamps.to_numpy()[self.is_violent] if timestamps is not None
+                              else np.full(self.violent_count, np.datetime64('NaT')))
+        self.time_profile = CrimeTimeProfile(
+            self.index, self.index.latitudes[self.is_violent], self.index.longitudes[self.is_violent], violent_timestamps
+        )
+        # Row of every crime's cell in the profile's factors, so weighting rows is one gather
+        self.time_cells = self.time_profile.cell_rows(self.index.latitudes, self.index.longitudes)
+        self.built_at = datetime.now()
+
+    def __len__(self):
+        return len(self.df)
+
+    def rows_after_last_timestamp(self, rows):
+        """Rows of a freshly parsed CSV that are newer than anything already loaded"""
+        if self.last_timestamp is None:
+            return rows
+        timestamps = crime_timestamps(rows)
+        if timestamps is None:
+            return rows
+        return rows[(timestamps > self.last_timestamp).to_numpy()]
+
+    def with_appended_rows(self, new_rows, crime_types):
+        """
+        New dataset with extra incidents added.
+        Only the new rows are classified; the spatial index and tile pyramid
+        merge them into their sorted arrays instead of being rebuilt.
+        """
+        new_rows = new_rows.copy()
+        new_rows['is_violent_crime'], new_table = classify_violent_crimes(new_rows, crime_types)
+        df = append_crime_rows(self.df, new_rows)
+
+        category_table = dict(self.category_table)
+        for col, table in new_table.items():
+            if col in category_table:
+                table = category_table[col].combine_first(table)
+            category_table[col] = table
+
+        lats = new_rows['latitude'].to_numpy()
+        lngs = new_rows['longitude'].to_numpy()
+        violent = new_rows['is_violent_crime'].to_numpy(dtype=bool)
+
+        return CrimeDataset(
+            df, category_table, 'append',
+            index=self.index.with_points(lats, lngs),
+            tiles=self.tiles.with_points(lats[violent], lngs[violent])
+        )
+
+    def reclassified(self, crime_types):
+        """New dataset with violent crimes re-flagged; the spatial index is shared"""
+        df = self.df.copy(deep=False)
+        df['is_violent_crime'], category_table = classify_violent_crimes(df, crime_types)
+        return CrimeDataset(df, category_table, self.source, index=self.index)
+
+    def time_weight(self, at=None, recency=False):
+        """
+        Function from row positions to how much those crimes count at time `at`
+        (a naive local datetime) and/or discounted by age; None when neither is asked for.
+        """
+        if at is None and not recency:
+            return None
+        factors = self.time_profile.cell_factors(at, recency)
+        return lambda positions: factors[self.time_cells[positions]]
+
+    def fingerprint(self):
+        """Identifies the crime data that precomputed artifacts (like road graph weights) were built from"""
+        status = self.status()
+        return {key: status[key] for key in ('records', 'violent_crimes', 'last_incident')}
+
+    def status(self):
+        """Summary for health checks and reload responses"""
+        return {
+            'records': len(self),
+            'violent_crimes': self.violent_count,
+            'source': self.source,
+            'last_incident': self.last_timestamp.isoformat() if self.last_timestamp is not None else None,
+            'tile_version': self.tiles.version
+        }
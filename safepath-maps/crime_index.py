@@ -0,0 +1,124 @@
+import numpy as np
+
+from geo import EARTH_RADIUS_FEET, haversine_one_to_many
+
+# Size of one grid cell in degrees (~550m north-south in Philadelphia)
+DEFAULT_CELL_DEGREES = 0.005
+
+FEET_PER_DEGREE_LAT = EARTH_RADIUS_FEET * np.pi / 180.0
+
+
+class CrimeGridIndex:
+    """
+    Uniform lat/lng grid over the crime dataset.
+
+    Rows are bucketed into square cells once at load time and kept sorted by
+    cell key, so a radius query only has to look at the handful of cells that
+    overlap the search circle's bounding box instead of scanning every row.
+    Positions returned by the index are row positions (iloc) into the
+    DataFrame the index was built from.
+
+    The grid is anchored at (-90, -180) rather than at the data, so appended
+    rows always land in the same cells and can be merged in without a resort.
+    """
+
+    def __init__(self, latitudes, longitudes, cell_degrees=DEFAULT_CELL_DEGREES, _sorted=None):
+        self.latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+        self.longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+        self.cell_degrees = cell_degrees
+        self.n_rows = int(np.ceil(180.0 / cell_degrees)) + 1
+        self.n_cols = int(np.ceil(360.0 / cell_degrees)) + 1
+
+        if _sorted is not None:
+            self.order, self.sorted_keys = _sorted
+            return
+
+        keys = self._cell_keys(self.latitudes, self.longitudes)
+        # Stable sort keeps dataset order inside each cell
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    def _cell_rows(self, lats):
+        return np.floor((np.asarray(lats, dtype=np.float64) + 90.0) / self.cell_degrees).astype(np.int64)
+
+    def _cell_cols(self, lngs):
+        return np.floor((np.asarray(lngs, dtype=np.float64) + 180.0) / self.cell_degrees).astype(np.int64)
+
+    def _cell_keys(self, lats, lngs):
+        return self._cell_rows(lats) * self.n_cols + self._cell_cols(lngs)
+
+    def with_points(self, latitudes, longitudes):
+        """
+        New index with extra rows appended after the existing ones.
+        The new keys are merged into the sorted order, so the cost is one
+        linear copy rather than re-sorting everything.
+        """
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+
+        new_keys = self._cell_keys(latitudes, longitudes)
+        new_order = np.argsort(new_keys, kind='stable')
+        new_keys = new_keys[new_order]
+        new_positions = new_order + len(self)
+
+        # side='right' puts appended rows after existing ones in the same cell, keeping dataset order
+        insert_at = np.searchsorted(self.sorted_keys, new_keys, side='right')
+        sorted_keys = np.insert(self.sorted_keys, insert_at, new_keys)
+        order = np.insert(self.order, insert_at, new_positions)
+
+        return CrimeGridIndex(
+            np.concatenate([self.latitudes, latitudes]),
+            np.concatenate([self.longitudes, longitudes]),
+            self.cell_degrees,
+            _sorted=(order, sorted_keys)
+        )
+
+    def candidates_in_bounds(self, south, north, west, east):
+        """Row positions of every crime in the cells overlapping a bounding box, in dataset order"""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+
+        row_lo = max(int(self._cell_rows(south)), 0)
+        row_hi = min(int(self._cell_rows(north)), self.n_rows - 1)
+        col_lo = max(int(self._cell_cols(west)), 0)
+        col_hi = min(int(self._cell_cols(east)), self.n_cols - 1)
+
+        if row_lo > row_hi or col_lo > col_hi:
+            return np.empty(0, dtype=np.int64)
+
+        # Cells in one grid row have consecutive keys, so each row is one slice
+        row_keys = np.arange(row_lo, row_hi + 1, dtype=np.int64) * self.n_cols
+        starts = np.searchsorted(self.sorted_keys, row_keys + col_lo, side='left')
+        ends = np.searchsorted(self.sorted_keys, row_keys + col_hi, side='right')
+
+        slices = [self.order[s:e] for s, e in zip(starts, ends) if e > s]
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+
+        return np.sort(np.concatenate(slices))
+
+    def query_radius(self, lat, lng, radius_feet):
+        """
+        Find crimes within radius_feet of a point.
+        Returns (positions, distances_feet), both in dataset order.
+        """
+        lat_margin = radius_feet / FEET_PER_DEGREE_LAT
+        lng_margin = lat_margin / max(np.cos(np.radians(lat)), 1e-6)
+
+        candidates = self.candidates_in_bounds(
+            lat - lat_margin, lat + lat_margin,
+            lng - lng_margin, lng + lng_margin
+        )
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float64)
+
+        # Exact distances only for the candidate rows
+        distances = haversine_one_to_many(
+            lat, lng, self.latitudes[candidates], self.longitudes[candidates], EARTH_RADIUS_FEET
+        )
+        within = distances <= radius_feet
+
+        return candidates[within], distances[within]
@@ -0,0 +1,340 @@
+"""
+Crime dataset loading: CSV parsing, violent crime classification and a
+memory-mapped columnar snapshot of the processed data.
+
+Parsing the raw CSV is slow, so the first load writes the processed
+DataFrame as a directory of .npy column files next to the CSV. Later starts
+(and every gunicorn worker) memory-map that snapshot instead of reparsing,
+as long as the CSV's mtime/size or content hash still match.
+
+Prebuild the snapshot during deploy with:
+    python safepath-maps/crime_loader.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+CRIME_DATA_PATH = 'safepath-maps/philly_crime_data.csv'
+
+# Snapshots live next to the CSV unless CRIME_SNAPSHOT_DIR is set
+CRIME_SNAPSHOT_DIR = os.getenv("CRIME_SNAPSHOT_DIR")
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Common violent crime categories - adjust based on your dataset
+DEFAULT_VIOLENT_CRIME_TYPES = frozenset({
+    'homicide', 'murder', 'manslaughter', 'assault', 'aggravated assault',
+    'simple assault', 'robbery', 'armed robbery', 'rape', 'sexual assault',
+    'kidnapping', 'domestic violence', 'battery', 'shooting', 'stabbing',
+    'carjacking', 'purse snatching', 'strong arm robbery', 'other assault', 'theft'
+})
+
+# Columns checked for violent crime descriptions
+CRIME_DESCRIPTION_COLUMNS = ['description', 'crime_type', 'offense', 'incident_type', 'ucr_general']
+
+# Columns holding the incident date/time, in order of preference
+CRIME_TIMESTAMP_COLUMNS = ['dispatch_date_time', 'datetime', 'date']
+
+
+def build_violent_crime_pattern(crime_types):
+    """Compile one alternation regex that matches any violent crime type as a substring"""
+    # Longest first so the alternation prefers the most specific type
+    alternatives = sorted((re.escape(str(t).lower()) for t in crime_types), key=len, reverse=True)
+    return re.compile('|'.join(alternatives))
+
+
+def classify_violent_crimes(df, crime_types=DEFAULT_VIOLENT_CRIME_TYPES):
+    """
+    Classify crimes as violent based on description/category columns.
+    Each distinct value of a categorical column is checked once and the result
+    is broadcast to rows through the category codes.
+    Returns (is_violent Series, {column: Series of category value -> flag}).
+    """
+    is_violent = np.zeros(len(df), dtype=bool)
+    category_table = {}
+    if not crime_types:
+        return pd.Series(is_violent, index=df.index), category_table
+
+    pattern = build_violent_crime_pattern(crime_types)
+
+    for col in CRIME_DESCRIPTION_COLUMNS:
+        if col not in df.columns:
+            continue
+
+        values = df[col]
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype('category')
+
+        categories = values.cat.categories
+        flags = np.array([bool(pattern.search(str(value).lower())) for value in categories], dtype=bool)
+        category_table[col] = pd.Series(flags, index=categories)
+
+        if not flags.any():
+            continue
+
+        # Missing values have code -1 and are never violent
+        codes = values.cat.codes.to_numpy()
+        is_violent |= (codes >= 0) & flags[np.maximum(codes, 0)]
+
+    return pd.Series(is_violent, index=df.index), category_table
+
+
+def parse_crime_csv(csv_path=CRIME_DATA_PATH):
+    """Read the raw crime CSV and clean coordinates. Raises ValueError if the layout is unexpected."""
+    df = pd.read_csv(csv_path, low_memory=False)
+
+    # Extract lat/lng from columns 17 and 18 (0-indexed: 16 and 17)
+    if len(df.columns) < 18:
+        raise ValueError("CSV doesn't have enough columns")
+
+    lat_col = df.columns[16]  # 17th column
+    lng_col = df.columns[17]  # 18th column
+
+    # Clean and convert coordinates
+    df['latitude'] = pd.to_numeric(df[lat_col], errors='coerce')
+    df['longitude'] = pd.to_numeric(df[lng_col], errors='coerce')
+
+    # Remove rows with invalid coordinates
+    df = df.dropna(subset=['latitude', 'longitude'])
+
+    # Filter for Philadelphia area (rough bounds)
+    df = df[
+        (df['latitude'] >= 39.0) & (df['latitude'] <= 41.0) &
+        (df['longitude'] >= -76.0) & (df['longitude'] <= -74.0)
+    ]
+
+    # Encode description columns as categoricals so each distinct value is classified once
+    for col in CRIME_DESCRIPTION_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    return df
+
+
+def crime_timestamps(df):
+    """Incident timestamps as a datetime Series (NaT where missing), or None if the data has no date column"""
+    for col in CRIME_TIMESTAMP_COLUMNS:
+        if col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                # Parse each distinct value once
+                parsed = pd.to_datetime(pd.Series(values.cat.categories), errors='coerce').to_numpy()
+                codes = values.cat.codes.to_numpy()
+                timestamps = np.where(codes >= 0, parsed[np.maximum(codes, 0)], np.datetime64('NaT'))
+                return pd.Series(timestamps, index=df.index)
+            return pd.to_datetime(values, errors='coerce')
+    return None
+
+
+def append_crime_rows(df, new_rows):
+    """
+    Concatenate newly ingested rows onto a processed crime DataFrame.
+    Categorical columns get the union of both sides' categories so they stay categorical.
+    """
+    new_rows = new_rows.copy()
+    for col in df.columns:
+        if col in new_rows.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            new_values = new_rows[col].dropna().unique()
+            categories = df[col].cat.categories.union(pd.Index(new_values), sort=False)
+            dtype = pd.CategoricalDtype(categories)
+            df_values = df[col].astype(dtype)
+            new_rows[col] = new_rows[col].astype(object).astype(dtype)
+            df = df.assign(**{col: df_values})
+
+    return pd.concat([df, new_rows], ignore_index=True)
+
+
+def _snapshot_root(csv_path):
+    return CRIME_SNAPSHOT_DIR or os.path.join(os.path.dirname(os.path.abspath(csv_path)), '.crime_snapshot')
+
+
+def _pointer_path(csv_path):
+    return os.path.join(_snapshot_root(csv_path), os.path.basename(csv_path) + '.json')
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _json_categories(categories):
+    """Category values as plain JSON types"""
+    return [value.item() if isinstance(value, np.generic) else value for value in categories]
+
+
+def write_crime_snapshot(df, csv_path=CRIME_DATA_PATH, csv_sha256=None):
+    """Write a processed crime DataFrame as a memory-mappable snapshot keyed by the CSV"""
+    stat = os.stat(csv_path)
+    csv_sha256 = csv_sha256 or _file_sha256(csv_path)
+
+    root = _snapshot_root(csv_path)
+    os.makedirs(root, exist_ok=True)
+
+    name = f"{os.path.basename(csv_path)}-{csv_sha256[:16]}"
+    final_dir = os.path.join(root, name)
+    tmp_dir = os.path.join(root, f".{name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        entry = {'name': str(col), 'file': f"{i}.npy"}
+
+        if not isinstance(values.dtype, pd.CategoricalDtype) and (
+                pd.api.types.is_numeric_dtype(values.dtype) or pd.api.types.is_bool_dtype(values.dtype)):
+            entry['kind'] = 'numeric'
+            np.save(os.path.join(tmp_dir, entry['file']), values.to_numpy())
+        else:
+            # Strings and other objects are stored dictionary-encoded
+            categorical = values.astype('category') if not isinstance(values.dtype, pd.CategoricalDtype) else values
+            entry['kind'] = 'categorical'
+            entry['categories'] = _json_categories(categorical.cat.categories)
+            np.save(os.path.join(tmp_dir, entry['file']), categorical.cat.codes.to_numpy())
+
+        columns.append(entry)
+
+    manifest = {
+        'format_version': SNAPSHOT_FORMAT_VERSION,
+        'rows': len(df),
+        'columns': columns,
+        'created_at': time.time()
+    }
+    _write_json_atomic(os.path.join(tmp_dir, 'manifest.json'), manifest)
+
+    # Publish the finished directory, then point the CSV at it
+    if os.path.exists(final_dir):
+        shutil.rmtree(final_dir)
+    os.rename(tmp_dir, final_dir)
+
+    previous = _read_json(_pointer_path(csv_path))
+    _write_json_atomic(_pointer_path(csv_path), {
+        'csv_mtime_ns': stat.st_mtime_ns,
+        'csv_size': stat.st_size,
+        'csv_sha256': csv_sha256,
+        'snapshot': name
+    })
+
+    # Drop the snapshot this one replaced
+    if previous and previous.get('snapshot') and previous['snapshot'] != name:
+        shutil.rmtree(os.path.join(root, previous['snapshot']), ignore_errors=True)
+
+    return final_dir
+
+
+def _read_snapshot_dir(snapshot_dir):
+    manifest = _read_json(os.path.join(snapshot_dir, 'manifest.json'))
+    if not manifest or manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        return None
+
+    data = {}
+    for entry in manifest['columns']:
+        values = np.load(os.path.join(snapshot_dir, entry['file']), mmap_mode='r')
+        if entry['kind'] == 'categorical':
+            values = pd.Categorical.from_codes(values, categories=pd.Index(entry['categories']))
+        data[entry['name']] = values
+
+    return pd.DataFrame(data, copy=False)
+
+
+def read_crime_snapshot(csv_path=CRIME_DATA_PATH):
+    """
+    Memory-map the processed snapshot for a CSV if it is still current.
+    Returns (DataFrame or None, csv sha256 if it had to be computed).
+    """
+    pointer = _read_json(_pointer_path(csv_path))
+    if not pointer:
+        return None, None
+
+    stat = os.stat(csv_path)
+    csv_sha256 = None
+    if stat.st_mtime_ns != pointer.get('csv_mtime_ns') or stat.st_size != pointer.get('csv_size'):
+        # The file was touched; only a content change invalidates the snapshot
+        csv_sha256 = _file_sha256(csv_path)
+        if csv_sha256 != pointer.get('csv_sha256'):
+            return None, csv_sha256
+        pointer.update(csv_mtime_ns=stat.st_mtime_ns, csv_size=stat.st_size)
+        _write_json_atomic(_pointer_path(csv_path), pointer)
+
+    df = _read_snapshot_dir(os.path.join(_snapshot_root(csv_path), pointer['snapshot']))
+    return df, csv_sha256
+
+
+def load_processed_crime_data(csv_path=CRIME_DATA_PATH, crime_types=DEFAULT_VIOLENT_CRIME_TYPES,
+                              use_snapshot=True):
+    """
+    Load the processed crime dataset, from the snapshot when possible.
+    Returns (DataFrame with is_violent_crime, category table, source) where
+    source is 'snapshot' or 'csv'.
+    """
+    # A missing CSV is an error even if an old snapshot is still around
+    os.stat(csv_path)
+
+    df = None
+    csv_sha256 = None
+    if use_snapshot:
+        try:
+            df, csv_sha256 = read_crime_snapshot(csv_path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring unreadable crime data snapshot: {e}")
+            df = None
+
+    source = 'snapshot'
+    if df is None:
+        source = 'csv'
+        df = parse_crime_csv(csv_path)
+        if use_snapshot:
+            try:
+                write_crime_snapshot(df, csv_path, csv_sha256)
+            except OSError as e:
+                print(f"Could not write crime data snapshot: {e}")
+
+    # Classification is cheap on categoricals, so it is always redone for the current types
+    df['is_violent_crime'], category_table = classify_violent_crimes(df, crime_types)
+
+    return df, category_table, source
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prebuild the processed crime data snapshot")
+    parser.add_argument('--csv', default=CRIME_DATA_PATH, help="Path to the raw crime CSV")
+    parser.add_argument('--force', action='store_true', help="Rebuild even if the snapshot is current")
+    args = parser.parse_args()
+
+    start = time.time()
+    df = None if args.force else read_crime_snapshot(args.csv)[0]
+    if df is not None:
+        print(f"Snapshot for {args.csv} is current ({len(df)} records)")
+        return
+
+    df = parse_crime_csv(args.csv)
+    snapshot_dir = write_crime_snapshot(df, args.csv)
+    print(f"Wrote {len(df)} crime records to {snapshot_dir} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
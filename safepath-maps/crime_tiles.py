@@ -0,0 +1,233 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Zoom levels served by /api/crime-tiles
+MIN_TILE_ZOOM = 10
+MAX_TILE_ZOOM = 18
+
+# Each tile is split into TILE_BINS x TILE_BINS density cells
+TILE_BIN_BITS = 4
+TILE_BINS = 1 << TILE_BIN_BITS
+
+# Crimes are keyed by quadkey down to one density cell at MAX_TILE_ZOOM
+QUADKEY_LEVELS = MAX_TILE_ZOOM + TILE_BIN_BITS
+
+# Rendered tiles kept in memory per pyramid
+TILE_CACHE_LIMIT = 20000
+
+# Web Mercator latitude limit
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def lat_lng_to_world(lats, lngs):
+    """Project coordinates to Web Mercator world fractions, both in [0, 1)"""
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    lngs = np.asarray(lngs, dtype=np.float64)
+
+    x = (lngs + 180.0) / 360.0
+    lat_rad = np.radians(lats)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / np.pi) / 2.0
+
+    return x, y
+
+
+def world_to_lat_lng(x, y):
+    """Inverse of lat_lng_to_world"""
+    lng = np.asarray(x, dtype=np.float64) * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * np.asarray(y, dtype=np.float64)))))
+    return lat, lng
+
+
+def tile_bounds(z, x, y):
+    """Bounding box of an XYZ tile as north/south/east/west"""
+    n = float(1 << z)
+    north, west = world_to_lat_lng(x / n, y / n)
+    south, east = world_to_lat_lng((x + 1) / n, (y + 1) / n)
+    return {'north': float(north), 'south': float(south), 'east': float(east), 'west': float(west)}
+
+
+def _spread_bits(values):
+    """Insert a zero bit between each of the low 32 bits (Morton encoding helper)"""
+    v = np.asarray(values, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def quadkeys(xs, ys):
+    """Interleave tile x/y into integer quadkeys (each base-4 digit is 2*y_bit + x_bit)"""
+    return (_spread_bits(ys) << np.uint64(1)) | _spread_bits(xs)
+
+
+class CrimeTilePyramid:
+    """
+    Multi-resolution density tiles over violent crime locations.
+
+    Every crime gets a quadkey at the resolution of one density cell at
+    MAX_TILE_ZOOM, and the keys are sorted once. Because a tile's quadkey is
+    a prefix of the keys of everything inside it, any tile at any zoom is a
+    contiguous slice of the sorted keys, found with two binary searches.
+    Tiles are rendered lazily on first request and then kept in an LRU.
+    """
+
+    def __init__(self, latitudes, longitudes, _state=None):
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+        if _state is not None:
+            self.keys, self.px, self.py, self.version, self.max_cell_counts = _state
+            return
+
+        px, py = self._cell_coords(latitudes, longitudes)
+        keys = quadkeys(px, py)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.px = px[order]
+        self.py = py[order]
+
+        # Identifies this exact set of crimes; part of every tile URL so tiles can be cached forever
+        self.version = hashlib.sha1(self.keys.tobytes()).hexdigest()[:16]
+
+        # Busiest density cell per zoom, so intensities are comparable across tiles
+        self.max_cell_counts = {
+            z: self._max_cell_count(z) for z in range(MIN_TILE_ZOOM, MAX_TILE_ZOOM + 1)
+        }
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def _cell_coords(latitudes, longitudes):
+        world_x, world_y = lat_lng_to_world(latitudes, longitudes)
+        scale = float(1 << QUADKEY_LEVELS)
+        limit = (1 << QUADKEY_LEVELS) - 1
+        px = np.clip(np.floor(world_x * scale), 0, limit).astype(np.uint64)
+        py = np.clip(np.floor(world_y * scale), 0, limit).astype(np.uint64)
+        return px, py
+
+    @staticmethod
+    def _cell_shift(z):
+        return np.uint64(2 * (QUADKEY_LEVELS - z - TILE_BIN_BITS))
+
+    def _max_cell_count(self, z):
+        if len(self.keys) == 0:
+            return 0
+        cell_keys = self.keys >> self._cell_shift(z)
+        # Keys are sorted, so equal cells are adjacent runs
+        boundaries = np.flatnonzero(np.diff(cell_keys)) + 1
+        run_lengths = np.diff(np.concatenate(([0], boundaries, [len(cell_keys)])))
+        return int(run_lengths.max())
+
+    def with_points(self, latitudes, longitudes):
+        """
+        New pyramid with extra crimes merged in.
+        Only the density cells the new crimes fall into are recounted, and
+        rendered tiles they don't touch are carried over to the new pyramid.
+        """
+        px, py = self._cell_coords(latitudes, longitudes)
+        new_keys = quadkeys(px, py)
+        order = np.argsort(new_keys, kind='stable')
+        new_keys, px, py = new_keys[order], px[order], py[order]
+
+        insert_at = np.searchsorted(self.keys, new_keys, side='right')
+        keys = np.insert(self.keys, insert_at, new_keys)
+        merged_px = np.insert(self.px, insert_at, px)
+        merged_py = np.insert(self.py, insert_at, py)
+
+        max_cell_counts = {}
+        for z, previous_max in self.max_cell_counts.items():
+            shift = self._cell_shift(z)
+            touched = np.unique(new_keys >> shift)
+            counts = (np.searchsorted(keys, (touched + np.uint64(1)) << shift, side='left') -
+                      np.searchsorted(keys, touched << shift, side='left'))
+            max_cell_counts[z] = max(previous_max, int(counts.max()) if len(counts) else 0)
+
+        version = hashlib.sha1(self.version.encode() + new_keys.tobytes()).hexdigest()[:16]
+        pyramid = CrimeTilePyramid(None, None, _state=(keys, merged_px, merged_py, version, max_cell_counts))
+
+        # Reuse rendered tiles that no new crime falls in, at zooms whose scale didn't change
+        with self._lock:
+            cached = list(self._tiles.items())
+        for (z, x, y), tile in cached:
+            if max_cell_counts[z] != self.max_cell_counts[z]:
+                continue
+            tile_shift = np.uint64(2 * (QUADKEY_LEVELS - z))
+            prefix = quadkeys(np.array([x]), np.array([y]))[0]
+            start = np.searchsorted(new_keys, prefix << tile_shift, side='left')
+            end = np.searchsorted(new_keys, (prefix + np.uint64(1)) << tile_shift, side='left')
+            if end == start:
+                pyramid._tiles[(z, x, y)] = tile
+
+        return pyramid
+
+    def tile(self, z, x, y):
+        """Density points for one XYZ tile"""
+        if z < MIN_TILE_ZOOM or z > MAX_TILE_ZOOM:
+            raise ValueError(f"Zoom must be between {MIN_TILE_ZOOM} and {MAX_TILE_ZOOM}")
+        if not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            raise ValueError("Tile coordinates out of range for zoom level")
+
+        with self._lock:
+            cached = self._tiles.get((z, x, y))
+            if cached is not None:
+                self._tiles.move_to_end((z, x, y))
+
+        if cached is None:
+            cached = self._render_tile(z, x, y)
+            with self._lock:
+                self._tiles[(z, x, y)] = cached
+                if len(self._tiles) > TILE_CACHE_LIMIT:
+                    self._tiles.popitem(last=False)
+
+        return {**cached, 'version': self.version}
+
+    def _render_tile(self, z, x, y):
+        shift = np.uint64(2 * (QUADKEY_LEVELS - z))
+        prefix = quadkeys(np.array([x]), np.array([y]))[0]
+        start = np.searchsorted(self.keys, prefix << shift, side='left')
+        end = np.searchsorted(self.keys, (prefix + np.uint64(1)) << shift, side='left')
+
+        density_points = []
+        if end > start:
+            # Position of each crime inside the tile, in density cells
+            cell_shift = np.uint64(QUADKEY_LEVELS - z - TILE_BIN_BITS)
+            mask = np.uint64(TILE_BINS - 1)
+            bin_x = ((self.px[start:end] >> cell_shift) & mask).astype(np.int64)
+            bin_y = ((self.py[start:end] >> cell_shift) & mask).astype(np.int64)
+            counts = np.bincount(bin_y * TILE_BINS + bin_x, minlength=TILE_BINS * TILE_BINS)
+
+            cells = np.flatnonzero(counts)
+            cell_counts = counts[cells]
+            rows, cols = np.divmod(cells, TILE_BINS)
+
+            level_size = float(1 << (z + TILE_BIN_BITS))
+            lats, lngs = world_to_lat_lng(
+                (x * TILE_BINS + cols + 0.5) / level_size,
+                (y * TILE_BINS + rows + 0.5) / level_size
+            )
+            max_count = max(self.max_cell_counts[z], 1)
+            intensities = np.log1p(cell_counts) / np.log1p(max_count)
+
+            for lat, lng, count, intensity in zip(lats.tolist(), lngs.tolist(),
+                                                  cell_counts.tolist(), intensities.tolist()):
+                density_points.append({
+                    'lat': lat,
+                    'lng': lng,
+                    'count': count,
+                    'intensity': intensity
+                })
+
+        return {
+            'z': z,
+            'x': x,
+            'y': y,
+            'bounds': tile_bounds(z, x, y),
+            'bins': TILE_BINS,
+            'density_points': density_points
+        }
@@ -0,0 +1,126 @@
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+
+HOURS_PER_WEEK = 168
+
+# Incident timestamps in the Philadelphia data are local time
+CRIME_TIMEZONE = ZoneInfo('America/New_York')
+
+# Hour-of-week buckets this many hours either side of a target time count, tapering off
+DEFAULT_HOUR_WINDOW = 2
+
+# With recency weighting, an incident counts half as much per this many days before the latest one
+RECENCY_HALF_LIFE_DAYS = 365.0
+
+# Cells with few dated incidents lean on the citywide weekly pattern, as if it contributed this many
+TIME_PRIOR_INCIDENTS = 20.0
+
+
+def hour_of_week(timestamps):
+    """Hour-of-week bucket (Monday 00:00 is 0) of each timestamp, -1 where missing"""
+    timestamps = pd.DatetimeIndex(timestamps)
+    buckets = timestamps.dayofweek * 24 + timestamps.hour
+    return np.where(timestamps.isna(), -1, buckets).astype(np.int64)
+
+
+def parse_crime_time(value):
+    """
+    Naive local datetime from an ISO 8601 string or "now", for time-weighted queries.
+    Times with an offset are converted to the crime data's time zone.
+    Raises ValueError when the value can't be parsed.
+    """
+    if value == "now":
+        return datetime.now(CRIME_TIMEZONE).replace(tzinfo=None)
+    try:
+        at = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError("time must be an ISO 8601 date and time or \"now\"")
+    if at.tzinfo is not None:
+        at = at.astimezone(CRIME_TIMEZONE).replace(tzinfo=None)
+    return at
+
+
+def hour_weights(at=None, window=DEFAULT_HOUR_WINDOW):
+    """
+    (buckets, weights) of the hour-of-week buckets around a target time,
+    tapering linearly with distance and wrapping around the week; every
+    bucket equally when at is None.
+    """
+    if at is None:
+        return np.arange(HOURS_PER_WEEK), np.ones(HOURS_PER_WEEK)
+    offsets = np.arange(-window, window + 1)
+    center = at.weekday() * 24 + at.hour
+    return (center + offsets) % HOURS_PER_WEEK, 1.0 - np.abs(offsets) / (window + 1.0)
+
+
+class CrimeTimeProfile:
+    """
+    When in the week violent crimes happen, per spatial index cell.
+
+    Incidents are counted per (grid cell, hour-of-week) bucket once at load,
+    along with counts discounted by age for recency weighting. A query for a
+    target time reads a few buckets per cell from these aggregates and turns
+    them into a factor per cell: how much more (or less) crime that cell sees
+    around that hour than on average. Multiplying incident counts by their
+    cell's factor weights them by time without refiltering any rows.
+    """
+
+    def __init__(self, index, lats, lngs, timestamps):
+        self.index = index
+        buckets = hour_of_week(timestamps)
+        dated = buckets >= 0
+
+        keys = index._cell_keys(lats, lngs)[dated]
+        self.cells, cell_rows = np.unique(keys, return_inverse=True)
+        flat = cell_rows * HOURS_PER_WEEK + buckets[dated]
+        size = len(self.cells) * HOURS_PER_WEEK
+
+        self.counts = np.bincount(flat, minlength=size).reshape(-1, HOURS_PER_WEEK).astype(np.float64)
+
+        dated_times = pd.DatetimeIndex(timestamps)[dated]
+        if len(dated_times):
+            age_days = (dated_times.max() - dated_times).total_seconds().to_numpy() / 86400.0
+            discount = 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+        else:
+            discount = np.empty(0)
+        self.recent_counts = np.bincount(flat, weights=discount, minlength=size).reshape(-1, HOURS_PER_WEEK)
+
+        self.cell_totals = self.counts.sum(axis=1)
+        self.total = float(self.cell_totals.sum())
+
+    def __len__(self):
+        return len(self.cells)
+
+    def cell_factors(self, at=None, recency=False):
+        """
+        Factor for every cell, with the citywide factor appended last for
+        cells without dated incidents. Only the buckets around `at` are read.
+        """
+        if self.total == 0:
+            return np.ones(len(self.cells) + 1)
+
+        buckets, weights = hour_weights(at)
+        counts = self.recent_counts if recency else self.counts
+        scale = HOURS_PER_WEEK / weights.sum()
+
+        # Incidents each cell would have in a week where every hour looked like this one
+        near = counts[:, buckets] @ weights * scale
+        citywide = float(counts.sum(axis=0)[buckets] @ weights * scale) / self.total
+
+        factors = (near + TIME_PRIOR_INCIDENTS * citywide) / (self.cell_totals + TIME_PRIOR_INCIDENTS)
+        return np.append(factors, citywide)
+
+    def cell_rows(self, lats, lngs):
+        """Row of each point's cell in cell_factors(), the citywide row when the cell has no dated incidents"""
+        keys = self.index._cell_keys(lats, lngs)
+        rows = np.searchsorted(self.cells, keys)
+        found = rows < len(self.cells)
+        found[found] = self.cells[rows[found]] == keys[found]
+        return np.where(found, rows, len(self.cells))
+
+    def weights(self, lats, lngs, at=None, recency=False):
+        """Time weight of incidents (or road edges) at these points"""
+        return self.cell_factors(at, recency)[self.cell_rows(lats, lngs)]
@@ -0,0 +1,62 @@
+import numpy as np
+
+# Radius of earth in kilometers
+EARTH_RADIUS_KM = 6371.0
+# Radius of earth in feet (approximately)
+EARTH_RADIUS_FEET = 20902231.0
+EARTH_RADIUS_METERS = EARTH_RADIUS_KM * 1000.0
+
+
+def _as_radians(values, dtype):
+    return np.radians(np.asarray(values, dtype=dtype))
+
+
+def _haversine(lat1, lng1, lat2, lng2, radius):
+    """Haversine formula on arrays already in radians, broadcasting as NumPy does"""
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    # Rounding can push a slightly above 1 for antipodal points
+    return 2 * radius * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine_one_to_many(lat, lng, lats, lngs, radius=EARTH_RADIUS_KM, fast=False):
+    """
+    Distance from one point to arrays of points.
+    Pass fast=True to compute in float32, which is roughly twice as fast and
+    accurate to about a meter at city scale.
+    """
+    dtype = np.float32 if fast else np.float64
+    return _haversine(
+        _as_radians(lat, dtype), _as_radians(lng, dtype),
+        _as_radians(lats, dtype), _as_radians(lngs, dtype),
+        dtype(radius)
+    )
+
+
+def haversine_pairwise(lats1, lngs1, lats2, lngs2, radius=EARTH_RADIUS_KM, fast=False):
+    """Element-wise distance between two equally sized arrays of points"""
+    dtype = np.float32 if fast else np.float64
+    return _haversine(
+        _as_radians(lats1, dtype), _as_radians(lngs1, dtype),
+        _as_radians(lats2, dtype), _as_radians(lngs2, dtype),
+        dtype(radius)
+    )
+
+
+def haversine_many_to_many(lats1, lngs1, lats2, lngs2, radius=EARTH_RADIUS_KM, fast=False):
+    """Full distance matrix of shape (len(lats1), len(lats2))"""
+    dtype = np.float32 if fast else np.float64
+    return _haversine(
+        _as_radians(lats1, dtype)[:, None], _as_radians(lngs1, dtype)[:, None],
+        _as_radians(lats2, dtype)[None, :], _as_radians(lngs2, dtype)[None, :],
+        dtype(radius)
+    )
+
+
+def path_length(lats, lngs, radius=EARTH_RADIUS_KM):
+    """Total length of a path visiting the points in order"""
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if len(lats) < 2:
+        return 0.0
+
+    return float(haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:], radius).sum())
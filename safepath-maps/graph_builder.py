@@ -0,0 +1,188 @@
+"""
+Road graph building from intersection lists.
+
+Reads the input format of AAASENavigationBasicGraph.cpp: an intersection
+count, then for every intersection its Web Mercator x and y in meters
+followed by the names of the roads meeting there, separated by '&' and
+terminated by '-'. For example:
+
+    2
+    -8366000 4859000 MarketSt&BroadSt-
+    -8365800 4859000 MarketSt&15thSt-
+
+Instead of comparing every pair of intersections, intersections are
+grouped by road name in a hash index and ordered along each road, and only
+neighbours on the same road are linked. Violent crime exposure of every
+road is precomputed from the crime data, along with landmark tables for A*
+(landmarks.py), and the graph is written in the memory-mapped format of
+road_graph.py to where the server loads it from:
+    python safepath-maps/graph_builder.py intersections.txt
+"""
+import argparse
+import os
+import re
+import time
+
+import numpy as np
+
+from crime_dataset import CrimeDataset
+from crime_loader import CRIME_DATA_PATH, DEFAULT_VIOLENT_CRIME_TYPES, load_processed_crime_data
+from geo import EARTH_RADIUS_METERS
+from landmarks import LandmarkTables, landmarks_path
+from road_graph import ROAD_GRAPH_PATH, RoadGraph
+
+# Sphere radius of the Web Mercator projection used by the input
+MERCATOR_RADIUS = 6378137.0
+
+# Intersections further apart than this are not linked even if they share a road name;
+# the same name often belongs to unrelated streets in different parts of a city
+DEFAULT_MAX_LINK_METERS = 2000.0
+
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * np.pi / 180.0
+
+# x, y, then road names up to the terminating '-'
+INTERSECTION_PATTERN = re.compile(r'\s*(\S+)\s+(\S+)([^-]*)-')
+
+
+def mercator_to_lat_lng(x, y):
+    """Web Mercator meters to degrees. Like the C++ reader, x is always taken as west of Greenwich."""
+    x = -np.abs(np.asarray(x, dtype=np.float64))
+    lngs = np.degrees(x / MERCATOR_RADIUS)
+    lats = np.degrees(np.arctan(np.sinh(np.asarray(y, dtype=np.float64) / MERCATOR_RADIUS)))
+    return lats, lngs
+
+
+def parse_intersections(text):
+    """
+    Parse intersection input.
+    Returns (lats, lngs, road_names) where road_names[i] is the list of roads at intersection i.
+    Whitespace inside names is dropped, as the C++ reader does.
+    """
+    count_match = re.match(r'\s*(\d+)', text)
+    if not count_match:
+        raise ValueError("Intersection input must start with the intersection count")
+    count = int(count_match.group(1))
+
+    xs = np.empty(count, dtype=np.float64)
+    ys = np.empty(count, dtype=np.float64)
+    road_names = []
+    position = count_match.end()
+
+    for i in range(count):
+        match = INTERSECTION_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"Intersection {i} is malformed or missing")
+        xs[i] = float(match.group(1))
+        ys[i] = float(match.group(2))
+        names = ''.join(match.group(3).split()).split('&')
+        road_names.append([name for name in names if name])
+        position = match.end()
+
+    lats, lngs = mercator_to_lat_lng(xs, ys)
+    return lats, lngs, road_names
+
+
+def road_adjacency(lats, lngs, road_names, max_link_meters=DEFAULT_MAX_LINK_METERS):
+    """
+    Undirected edges between consecutive intersections on each road.
+
+    Every road's intersections are ordered along the road's principal axis,
+    the direction in which they are most spread out, and each is linked to
+    the next one. All roads are handled together with grouped sums, so the
+    cost is a sort of the (intersection, road) pairs.
+    Returns (sources, targets) arrays.
+    """
+    # Hash index from road name to a road id, and the (intersection, road) pairs
+    road_ids = {}
+    pair_nodes, pair_roads = [], []
+    for node, names in enumerate(road_names):
+        for name in names:
+            pair_nodes.append(node)
+            pair_roads.append(road_ids.setdefault(name, len(road_ids)))
+
+    if not pair_nodes:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    pair_nodes = np.asarray(pair_nodes, dtype=np.int64)
+    pair_roads = np.asarray(pair_roads, dtype=np.int64)
+    road_count = len(road_ids)
+
+    # Local flat coordinates in meters
+    lat0 = np.radians(np.mean(lats))
+    x = (lngs[pair_nodes] - np.mean(lngs)) * METERS_PER_DEGREE * np.cos(lat0)
+    y = (lats[pair_nodes] - np.mean(lats)) * METERS_PER_DEGREE
+
+    # Principal axis of each road from its coordinate covariance
+    sizes = np.bincount(pair_roads, minlength=road_count)
+    dx = x - (np.bincount(pair_roads, weights=x, minlength=road_count) / sizes)[pair_roads]
+    dy = y - (np.bincount(pair_roads, weights=y, minlength=road_count) / sizes)[pair_roads]
+    sxx = np.bincount(pair_roads, weights=dx * dx, minlength=road_count)
+    syy = np.bincount(pair_roads, weights=dy * dy, minlength=road_count)
+    sxy = np.bincount(pair_roads, weights=dx * dy, minlength=road_count)
+    angle = 0.5 * np.arctan2(2.0 * sxy, sxx - syy)
+    along = dx * np.cos(angle)[pair_roads] + dy * np.sin(angle)[pair_roads]
+
+    order = np.lexsort((along, pair_roads))
+    nodes, roads, x, y = pair_nodes[order], pair_roads[order], x[order], y[order]
+
+    # Link each intersection to the next one on the same road
+    gap = np.hypot(x[1:] - x[:-1], y[1:] - y[:-1])
+    link = (roads[1:] == roads[:-1]) & (nodes[1:] != nodes[:-1]) & (gap <= max_link_meters)
+    sources, targets = nodes[:-1][link], nodes[1:][link]
+
+    # Intersections sharing more than one road would otherwise be linked twice
+    pairs = np.unique(np.column_stack((np.minimum(sources, targets), np.maximum(sources, targets))), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def build_road_graph(text, max_link_meters=DEFAULT_MAX_LINK_METERS):
+    """RoadGraph from intersection input, with two-way edges between neighbouring intersections"""
+    lats, lngs, road_names = parse_intersections(text)
+    sources, targets = road_adjacency(lats, lngs, road_names, max_link_meters)
+    return RoadGraph.from_edges(lats, lngs, sources, targets)
+
+
+def with_crime_weights(graph, csv_path=CRIME_DATA_PATH):
+    """Graph with the violent crime exposure of every edge precomputed from the crime CSV"""
+    df, category_table, source = load_processed_crime_data(csv_path, DEFAULT_VIOLENT_CRIME_TYPES)
+    dataset = CrimeDataset(df, category_table, source)
+    exposure = graph.edge_crime_exposure(
+        dataset.index.latitudes[dataset.is_violent], dataset.index.longitudes[dataset.is_violent]
+    )
+    return graph.with_crime_exposure(exposure, dataset.fingerprint())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the routing graph from an intersection list")
+    parser.add_argument('input', help="Intersection file in the AAASENavigationBasicGraph format")
+    parser.add_argument('--output', default=ROAD_GRAPH_PATH, help="Where to write the graph")
+    parser.add_argument('--max-link-meters', type=float, default=DEFAULT_MAX_LINK_METERS,
+                        help="Longest link allowed between neighbouring intersections")
+    parser.add_argument('--crime-csv', default=CRIME_DATA_PATH, help="Crime data for the edge crime weights")
+    parser.add_argument('--no-crime-weights', action='store_true',
+                        help="Skip crime weights; the server computes them when it loads the graph")
+    parser.add_argument('--no-landmarks', action='store_true',
+                        help="Skip landmark tables; the server builds them in the background")
+    args = parser.parse_args()
+
+    start = time.time()
+    with open(args.input) as f:
+        graph = build_road_graph(f.read(), args.max_link_meters)
+    if not args.no_crime_weights:
+        graph = with_crime_weights(graph, args.crime_csv)
+
+    # Stage the graph and read it back through the checksum before anything serves it
+    staging_path = args.output + '.new'
+    graph.save(staging_path)
+    graph = RoadGraph.load(staging_path, verify=True)
+
+    # Landmarks go into place first, so a server that picks up the new graph finds matching tables
+    if not args.no_landmarks:
+        LandmarkTables.build(graph, graph.crime_exposure).save(landmarks_path(args.output))
+    os.replace(staging_path, args.output)
+
+    print(f"Wrote {graph.node_count} intersections and {graph.edge_count} road edges "
+          f"to {args.output} in {time.time() - start:.1f}s (sha256 {graph.checksum[:16]})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Shared HTTP client for the external services (Google Maps, Routes, GNews,
+Nominatim).
+
+One requests.Session is shared by every request thread, with its own
+connection pool per service, so calls reuse kept-alive connections
+instead of paying a TCP and TLS handshake each time. Each service has its
+own timeouts and retries. Connection failures and 5xx responses are
+retried a bounded number of times with jittered exponential backoff, and
+a 429 is never retried, since that would only spend more quota. Every
+call is timed and counted per service for /api/health.
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Seconds to wait for a connection to open, and for a response once connected
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Connections kept alive per service; one per concurrent request thread is plenty
+DEFAULT_POOL_SIZE = 16
+
+# Responses worth another try: the server had a transient failure
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class Service:
+    """
+    How to talk to one external service: requests to URLs starting with
+    base_url get these timeouts and retries, and default headers.
+    retry_methods lists the methods safe to repeat after the request was sent.
+    """
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, retries=2, backoff=0.25,
+                 retry_methods=('GET',), headers=None, pool_size=DEFAULT_POOL_SIZE):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_methods = retry_methods
+        self.headers = headers or {}
+        self.pool_size = pool_size
+
+    def retry(self):
+        return Retry(
+            total=self.retries, connect=self.retries, read=self.retries, status=self.retries,
+            backoff_factor=self.backoff, backoff_jitter=self.backoff,
+            status_forcelist=RETRY_STATUSES, allowed_methods=frozenset(self.retry_methods),
+            raise_on_status=False, respect_retry_after_header=True
+        )
+
+
+def _empty_stats():
+    return {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+
+
+class HttpClient:
+    """Pooled session over a set of named services"""
+
+    def __init__(self, services):
+        self.services = dict(services)
+        self.session = requests.Session()
+        for service in self.services.values():
+            self.session.mount(service.base_url, HTTPAdapter(
+                pool_connections=1, pool_maxsize=service.pool_size, max_retries=service.retry()
+            ))
+        self._stats = {name: _empty_stats() for name in self.services}
+        self._lock = threading.Lock()
+
+    def request(self, service_name, method, url, **kwargs):
+        """
+        Send a request through a service's pool with its timeouts and
+        retries; raises requests.RequestException like requests.request.
+        """
+        service = self.services[service_name]
+        kwargs.setdefault('timeout', service.timeout)
+        if service.headers:
+            kwargs['headers'] = {**service.headers, **(kwargs.get('headers') or {})}
+
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, url, **kwargs)
+            failed = response.status_code >= 400
+            return response
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            with self._lock:
+                stats = self._stats[service_name]
+                stats['calls'] += 1
+                stats['errors'] += failed
+                stats['total_ms'] += elapsed
+                stats['max_ms'] = max(stats['max_ms'], elapsed)
+
+    def get(self, service_name, url, **kwargs):
+        return self.request(service_name, 'GET', url, **kwargs)
+
+    def post(self, service_name, url, **kwargs):
+        return self.request(service_name, 'POST', url, **kwargs)
+
+    def stats(self):
+        """Calls, failed calls and timing per service, in milliseconds"""
+        with self._lock:
+            return {
+                name: {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'mean_ms': round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else None,
+                    'max_ms': round(stats['max_ms'], 1)
+                }
+                for name, stats in self._stats.items()
+            }
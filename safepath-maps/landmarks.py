@@ -0,0 +1,260 @@
+"""
+Landmark (ALT) lower bounds for A* over the crime-weighted road graph.
+
+A handful of landmark nodes spread over the graph have their cost to and
+from every node precomputed. By the triangle inequality, for any landmark
+L the cost from v to t is at least d(L, t) - d(L, v) and d(v, L) - d(t, L),
+which is a much tighter A* bound than the straight-line distance.
+
+Route costs depend on the request's safety weight, so tables are kept for
+a few preset weights. Edge costs only grow with the weight, so the tables
+of the preset just below a requested weight w are a valid bound, and so
+are those of the preset just above scaled by w / preset. Weight 0 tables
+depend only on the graph; the others are rebuilt when crime weights change.
+
+Tables are stored next to the graph in the same memory-mapped layout.
+Building them takes seconds of CPU, so processes sharing a tables file
+take a lock next to it (build_lock) and only the holder builds; the
+others pick the new file up once it is renamed into place.
+"""
+import hashlib
+import os
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from road_graph import map_array_file, write_array_file
+from routing import edge_costs, single_source_costs
+
+LANDMARK_COUNT = 8
+
+# Safety weights that get their own tables; 0 is plain road length
+LANDMARK_WEIGHTS = (0.0, 0.25, 0.5, 1.0)
+
+# Landmarks consulted per query, the ones giving the best bound at the source
+ACTIVE_LANDMARKS = 4
+
+LANDMARK_MAGIC = b'SPLMARK\0'
+
+# Tables are float32; bounds are shrunk by this fraction so rounding never makes them overestimate
+LANDMARK_SLACK = 1e-4
+
+
+def landmarks_path(graph_path):
+    """Where the landmark tables for a graph file live"""
+    return os.path.splitext(graph_path)[0] + '.landmarks.bin'
+
+
+@contextmanager
+def build_lock(path):
+    """
+    Cross-process lock for building the tables file at path, without waiting:
+    yields True in the one process holding it and False in the others.
+    Without fcntl (Windows) every process gets it.
+    """
+    if fcntl is None:
+        yield True
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            acquired = False
+        else:
+            acquired = True
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def exposure_checksum(exposure):
+    """Identifies a set of edge crime weights"""
+    return hashlib.sha256(np.ascontiguousarray(exposure, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _is_symmetric(graph, costs):
+    """Whether every edge has a reverse twin with the same cost; then to- and from-tables are equal"""
+    forward = np.lexsort((costs, graph.targets, graph.sources))
+    backward = np.lexsort((costs, graph.sources, graph.targets))
+    return (np.array_equal(graph.sources[forward], graph.targets[backward]) and
+            np.array_equal(graph.targets[forward], graph.sources[backward]) and
+            np.array_equal(costs[forward], costs[backward]))
+
+
+def _distance_tables(graph, nodes, costs, from_tables=None):
+    """
+    (from, to) cost tables of shape (landmarks, nodes).
+    Rows of from_tables already computed are reused.
+    """
+    if from_tables is None:
+        from_tables = np.stack([
+            single_source_costs(graph.offsets, graph.targets, costs, node) for node in nodes
+        ]).astype(np.float32)
+
+    if _is_symmetric(graph, costs):
+        return from_tables, from_tables
+
+    offsets, targets, order = graph.reverse_csr()
+    reverse_costs = costs[order]
+    to_tables = np.stack([
+        single_source_costs(offsets, targets, reverse_costs, node) for node in nodes
+    ]).astype(np.float32)
+    return from_tables, to_tables
+
+
+def select_landmarks(graph, count=LANDMARK_COUNT):
+    """
+    Pick landmarks far apart by road length: each new one is the node
+    furthest from all landmarks chosen so far.
+    Returns (nodes, length tables from each landmark).
+    """
+    lengths = np.asarray(graph.lengths)
+    nodes, tables = [], []
+
+    # Start from the node furthest from an arbitrary one, which lies near the edge of the graph
+    from_start = single_source_costs(graph.offsets, graph.targets, lengths, 0)
+    nearest = from_start
+    for _ in range(min(count, graph.node_count)):
+        reachable = np.where(np.isfinite(nearest), nearest, -1.0)
+        if nodes:
+            reachable[nodes] = -1.0
+        node = int(reachable.argmax())
+        if reachable[node] <= 0 and nodes:
+            break
+        costs_from = single_source_costs(graph.offsets, graph.targets, lengths, node)
+        nodes.append(node)
+        tables.append(costs_from)
+        nearest = costs_from if len(nodes) == 1 else np.fmin(nearest, costs_from)
+
+    return np.asarray(nodes, dtype=np.int32), np.stack(tables).astype(np.float32)
+
+
+def _lower_bounds(from_tables, to_tables, active, target):
+    """Best landmark bound on the cost from every node to target"""
+    with np.errstate(invalid='ignore'):
+        bounds = np.fmax(
+            from_tables[active, target][:, None] - from_tables[active],
+            to_tables[active] - to_tables[active, target][:, None]
+        )
+        # inf - inf where neither node reaches a landmark says nothing
+        bound = np.nan_to_num(np.fmax.reduce(bounds, axis=0), nan=0.0, posinf=np.inf)
+    return np.maximum(bound, 0.0) * (1.0 - LANDMARK_SLACK)
+
+
+def _active_landmarks(from_tables, to_tables, source, target):
+    with np.errstate(invalid='ignore'):
+        at_source = np.fmax(
+            from_tables[:, target] - from_tables[:, source],
+            to_tables[:, source] - to_tables[:, target]
+        )
+    return np.argsort(np.nan_to_num(at_source, nan=-np.inf))[-ACTIVE_LANDMARKS:]
+
+
+def _weight_key(weight):
+    return f"w{weight:g}"
+
+
+class LandmarkTables:
+    """
+    Landmark cost tables for one graph and one set of crime weights.
+    tables maps a safety weight to (from, to) arrays of shape (landmarks, nodes):
+    costs from each landmark to every node, and from every node to each landmark.
+    """
+
+    def __init__(self, nodes, tables, graph_checksum=None, exposure_checksum=None):
+        self.nodes = nodes
+        self.tables = tables
+        self.graph_checksum = graph_checksum
+        self.exposure_checksum = exposure_checksum
+
+    @classmethod
+    def build(cls, graph, exposure=None, count=LANDMARK_COUNT):
+        """Select landmarks and compute their tables; weighted tables only when exposure is given"""
+        nodes, from_length = select_landmarks(graph, count)
+        tables = {0.0: _distance_tables(graph, nodes, np.asarray(graph.lengths), from_length)}
+        landmarks = cls(nodes, tables, graph.checksum)
+        if exposure is None:
+            return landmarks
+        return landmarks.with_crime_tables(graph, exposure)
+
+    def with_crime_tables(self, graph, exposure):
+        """Same landmarks with weighted tables for new crime weights"""
+        tables = {0.0: self.tables[0.0]}
+        for weight in LANDMARK_WEIGHTS:
+            if weight > 0:
+                tables[weight] = _distance_tables(
+                    graph, self.nodes, np.asarray(edge_costs(graph, exposure, weight), dtype=np.float64)
+                )
+        return LandmarkTables(self.nodes, tables, self.graph_checksum, exposure_checksum(exposure))
+
+    def usable_for(self, checksum):
+        """These tables for routing with the given crime weights, without weighted tables that are stale"""
+        if checksum == self.exposure_checksum:
+            return self
+        return LandmarkTables(self.nodes, {0.0: self.tables[0.0]}, self.graph_checksum)
+
+    def _bound(self, weight, source, target, reverse):
+        from_tables, to_tables = self.tables[weight]
+        if reverse:
+            # Bounds on the cost from source instead: the same inequalities with the tables swapped
+            from_tables, to_tables = to_tables, from_tables
+            source, target = target, source
+        active = _active_landmarks(from_tables, to_tables, source, target)
+        return _lower_bounds(from_tables, to_tables, active, target)
+
+    def heuristic(self, graph, source, target, safety_weight, reverse=False, straight_line=None):
+        """
+        Lower bound on the cost from every node to target at this safety weight,
+        or with reverse, on the cost from source to every node. Callers running
+        several searches can pass the straight-line distances to reuse them.
+        """
+        bound = graph.straight_line_meters(source if reverse else target) if straight_line is None else straight_line
+
+        below = max(weight for weight in self.tables if weight <= safety_weight)
+        bound = np.maximum(bound, self._bound(below, source, target, reverse))
+
+        above = [weight for weight in self.tables if weight > safety_weight]
+        if above and safety_weight > 0 and below != safety_weight:
+            weight = min(above)
+            bound = np.maximum(bound, (safety_weight / weight) * self._bound(weight, source, target, reverse))
+
+        return bound
+
+    @classmethod
+    def load(cls, path, verify=True):
+        """Memory-map tables written by save(); raises ValueError for bad files"""
+        header, arrays = map_array_file(path, LANDMARK_MAGIC, verify)
+        shape = (header['landmark_count'], header['node_count'])
+
+        tables = {}
+        for weight in header['weights']:
+            key = _weight_key(weight)
+            from_tables = arrays[f"from_{key}"].reshape(shape)
+            # Symmetric graphs store only the from-tables
+            to_tables = arrays[f"to_{key}"].reshape(shape) if f"to_{key}" in arrays else from_tables
+            tables[weight] = (from_tables, to_tables)
+
+        return cls(arrays['nodes'], tables, header['graph_checksum'], header.get('exposure_checksum'))
+
+    def save(self, path):
+        arrays = {'nodes': self.nodes}
+        for weight, (from_tables, to_tables) in self.tables.items():
+            key = _weight_key(weight)
+            arrays[f"from_{key}"] = from_tables.ravel()
+            if to_tables is not from_tables:
+                arrays[f"to_{key}"] = to_tables.ravel()
+
+        write_array_file(path, LANDMARK_MAGIC, arrays, {
+            'landmark_count': len(self.nodes),
+            'node_count': self.tables[0.0][0].shape[1],
+            'weights': sorted(self.tables),
+            'graph_checksum': self.graph_checksum,
+            'exposure_checksum': self.exposure_checksum
+        })
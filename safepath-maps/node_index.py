@@ -0,0 +1,108 @@
+"""
+Nearest road node lookups.
+
+Nodes are projected onto a flat plane in meters around the middle of the
+graph, which is accurate to a fraction of a percent across a city, and
+stored in a KD-tree: the nodes are split in half at the median of their
+wider coordinate, over and over, until each leaf holds a few dozen. A
+lookup walks down to the leaf around the point and only visits other
+branches whose split line is closer than the best node found so far, so
+it touches a few leaves instead of every node.
+"""
+import numpy as np
+
+from geo import EARTH_RADIUS_METERS
+
+METERS_PER_DEGREE = EARTH_RADIUS_METERS * np.pi / 180.0
+
+# Nodes per leaf; leaves are scanned with NumPy, so a few dozen cost about as much as one
+LEAF_SIZE = 32
+
+
+class NodeKDTree:
+    """
+    KD-tree over node coordinates.
+    Internal tree nodes split on axis (0 east-west, 1 north-south) at value;
+    leaves cover positions start to end of the nodes in tree order.
+    """
+
+    def __init__(self, lats, lngs, leaf_size=LEAF_SIZE):
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        self.origin_lat = float((lats.min() + lats.max()) / 2) if len(lats) else 0.0
+        self.origin_lng = float((lngs.min() + lngs.max()) / 2) if len(lngs) else 0.0
+        self.x_scale = METERS_PER_DEGREE * np.cos(np.radians(self.origin_lat))
+
+        coords = np.stack([(lngs - self.origin_lng) * self.x_scale, (lats - self.origin_lat) * METERS_PER_DEGREE])
+        order = np.arange(len(lats))
+
+        # Tree nodes as parallel lists; children are -1 for leaves
+        self.axis, self.value, self.left, self.right, self.start, self.end = [], [], [], [], [], []
+        self._add(0, len(lats))
+        pending = [0]
+        while pending:
+            tree_node = pending.pop()
+            start, end = self.start[tree_node], self.end[tree_node]
+            if end - start <= leaf_size:
+                continue
+
+            span = order[start:end]
+            axis = int(np.ptp(coords[1, span]) > np.ptp(coords[0, span]))
+            middle = (end - start) // 2
+            span = span[np.argpartition(coords[axis, span], middle)]
+            order[start:end] = span
+
+            self.axis[tree_node] = axis
+            self.value[tree_node] = float(coords[axis, span[middle]])
+            self.left[tree_node] = self._add(start, start + middle)
+            self.right[tree_node] = self._add(start + middle, end)
+            pending += [self.left[tree_node], self.right[tree_node]]
+
+        self.nodes = order
+        self.xs = np.ascontiguousarray(coords[0, order])
+        self.ys = np.ascontiguousarray(coords[1, order])
+
+    def _add(self, start, end):
+        self.axis.append(0)
+        self.value.append(0.0)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.start.append(start)
+        self.end.append(end)
+        return len(self.start) - 1
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def nearest(self, lat, lng):
+        """(node, planar distance in meters) of the node closest to a point, (-1, inf) when empty"""
+        point = ((lng - self.origin_lng) * self.x_scale, (lat - self.origin_lat) * METERS_PER_DEGREE)
+        best, best_squared = -1, np.inf
+        if not len(self.nodes):
+            return best, best_squared
+
+        # (tree node, lower bound on the squared distance to anything under it)
+        pending = [(0, 0.0)]
+        while pending:
+            tree_node, bound = pending.pop()
+            if bound >= best_squared:
+                continue
+
+            left = self.left[tree_node]
+            if left < 0:
+                start, end = self.start[tree_node], self.end[tree_node]
+                dx = self.xs[start:end] - point[0]
+                dy = self.ys[start:end] - point[1]
+                squared = dx * dx + dy * dy
+                i = int(squared.argmin())
+                if squared[i] < best_squared:
+                    best, best_squared = start + i, float(squared[i])
+                continue
+
+            offset = point[self.axis[tree_node]] - self.value[tree_node]
+            near, far = (left, self.right[tree_node]) if offset <= 0 else (self.right[tree_node], left)
+            # Visit the near side first; the far side only matters if the split line is closer than the best
+            pending.append((far, max(bound, offset * offset)))
+            pending.append((near, bound))
+
+        return int(self.nodes[best]), float(np.sqrt(best_squared))
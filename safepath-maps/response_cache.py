@@ -0,0 +1,447 @@
+"""
+In-memory cache for responses from the external APIs (geocoding, places,
+news).
+
+Entries live in namespaces, one per kind of response, each with its own
+time to live. The cache as a whole is bounded by an entry count and an
+approximate memory budget; when either is exceeded the least recently
+used entries are evicted first. Expired entries are dropped when they are
+read and by a background sweep, so keys that are never asked for again
+don't linger until eviction. Hits, misses, evictions and expirations are
+counted per namespace for /api/health.
+
+Concurrent misses on the same key wait on a single fetch (get_or_fetch),
+so a burst of identical requests costs one call to the external API.
+
+Namespaces given a store TTL are also written through to a shared store:
+a SQLite file on the local disk, or Redis when configured. Every worker
+process reads the same store, and it survives restarts, so a response
+fetched once is reused by all workers and after deploys. Store values are
+JSON, and store errors only cost the shared hit, never the request.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# Store failures that are logged and treated as a miss
+STORE_ERRORS = (sqlite3.Error, OSError, ValueError) + ((redis.RedisError,) if redis else ())
+
+# Time to live for namespaces without their own
+DEFAULT_CACHE_TTL = 300
+
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# How often the background sweep drops expired entries, in seconds
+DEFAULT_PURGE_INTERVAL = 60
+
+# Rows kept in a SQLite store; the ones closest to expiring go first
+DEFAULT_STORE_MAX_ENTRIES = 100000
+
+# Rough per-entry overhead of the key, the entry tuple and the ordering, in bytes
+ENTRY_OVERHEAD_BYTES = 200
+
+
+def estimate_size(value):
+    """Approximate memory used by a JSON-like value, in bytes"""
+    try:
+        return len(json.dumps(value, default=str)) + ENTRY_OVERHEAD_BYTES
+    except (TypeError, ValueError):
+        return ENTRY_OVERHEAD_BYTES
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one: the first caller
+    runs the function, and callers arriving while it runs wait for it and
+    get its result (or its exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [done event, result, exception]
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+
+        try:
+            call[1] = function()
+            return call[1]
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'shared': self.shared, 'in_flight': len(self._calls)}
+
+
+def _empty_stats():
+    return {'hits': 0, 'store_hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'expirations': 0}
+
+
+class SQLiteCacheStore:
+    """
+    Cache entries in a SQLite file shared by every worker on the host.
+    Expiry times are wall-clock, since they outlive the process. Each thread
+    (and each forked worker) opens its own connection.
+    """
+
+    backend = 'sqlite'
+
+    def __init__(self, path, max_entries=DEFAULT_STORE_MAX_ENTRIES, timeout=1.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)")
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            # Readers in other workers don't block on a writer
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, namespace, key):
+        """(value, expires) or None"""
+        row = self._connection().execute(
+            "SELECT value, expires FROM cache WHERE namespace = ? AND key = ? AND expires > ?",
+            (namespace, key, time.time())
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def set(self, namespace, key, value, ttl):
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), time.time() + ttl)
+            )
+
+    def delete(self, namespace, key):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace=None):
+        with self._connection() as connection:
+            if namespace is None:
+                connection.execute("DELETE FROM cache")
+            else:
+                connection.execute("DELETE FROM cache WHERE namespace = ?", (namespace,))
+
+    def purge_expired(self):
+        """Drop expired rows, then the soonest to expire beyond max_entries"""
+        with self._connection() as connection:
+            dropped = connection.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),)).rowcount
+            dropped += connection.execute(
+                "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            ).rowcount
+        return dropped
+
+    def stats(self):
+        entries = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {'backend': self.backend, 'path': self.path, 'entries': entries}
+
+
+class RedisCacheStore:
+    """
+    Cache entries in Redis, shared by every worker on every host. Redis
+    expires keys itself. client is a redis.Redis or anything with the same
+    get / set(ex=) / delete / scan_iter / ttl methods, such as a local
+    stand-in in tests.
+    """
+
+    backend = 'redis'
+
+    def __init__(self, client, prefix='safepath:cache:'):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace, key):
+        full_key = self._key(namespace, key)
+        value = self.client.get(full_key)
+        if value is None:
+            return None
+        ttl = self.client.ttl(full_key)
+        return json.loads(value), time.time() + (ttl if ttl and ttl > 0 else 0)
+
+    def set(self, namespace, key, value, ttl):
+        self.client.set(self._key(namespace, key), json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, namespace, key):
+        self.client.delete(self._key(namespace, key))
+
+    def clear(self, namespace=None):
+        pattern = f"{self.prefix}{namespace}:*" if namespace is not None else f"{self.prefix}*"
+        keys = list(self.client.scan_iter(match=pattern))
+        if keys:
+            self.client.delete(*keys)
+
+    def purge_expired(self):
+        return 0
+
+    def stats(self):
+        return {'backend': self.backend}
+
+
+def open_cache_store(redis_url=None, sqlite_path=None):
+    """
+    Shared store for a ResponseCache: Redis when a URL is given and the
+    redis package is installed, else a SQLite file when a path is given,
+    else None. Failures to open one are printed and fall through.
+    """
+    if redis_url:
+        if redis is None:
+            print("CACHE_REDIS_URL is set but the redis package is not installed")
+        else:
+            try:
+                client = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+                client.ping()
+                return RedisCacheStore(client)
+            except redis.RedisError as e:
+                print(f"Error connecting to cache Redis: {e}")
+    if sqlite_path:
+        try:
+            return SQLiteCacheStore(sqlite_path)
+        except sqlite3.Error as e:
+            print(f"Error opening cache database {sqlite_path}: {e}")
+    return None
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with per-namespace TTLs.
+    ttls maps a namespace to its time to live in seconds; other namespaces
+    use default_ttl. With a store, namespaces in store_ttls are also kept
+    there for that long and read from it on a memory miss. Safe to share
+    between request threads.
+    """
+
+    def __init__(self, ttls=None, default_ttl=DEFAULT_CACHE_TTL,
+                 max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, clock=time.monotonic,
+                 store=None, store_ttls=None):
+        self.ttls = dict(ttls or {})
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.store = store
+        self.store_ttls = dict(store_ttls or {})
+
+        # (namespace, key) -> (value, expires, size), least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._purger = None
+        self._flights = SingleFlight()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def ttl(self, namespace):
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def _count(self, namespace, stat, amount=1):
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = _empty_stats()
+        stats[stat] += amount
+
+    def _remove(self, entry_key, stat=None):
+        _, _, size = self._entries.pop(entry_key)
+        self._bytes -= size
+        if stat:
+            self._count(entry_key[0], stat)
+
+    def _stored(self, namespace):
+        return self.store is not None and namespace in self.store_ttls
+
+    def _store_call(self, method, *args):
+        """Call a store method, logging failures and returning None for them"""
+        try:
+            return getattr(self.store, method)(*args)
+        except STORE_ERRORS as e:
+            print(f"Cache store {method} error: {e}")
+            return None
+
+    def get(self, namespace, key):
+        """Cached value, or None when missing or expired in memory and in the store"""
+        entry_key = (namespace, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[1] <= self.clock():
+                self._remove(entry_key, 'expirations')
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(entry_key)
+                self._count(namespace, 'hits')
+                return entry[0]
+
+        stored = self._store_call('get', namespace, key) if self._stored(namespace) else None
+        with self._lock:
+            self._count(namespace, 'store_hits' if stored else 'misses')
+        if not stored:
+            return None
+
+        value, expires = stored
+        self._set_memory(entry_key, value, min(self.ttl(namespace), max(0.0, expires - time.time())))
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries to stay within budget"""
+        self._set_memory((namespace, key), value, self.ttl(namespace) if ttl is None else ttl)
+        with self._lock:
+            self._count(namespace, 'sets')
+        if self._stored(namespace):
+            self._store_call('set', namespace, key, value, self.store_ttls[namespace] if ttl is None else ttl)
+
+    def get_or_fetch(self, namespace, key, fetch, ttl=None):
+        """
+        Cached value, or the result of fetch() stored in the cache. Concurrent
+        misses on the same key share one fetch. fetch returns None for
+        results that shouldn't be cached, such as failures; that None is
+        returned to every caller waiting on it.
+        """
+        value = self.get(namespace, key)
+        if value is not None:
+            return value
+
+        def load():
+            # A flight that finished between the miss above and this one starting already stored the value
+            cached = self._peek((namespace, key))
+            if cached is not None:
+                return cached
+            fetched = fetch()
+            if fetched is not None:
+                self.set(namespace, key, fetched, ttl)
+            return fetched
+
+        return self._flights.do((namespace, key), load)
+
+    def _peek(self, entry_key):
+        """Unexpired value held in memory, without counting a hit or miss"""
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            return entry[0] if entry is not None and entry[1] > self.clock() else None
+
+    def _set_memory(self, entry_key, value, ttl):
+        size = estimate_size(value)
+        expires = self.clock() + ttl
+        with self._lock:
+            if entry_key in self._entries:
+                self._remove(entry_key)
+            # A value bigger than the whole budget would only evict everything else
+            if size > self.max_bytes:
+                return
+            self._entries[entry_key] = (value, expires, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)), 'evictions')
+
+    def delete(self, namespace, key):
+        with self._lock:
+            if (namespace, key) in self._entries:
+                self._remove((namespace, key))
+        if self._stored(namespace):
+            self._store_call('delete', namespace, key)
+
+    def clear(self, namespace=None):
+        """Drop every entry, or only those in one namespace, here and in the store"""
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+                self._bytes = 0
+            else:
+                for entry_key in [entry_key for entry_key in self._entries if entry_key[0] == namespace]:
+                    self._remove(entry_key)
+        if self.store is not None:
+            self._store_call('clear', namespace)
+
+    def purge_expired(self):
+        """Drop all expired entries, also from the store; returns how many were dropped from memory"""
+        with self._lock:
+            now = self.clock()
+            expired = [entry_key for entry_key, (_, expires, _) in self._entries.items() if expires <= now]
+            for entry_key in expired:
+                self._remove(entry_key, 'expirations')
+        if self.store is not None:
+            self._store_call('purge_expired')
+        return len(expired)
+
+    def start_purging(self, interval=DEFAULT_PURGE_INTERVAL):
+        """Sweep expired entries every interval seconds on a daemon thread; once per cache"""
+        with self._lock:
+            if self._purger is not None:
+                return
+            self._purger = threading.Thread(
+                target=self._purge_forever, args=(interval,), name="response-cache-purger", daemon=True
+            )
+        self._purger.start()
+
+    def _purge_forever(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.purge_expired()
+            except Exception as e:
+                print(f"Cache purge error: {e}")
+
+    def stats(self):
+        """Entry count, memory estimate and per-namespace counters"""
+        with self._lock:
+            namespaces = {namespace: dict(stats, entries=0) for namespace, stats in self._stats.items()}
+            for namespace, _ in self._entries:
+                namespaces.setdefault(namespace, dict(_empty_stats(), entries=0))['entries'] += 1
+            stats = {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'namespaces': namespaces
+            }
+        stats['coalesced'] = self._flights.stats()
+        if self.store is not None:
+            stats['store'] = self._store_call('stats')
+        return stats
@@ -0,0 +1,360 @@
+"""
+Road graph storage for in-process routing.
+
+Graphs are saved as one binary file that every worker memory-maps
+read-only, so the arrays are shared through the page cache instead of
+being parsed and copied per process. Layout:
+
+    magic (8 bytes) | header length (uint32 LE) | JSON header | arrays
+
+The header records the format version, node and edge counts, the dtype,
+offset and length of every array, and a sha256 of everything after the
+header. The data starts at the first 64-byte boundary after the header,
+array offsets are relative to it, and every array is 64-byte aligned.
+Files are written next to their destination and renamed into place, so a
+deploy can swap graphs atomically; the server reopens the file when it
+changes. Precomputed routing tables (landmarks.py) use the same layout.
+"""
+import hashlib
+import json
+import os
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from crime_index import FEET_PER_DEGREE_LAT
+from geo import EARTH_RADIUS_METERS, haversine_one_to_many, haversine_pairwise
+from node_index import NodeKDTree
+
+# Road graph used by /api/safe-route
+ROAD_GRAPH_PATH = os.getenv('ROAD_GRAPH_PATH', 'safepath-maps/road_graph.bin')
+
+GRAPH_MAGIC = b'SPGRAPH\0'
+GRAPH_FORMAT_VERSION = 1
+GRAPH_ALIGNMENT = 64
+
+# Arrays stored in a graph file and their on-disk dtypes
+GRAPH_ARRAYS = {
+    'node_lats': '<f8',
+    'node_lngs': '<f8',
+    'offsets': '<i8',
+    'targets': '<i4',
+    'sources': '<i4',
+    'lengths': '<f4',
+    'crime_exposure': '<f4'
+}
+
+# Crimes this close to a road count against it
+DEFAULT_EDGE_CORRIDOR_FEET = 150
+
+METERS_PER_FOOT = 0.3048
+
+
+class RoadGraph:
+    """
+    Directed road graph in compressed sparse row form.
+
+    The outgoing edges of node u are edge ids offsets[u] to offsets[u + 1];
+    edge e goes to targets[e] and is lengths[e] meters long. Nodes are road
+    intersections with coordinates in node_lats / node_lngs. Two-way streets
+    are stored as one edge in each direction.
+    """
+
+    def __init__(self, node_lats, node_lngs, offsets, targets, lengths, sources=None,
+                 heuristic_scale=None, crime_exposure=None, crime_data=None):
+        self.node_lats = node_lats
+        self.node_lngs = node_lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.lengths = lengths
+
+        # Per-edge violent crime exposure computed when the file was built, and
+        # the crime data it was computed from (see CrimeDataset.fingerprint)
+        self.crime_exposure = crime_exposure
+        self.crime_data = crime_data
+
+        # sha256 of the graph file this was loaded from or saved to
+        self.checksum = None
+
+        self._reverse = None
+        self._node_index = None
+
+        # Source node of every edge, for code that walks edges rather than nodes
+        if sources is None:
+            sources = np.repeat(
+                np.arange(self.node_count, dtype=np.int32), np.diff(self.offsets)
+            ).astype(np.int32)
+        self.sources = sources
+
+        # A* needs a heuristic that never overestimates. Lengths that came
+        # from elsewhere can be shorter than the straight line between the
+        # nodes, so the straight-line distance is scaled down to fit them.
+        if heuristic_scale is None:
+            straight = haversine_pairwise(
+                self.node_lats[self.sources], self.node_lngs[self.sources],
+                self.node_lats[self.targets], self.node_lngs[self.targets],
+                EARTH_RADIUS_METERS
+            )
+            positive = straight > 0
+            if positive.any():
+                heuristic_scale = float(min(1.0, (self.lengths[positive] / straight[positive]).min()))
+            else:
+                heuristic_scale = 1.0
+        self.heuristic_scale = heuristic_scale
+
+    @property
+    def node_count(self):
+        return len(self.node_lats)
+
+    @property
+    def edge_count(self):
+        return len(self.targets)
+
+    @classmethod
+    def from_edges(cls, node_lats, node_lngs, sources, targets, lengths=None, bidirectional=True):
+        """
+        Build a graph from an edge list.
+        Lengths default to the straight-line distance between the endpoints in meters.
+        """
+        node_lats = np.ascontiguousarray(node_lats, dtype=np.float64)
+        node_lngs = np.ascontiguousarray(node_lngs, dtype=np.float64)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+
+        if lengths is None:
+            lengths = haversine_pairwise(
+                node_lats[sources], node_lngs[sources], node_lats[targets], node_lngs[targets],
+                EARTH_RADIUS_METERS
+            )
+        lengths = np.asarray(lengths, dtype=np.float64)
+
+        if bidirectional:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            lengths = np.concatenate([lengths, lengths])
+
+        order = np.argsort(sources, kind='stable')
+        offsets = np.zeros(len(node_lats) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_lats)), out=offsets[1:])
+
+        return cls(
+            node_lats, node_lngs, offsets,
+            targets[order].astype(np.int32), lengths[order].astype(np.float32)
+        )
+
+    def with_crime_exposure(self, crime_exposure, crime_data):
+        """Same graph with precomputed crime exposure to store alongside it"""
+        return RoadGraph(
+            self.node_lats, self.node_lngs, self.offsets, self.targets, self.lengths, self.sources,
+            self.heuristic_scale, np.asarray(crime_exposure, dtype=np.float32), crime_data
+        )
+
+    @classmethod
+    def load(cls, path=ROAD_GRAPH_PATH, verify=True):
+        """
+        Memory-map a graph file read-only.
+        With verify, the checksum is checked first; raises ValueError for
+        files that are corrupt, truncated or from another format version.
+        """
+        header, arrays = map_array_file(path, GRAPH_MAGIC, verify)
+        graph = cls(
+            arrays['node_lats'], arrays['node_lngs'], arrays['offsets'], arrays['targets'],
+            arrays['lengths'], arrays['sources'], header['heuristic_scale'],
+            arrays.get('crime_exposure'), header.get('crime_data')
+        )
+        graph.checksum = header['sha256']
+        return graph
+
+    def save(self, path):
+        """Write the graph file atomically: a temporary file is renamed over path"""
+        arrays = {
+            name: getattr(self, name).astype(np.dtype(dtype), copy=False)
+            for name, dtype in GRAPH_ARRAYS.items() if getattr(self, name) is not None
+        }
+        self.checksum = write_array_file(path, GRAPH_MAGIC, arrays, {
+            'node_count': self.node_count,
+            'edge_count': self.edge_count,
+            'heuristic_scale': self.heuristic_scale,
+            'crime_data': self.crime_data
+        })
+
+    def node_index(self):
+        """KD-tree over the node coordinates, built on first use and kept"""
+        if self._node_index is None:
+            self._node_index = NodeKDTree(self.node_lats, self.node_lngs)
+        return self._node_index
+
+    def nearest_node(self, lat, lng):
+        """Closest node to a point as (node, distance in meters)"""
+        node, _ = self.node_index().nearest(lat, lng)
+        return node, self.node_distance(node, lat, lng)
+
+    def node_distance(self, node, lat, lng):
+        """Great-circle distance in meters from a node to a point"""
+        distance = haversine_one_to_many(
+            lat, lng, self.node_lats[node:node + 1], self.node_lngs[node:node + 1], EARTH_RADIUS_METERS
+        )
+        return float(distance[0])
+
+    def reverse_csr(self):
+        """
+        Incoming edges in CSR form: (offsets, sources, edge ids), so the edges
+        into node v are edge_ids[offsets[v]:offsets[v + 1]], coming from sources.
+        Built on first use and kept for backward searches.
+        """
+        if self._reverse is None:
+            order = np.argsort(self.targets, kind='stable')
+            offsets = np.zeros(self.node_count + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.node_count), out=offsets[1:])
+            self._reverse = (offsets, self.sources[order], order)
+        return self._reverse
+
+    def straight_line_meters(self, target):
+        """Lower bound on the remaining length from every node to target, for A*"""
+        return haversine_one_to_many(
+            self.node_lats[target], self.node_lngs[target], self.node_lats, self.node_lngs,
+            EARTH_RADIUS_METERS
+        ) * self.heuristic_scale
+
+    def edge_crime_exposure(self, crime_lats, crime_lngs, corridor_feet=DEFAULT_EDGE_CORRIDOR_FEET):
+        """
+        Expected number of crimes within corridor_feet of each edge.
+
+        Crimes are binned into square cells as wide as the corridor, and every
+        edge is sampled at half-cell spacing; an edge collects the crime
+        density of the cells it passes through, weighted by the length it
+        spends in them. This is one vectorized pass over all edges instead of
+        a radius query per edge.
+        """
+        if self.edge_count == 0 or len(crime_lats) == 0:
+            return np.zeros(self.edge_count, dtype=np.float32)
+
+        width_feet = 2.0 * corridor_feet
+        lat_step = width_feet / FEET_PER_DEGREE_LAT
+        lng_step = lat_step / max(np.cos(np.radians(np.mean(self.node_lats))), 1e-6)
+
+        def cell_keys(lats, lngs):
+            rows = np.floor((lats + 90.0) / lat_step).astype(np.int64)
+            cols = np.floor((lngs + 180.0) / lng_step).astype(np.int64)
+            return rows * (int(360.0 / lng_step) + 1) + cols
+
+        cells, counts = np.unique(cell_keys(np.asarray(crime_lats), np.asarray(crime_lngs)), return_counts=True)
+
+        # Sample points along every edge
+        cell_meters = width_feet * METERS_PER_FOOT
+        samples_per_edge = np.maximum(np.ceil(self.lengths / (cell_meters / 2.0)), 1).astype(np.int64)
+        edge_of_sample = np.repeat(np.arange(self.edge_count), samples_per_edge)
+        first_sample = np.concatenate(([0], np.cumsum(samples_per_edge)[:-1]))
+        fraction = (np.arange(len(edge_of_sample)) - first_sample[edge_of_sample] + 0.5) / samples_per_edge[edge_of_sample]
+
+        # Walk every edge from its lower-numbered end, so both directions of a street get identical weights
+        source = np.minimum(self.sources, self.targets)[edge_of_sample]
+        target = np.maximum(self.sources, self.targets)[edge_of_sample]
+        sample_lats = self.node_lats[source] + fraction * (self.node_lats[target] - self.node_lats[source])
+        sample_lngs = self.node_lngs[source] + fraction * (self.node_lngs[target] - self.node_lngs[source])
+
+        keys = cell_keys(sample_lats, sample_lngs)
+        slot = np.minimum(np.searchsorted(cells, keys), len(cells) - 1)
+        sample_counts = np.where(cells[slot] == keys, counts[slot], 0)
+
+        # Each sample stands for lengths / samples meters of road through a cell_meters-long cell
+        sample_weight = (self.lengths / samples_per_edge)[edge_of_sample] / cell_meters
+        return np.bincount(
+            edge_of_sample, weights=sample_counts * sample_weight, minlength=self.edge_count
+        ).astype(np.float32)
+
+
+def _aligned(position):
+    return -(-position // GRAPH_ALIGNMENT) * GRAPH_ALIGNMENT
+
+
+def write_array_file(path, magic, arrays, header):
+    """
+    Write named 1-D arrays and a header dict in the memory-mappable layout.
+    Returns the sha256 of the data, which is also stored in the header.
+    """
+    arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+
+    # Offsets are from the start of the data, which follows the header at the next aligned position
+    layout, position = {}, 0
+    digest = hashlib.sha256()
+    for name, array in arrays.items():
+        layout[name] = {'dtype': array.dtype.str, 'offset': position, 'length': len(array)}
+        position = _aligned(position + array.nbytes)
+        digest.update(array.tobytes())
+        digest.update(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+
+    encoded = json.dumps(dict(
+        header,
+        format_version=GRAPH_FORMAT_VERSION,
+        created_at=datetime.now().isoformat(),
+        sha256=digest.hexdigest(),
+        arrays=layout
+    ), sort_keys=True).encode()
+    data_offset = _aligned(len(magic) + 4 + len(encoded))
+
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(magic)
+            f.write(struct.pack('<I', len(encoded)))
+            f.write(encoded)
+            f.write(b'\0' * (data_offset - f.tell()))
+            for array in arrays.values():
+                f.write(array.tobytes())
+                f.write(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return digest.hexdigest()
+
+
+def read_array_file_header(path, magic=GRAPH_MAGIC):
+    """Header of a file written by write_array_file and the offset its data starts at"""
+    with open(path, 'rb') as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not the expected kind of file")
+        (header_length,) = struct.unpack('<I', f.read(4))
+        try:
+            header = json.loads(f.read(header_length))
+        except ValueError:
+            raise ValueError(f"{path} has a corrupt header")
+
+    if header.get('format_version') != GRAPH_FORMAT_VERSION:
+        raise ValueError(
+            f"{path} has format version {header.get('format_version')}, "
+            f"expected {GRAPH_FORMAT_VERSION}; rebuild it with graph_builder.py"
+        )
+    return header, _aligned(len(magic) + 4 + header_length)
+
+
+def map_array_file(path, magic=GRAPH_MAGIC, verify=True):
+    """Header and read-only memory-mapped arrays of a file written by write_array_file"""
+    header, data_offset = read_array_file_header(path, magic)
+    if verify:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            f.seek(data_offset)
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        if digest.hexdigest() != header['sha256']:
+            raise ValueError(f"{path} failed its checksum")
+
+    arrays = {}
+    for name, spec in header['arrays'].items():
+        if spec['length'] == 0:
+            # mmap can't map zero bytes
+            arrays[name] = np.empty(0, dtype=np.dtype(spec['dtype']))
+            continue
+        mapped = np.memmap(
+            path, dtype=np.dtype(spec['dtype']), mode='r',
+            offset=data_offset + spec['offset'], shape=(spec['length'],)
+        )
+        # Plain ndarray views over the mapping: slicing a memmap subclass costs
+        # several times more, which adds up over the thousands of slices in a search
+        arrays[name] = np.asarray(mapped)
+    return header, arrays
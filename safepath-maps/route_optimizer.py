@@ -0,0 +1,170 @@
+"""
+Visiting order for a set of points, given the cost of travelling between
+every pair of them.
+
+The open path from an optional fixed start to an optional fixed end is
+solved as a closed tour through an extra depot node. Leaving the depot is
+free, or only allowed towards the fixed start, and returning to it is free,
+only allowed from the fixed end, or costs the leg back to the start for a
+round trip. A nearest-neighbour tour is then improved with 2-opt and
+Or-opt moves until neither finds a better one. Moves are evaluated for all
+positions at once with NumPy, and reversed stretches are priced exactly
+using both directions of every leg, so costs need not be symmetric.
+"""
+import numpy as np
+
+# Or-opt moves relocate runs of up to this many points
+OR_OPT_MAX_SEGMENT = 3
+
+# Improvements smaller than this are float noise
+IMPROVEMENT_EPSILON = 1e-6
+
+
+def _depot_costs(cost, start, end):
+    """
+    Cost matrix with the depot as node 0 and the points as 1..n.
+    Forbidden legs get a finite cost larger than any real tour, so tours
+    using them lose to every allowed one without producing inf - inf.
+    """
+    count = len(cost)
+    finite = np.isfinite(cost)
+    forbidden = (float(cost[finite].sum()) if finite.any() else 0.0) + 1.0
+    forbidden *= count + 1
+
+    costs = np.zeros((count + 1, count + 1))
+    costs[1:, 1:] = np.where(finite, cost, forbidden)
+
+    if start is not None:
+        costs[0, 1:] = forbidden
+        costs[0, start + 1] = 0.0
+    if end is not None and end == start:
+        costs[1:, 0] = costs[1:, start + 1]
+        costs[start + 1, 0] = forbidden
+    elif end is not None:
+        costs[1:, 0] = forbidden
+        costs[end + 1, 0] = 0.0
+    np.fill_diagonal(costs, 0.0)
+    return costs
+
+
+def _nearest_neighbor(costs):
+    """Tour starting at the depot that always moves to the cheapest unvisited node"""
+    tour = [0]
+    unvisited = np.ones(len(costs), dtype=bool)
+    unvisited[0] = False
+    for _ in range(len(costs) - 1):
+        options = np.where(unvisited, costs[tour[-1]], np.inf)
+        node = int(options.argmin())
+        tour.append(node)
+        unvisited[node] = False
+    return np.asarray(tour)
+
+
+def _leg_sums(costs, tour):
+    """Prefix sums of the tour's legs walked forwards and backwards"""
+    following = np.roll(tour, -1)
+    forward = np.concatenate(([0.0], np.cumsum(costs[tour, following])))
+    backward = np.concatenate(([0.0], np.cumsum(costs[following, tour])))
+    return forward, backward
+
+
+def _best_two_opt(costs, tour):
+    """Best reversal of tour[i..j]; returns (gain, i, j)"""
+    size = len(tour)
+    forward, backward = _leg_sums(costs, tour)
+    i, j = np.triu_indices(size, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+    before, after = tour[i - 1], tour[(j + 1) % size]
+
+    change = (costs[before, tour[j]] + costs[tour[i], after] - costs[before, tour[i]] - costs[tour[j], after]
+              + (backward[j] - backward[i]) - (forward[j] - forward[i]))
+    if not change.size:
+        return 0.0, 0, 0
+    best = int(change.argmin())
+    return -float(change[best]), int(i[best]), int(j[best])
+
+
+def _best_or_opt(costs, tour):
+    """
+    Best move of a run of 1 to OR_OPT_MAX_SEGMENT points to another gap in the tour,
+    as is or reversed; returns (gain, first, length, gap, reversed).
+    """
+    size = len(tour)
+    forward, backward = _leg_sums(costs, tour)
+    best = (0.0, 0, 0, 0, False)
+
+    for length in range(1, min(OR_OPT_MAX_SEGMENT, size - 2) + 1):
+        # Runs tour[first:first + length] that leave the depot in place
+        first = np.arange(1, size - length + 1)
+        last = first + length - 1
+        before, after = tour[first - 1], tour[(last + 1) % size]
+        removed = costs[before, tour[first]] + costs[tour[last], after] - costs[before, after]
+        internal_reversal = (backward[last] - backward[first]) - (forward[last] - forward[first])
+
+        # Gaps between tour[gap] and tour[gap + 1] outside the run and not next to it
+        gap = np.arange(size)
+        left, right = tour[gap], tour[(gap + 1) % size]
+        valid = (gap[None, :] < first[:, None] - 1) | (gap[None, :] > last[:, None])
+        inserted = costs[left[None, :], tour[first][:, None]] + costs[tour[last][:, None], right[None, :]]
+        inserted_reversed = (costs[left[None, :], tour[last][:, None]] + costs[tour[first][:, None], right[None, :]]
+                             + internal_reversal[:, None])
+        opened = costs[left, right][None, :]
+
+        for reverse, added in ((False, inserted), (True, inserted_reversed)):
+            gain = np.where(valid, removed[:, None] + opened - added, -np.inf)
+            row, column = np.unravel_index(int(gain.argmax()), gain.shape)
+            if gain[row, column] > best[0]:
+                best = (float(gain[row, column]), int(first[row]), length, int(gap[column]), reverse)
+    return best
+
+
+def _apply_or_opt(tour, first, length, gap, reverse):
+    run = tour[first:first + length]
+    if reverse:
+        run = run[::-1]
+    rest = np.concatenate((tour[:first], tour[first + length:]))
+    # Gap indices after the run shift left once it is taken out
+    position = gap + 1 if gap < first else gap + 1 - length
+    return np.concatenate((rest[:position], run, rest[position:]))
+
+
+def tour_cost(cost, order, round_trip=False):
+    """Total cost of visiting points in order; inf when a leg is unreachable"""
+    order = np.asarray(order, dtype=np.int64)
+    legs = cost[order[:-1], order[1:]]
+    total = float(legs.sum()) if len(order) > 1 else 0.0
+    if round_trip and len(order) > 1:
+        total += float(cost[order[-1], order[0]])
+    return total if np.isfinite(total) else float('inf')
+
+
+def optimize_order(cost, start=None, end=None):
+    """
+    Cheap visiting order of all points for an (n, n) cost matrix, NaN or inf
+    where one point can't reach another. start and end pin the first and
+    last point; end equal to start makes it a round trip that returns there.
+    Returns the order as a list of point indices (the start is not repeated).
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    count = len(cost)
+    if count <= 1:
+        return list(range(count))
+    if end is not None and end == start and count == 2:
+        return [start, 1 - start]
+
+    costs = _depot_costs(np.where(np.isnan(cost), np.inf, cost), start, end)
+    tour = _nearest_neighbor(costs)
+
+    while True:
+        gain, i, j = _best_two_opt(costs, tour)
+        if gain > IMPROVEMENT_EPSILON:
+            tour = np.concatenate((tour[:i], tour[i:j + 1][::-1], tour[j + 1:]))
+            continue
+        gain, first, length, gap, reverse = _best_or_opt(costs, tour)
+        if gain > IMPROVEMENT_EPSILON:
+            tour = _apply_or_opt(tour, first, length, gap, reverse)
+            continue
+        break
+
+    return [int(node) - 1 for node in tour[1:]]
@@ -0,0 +1,382 @@
+import re
+
+import numpy as np
+
+from crime_index import FEET_PER_DEGREE_LAT
+from geo import EARTH_RADIUS_METERS, haversine_pairwise
+
+# Crimes this close to a route count as exposure
+DEFAULT_CORRIDOR_FEET = 150
+MAX_CORRIDOR_FEET = 2000
+
+# 0 ranks routes purely by travel time, 1 purely by crime exposure
+DEFAULT_SAFETY_WEIGHT = 0.5
+
+# Routes API payloads have no steps, so breakdowns use fixed-length pieces
+ROUTE_SEGMENT_METERS = 500
+
+# Limits on client-supplied routes; Directions returns at most a handful of alternatives
+MAX_SCORED_ROUTES = 5
+MAX_ROUTE_POINTS = 10000
+MAX_ROUTE_METERS = 500000
+
+# Consecutive path segments are scored together while their bounding box stays this small
+CHUNK_DEGREES = 0.003
+CHUNK_MAX_SEGMENTS = 32
+
+# Encoded polylines only use the 64 characters from '?' to '~'
+POLYLINE_PATTERN = re.compile(r'[?-~]*')
+
+
+def is_encoded_polyline(encoded):
+    """Whether a value is a string decode_polyline can read"""
+    return isinstance(encoded, str) and POLYLINE_PATTERN.fullmatch(encoded) is not None
+
+
+def decode_polyline(encoded):
+    """
+    Decode a Google encoded polyline string into (lats, lngs) arrays.
+    Raises ValueError for characters outside the encoding.
+    """
+    if not is_encoded_polyline(encoded):
+        raise ValueError("Not an encoded polyline")
+    chunks = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    if len(chunks) == 0:
+        return np.empty(0), np.empty(0)
+
+    # Each value is a run of 5-bit chunks, least significant first; the last one has bit 0x20 clear
+    last = chunks < 0x20
+    value_ids = np.concatenate(([0], np.cumsum(last)[:-1]))
+    value_starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    shifts = 5 * (np.arange(len(chunks)) - value_starts[value_ids])
+    values = np.bincount(value_ids, weights=(chunks & 0x1f) << shifts).astype(np.int64)
+
+    # Zigzag-encoded deltas, alternating lat and lng
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    if len(deltas) % 2:
+        deltas = deltas[:-1]
+    points = np.cumsum(deltas.reshape(-1, 2), axis=0) / 1e5
+
+    return points[:, 0], points[:, 1]
+
+
+def _segment_distances_sq_feet(lats, lngs, seg_lats, seg_lngs):
+    """
+    Squared distance from each point to each segment, shape (points, segments).
+    Uses a local flat projection around the first segment, which is accurate
+    over the short spans scored together, and float32 since offsets are small.
+    """
+    lat0, lng0 = seg_lats[0, 0], seg_lngs[0, 0]
+    lng_scale = np.cos(np.radians(lat0)) * FEET_PER_DEGREE_LAT
+
+    ax = ((seg_lngs[:, 0] - lng0) * lng_scale).astype(np.float32)
+    ay = ((seg_lats[:, 0] - lat0) * FEET_PER_DEGREE_LAT).astype(np.float32)
+    dx = ((seg_lngs[:, 1] - lng0) * lng_scale).astype(np.float32) - ax
+    dy = ((seg_lats[:, 1] - lat0) * FEET_PER_DEGREE_LAT).astype(np.float32) - ay
+    px = ((lngs - lng0) * lng_scale).astype(np.float32)[:, None] - ax
+    py = ((lats - lat0) * FEET_PER_DEGREE_LAT).astype(np.float32)[:, None] - ay
+
+    length_sq = dx * dx + dy * dy
+    t = (px * dx + py * dy) / np.where(length_sq > 0, length_sq, np.float32(1.0))
+    t = np.minimum(np.maximum(t, np.float32(0.0)), np.float32(1.0))
+
+    ex = px - t * dx
+    ey = py - t * dy
+    return ex * ex + ey * ey
+
+
+def corridor_exposure(index, is_violent, lats, lngs, corridor_feet=DEFAULT_CORRIDOR_FEET, crime_weight=None):
+    """
+    Violent crimes within corridor_feet of a path.
+    Every crime is counted once, on the path segment it is closest to;
+    crime_weight maps row positions to a weight to count them with instead.
+    Returns (total crimes, per-segment counts of length len(lats) - 1).
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lngs = np.asarray(lngs, dtype=np.float64)
+    if len(lats) == 1:
+        # A single point is a zero-length segment
+        lats = np.repeat(lats, 2)
+        lngs = np.repeat(lngs, 2)
+
+    segment_count = max(len(lats) - 1, 0)
+    if segment_count == 0:
+        return 0, np.zeros(0, dtype=np.int64)
+
+    lat_margin = corridor_feet / FEET_PER_DEGREE_LAT
+    found_positions, found_segments, found_distances = [], [], []
+
+    def score_chunk(first, last):
+        seg_lats = np.column_stack((lats[first:last + 1], lats[first + 1:last + 2]))
+        seg_lngs = np.column_stack((lngs[first:last + 1], lngs[first + 1:last + 2]))
+        south, north = seg_lats.min() - lat_margin, seg_lats.max() + lat_margin
+        lng_margin = lat_margin / max(np.cos(np.radians(max(abs(south), abs(north)))), 1e-6)
+        west, east = seg_lngs.min() - lng_margin, seg_lngs.max() + lng_margin
+
+        candidates = index.candidates_in_bounds(south, north, west, east)
+        candidates = candidates[is_violent[candidates]]
+
+        # Index cells are much larger than a chunk; trim to its box before the distance matrix
+        cand_lats = index.latitudes[candidates]
+        cand_lngs = index.longitudes[candidates]
+        inside = (cand_lats >= south) & (cand_lats <= north) & (cand_lngs >= west) & (cand_lngs <= east)
+        candidates = candidates[inside]
+        if len(candidates) == 0:
+            return
+
+        distances_sq = _segment_distances_sq_feet(cand_lats[inside], cand_lngs[inside], seg_lats, seg_lngs)
+        nearest = distances_sq.argmin(axis=1)
+        nearest_distance = np.sqrt(distances_sq[np.arange(len(candidates)), nearest])
+        within = nearest_distance <= corridor_feet
+
+        found_positions.append(candidates[within])
+        found_segments.append(nearest[within] + first)
+        found_distances.append(nearest_distance[within])
+
+    # Group consecutive segments into chunks with a small bounding box: one index lookup per chunk
+    lat_list, lng_list = lats.tolist(), lngs.tolist()
+    start = 0
+    south = north = lat_list[0]
+    west = east = lng_list[0]
+    for i in range(segment_count):
+        lat, lng = lat_list[i + 1], lng_list[i + 1]
+        south, north = min(south, lat), max(north, lat)
+        west, east = min(west, lng), max(east, lng)
+        too_big = north - south > CHUNK_DEGREES or east - west > CHUNK_DEGREES
+        if i > start and (too_big or i - start >= CHUNK_MAX_SEGMENTS):
+            score_chunk(start, i - 1)
+            start = i
+            south, north = min(lat_list[i], lat), max(lat_list[i], lat)
+            west, east = min(lng_list[i], lng), max(lng_list[i], lng)
+    score_chunk(start, segment_count - 1)
+
+    if not found_positions:
+        return 0, np.zeros(segment_count, dtype=np.int64)
+
+    positions = np.concatenate(found_positions)
+    segments = np.concatenate(found_segments)
+    distances = np.concatenate(found_distances)
+
+    # A crime near a chunk boundary can be found twice; keep its closest segment
+    order = np.lexsort((distances, positions))
+    positions, segments = positions[order], segments[order]
+    first = np.ones(len(positions), dtype=bool)
+    first[1:] = positions[1:] != positions[:-1]
+
+    if crime_weight is not None:
+        counts = np.bincount(segments[first], weights=crime_weight(positions[first]), minlength=segment_count)
+        return float(counts.sum()), counts
+    counts = np.bincount(segments[first], minlength=segment_count)
+    return int(first.sum()), counts
+
+
+def path_length_meters(lats, lngs):
+    if len(lats) < 2:
+        return np.zeros(0)
+    return haversine_pairwise(lats[:-1], lngs[:-1], lats[1:], lngs[1:], EARTH_RADIUS_METERS)
+
+
+def _directions_route_path(route):
+    """Path and step pieces of a Directions API route"""
+    steps = [step for leg in route.get('legs', []) for step in leg.get('steps', [])]
+
+    lats, lngs, edge_piece, pieces = [], [], [], []
+    for step_number, step in enumerate(steps):
+        step_lats, step_lngs = decode_polyline(step.get('polyline', {}).get('points', ''))
+        if len(step_lats) == 0:
+            continue
+        # The edge joining the previous step to this one belongs to this step
+        edges = len(step_lats) - 1 + (1 if lats else 0)
+        lats.extend(step_lats)
+        lngs.extend(step_lngs)
+        edge_piece.extend([len(pieces)] * edges)
+        pieces.append({
+            'step': step_number,
+            'distance_meters': step.get('distance', {}).get('value'),
+            'duration_seconds': step.get('duration', {}).get('value'),
+            'start_location': step.get('start_location'),
+            'end_location': step.get('end_location')
+        })
+
+    if not lats:
+        # No step detail; fall back to the overview polyline as a single piece
+        lats, lngs = decode_polyline(route.get('overview_polyline', {}).get('points', ''))
+        edge_piece = [0] * max(len(lats) - 1, 0)
+        pieces = [{'step': 0}]
+
+    duration = sum(leg.get('duration', {}).get('value', 0) for leg in route.get('legs', []))
+    distance = sum(leg.get('distance', {}).get('value', 0) for leg in route.get('legs', []))
+
+    return np.asarray(lats), np.asarray(lngs), np.asarray(edge_piece, dtype=np.int64), pieces, duration, distance
+
+
+def _fixed_length_pieces(lats, lngs):
+    """
+    Split a path into ROUTE_SEGMENT_METERS pieces; returns (edge -> piece, pieces).
+    An edge belongs to the piece its start falls in, so an edge longer than a
+    piece is kept whole and the pieces it spans are left out.
+    """
+    lengths = path_length_meters(lats, lngs)
+    if len(lengths) == 0:
+        return np.zeros(0, dtype=np.int64), [{'segment': 0, 'distance_meters': 0.0}]
+
+    starts = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    slot = (starts // ROUTE_SEGMENT_METERS).astype(np.int64)
+    # Number the slots that have edges consecutively; slot never decreases along the path
+    edge_piece = np.concatenate(([0], np.cumsum(slot[1:] != slot[:-1]))).astype(np.int64)
+
+    count = int(edge_piece[-1]) + 1
+    distances = np.bincount(edge_piece, weights=lengths, minlength=count).round(1).tolist()
+    first = np.searchsorted(edge_piece, np.arange(count))
+    end = np.searchsorted(edge_piece, np.arange(count), side='right')
+    start_lats, start_lngs = lats[first].tolist(), lngs[first].tolist()
+    end_lats, end_lngs = lats[end].tolist(), lngs[end].tolist()
+
+    pieces = [
+        {
+            'segment': piece,
+            'distance_meters': distances[piece],
+            'start_location': {'lat': start_lats[piece], 'lng': start_lngs[piece]},
+            'end_location': {'lat': end_lats[piece], 'lng': end_lngs[piece]}
+        }
+        for piece in range(count)
+    ]
+    return edge_piece, pieces
+
+
+def route_polyline_path(encoded):
+    """
+    Decode a client-supplied route polyline into (lats, lngs).
+    Raises ValueError for one that isn't an encoded polyline or is longer
+    than MAX_ROUTE_POINTS points or MAX_ROUTE_METERS.
+    """
+    # Each point takes at most 12 characters, so longer strings can be rejected undecoded
+    if not is_encoded_polyline(encoded) or len(encoded) > 12 * MAX_ROUTE_POINTS:
+        raise ValueError(f"Each route needs an encoded polyline of at most {MAX_ROUTE_POINTS} points")
+    lats, lngs = decode_polyline(encoded)
+    if len(lats) > MAX_ROUTE_POINTS:
+        raise ValueError(f"Each route needs an encoded polyline of at most {MAX_ROUTE_POINTS} points")
+    if path_length_meters(lats, lngs).sum() > MAX_ROUTE_METERS:
+        raise ValueError(f"Routes can be at most {MAX_ROUTE_METERS // 1000} km long")
+    return lats, lngs
+
+
+def _routes_api_route_path(route):
+    """Path and fixed-length pieces of a Routes API route"""
+    lats, lngs = decode_polyline(route.get('polyline', {}).get('encodedPolyline', ''))
+    edge_piece, pieces = _fixed_length_pieces(lats, lngs)
+
+    duration = route.get('duration', '0s')
+    duration = float(duration.rstrip('s') or 0) if isinstance(duration, str) else float(duration or 0)
+    distance = route.get('distanceMeters', 0)
+
+    return lats, lngs, edge_piece, pieces, duration, distance
+
+
+def score_path(index, is_violent, lats, lngs, edge_piece, pieces, corridor_feet, crime_weight=None):
+    """Exposure summary for one path, with counts rolled up into its pieces"""
+    total, edge_counts = corridor_exposure(index, is_violent, lats, lngs, corridor_feet, crime_weight)
+
+    piece_counts = np.zeros(len(pieces), dtype=edge_counts.dtype)
+    if len(edge_counts) and len(edge_piece) == len(edge_counts):
+        np.add.at(piece_counts, edge_piece, edge_counts)
+
+    length_km = float(path_length_meters(lats, lngs).sum()) / 1000.0
+    if crime_weight is not None:
+        total = round(total, 2)
+        segments = [dict(piece, violent_crimes=round(float(count), 2)) for piece, count in zip(pieces, piece_counts)]
+    else:
+        segments = [dict(piece, violent_crimes=int(count)) for piece, count in zip(pieces, piece_counts)]
+
+    return {
+        'violent_crimes': total,
+        'exposure_per_km': round(total / length_km, 2) if length_km > 0 else 0.0,
+        'path_km': round(length_km, 3),
+        'segments': segments
+    }
+
+
+def blended_costs(durations, exposures, safety_weight):
+    """
+    Cost of each alternative relative to the best one on each axis:
+    (1 - w) * duration / fastest + w * (exposure + 1) / (lowest exposure + 1)
+    """
+    durations = np.asarray(durations, dtype=np.float64)
+    exposures = np.asarray(exposures, dtype=np.float64)
+
+    fastest = durations[durations > 0].min() if (durations > 0).any() else 1.0
+    time_cost = np.where(durations > 0, durations / fastest, 1.0)
+    safety_cost = (exposures + 1.0) / (exposures.min() + 1.0)
+
+    return (1.0 - safety_weight) * time_cost + safety_weight * safety_cost
+
+
+def rank_routes(routes, path_of, index, is_violent, safety_weight, corridor_feet, crime_weight=None):
+    """
+    Annotate each route with a `safety` summary and return them sorted by blended cost.
+    path_of(route) returns (lats, lngs, edge_piece, pieces, duration_seconds, distance_meters).
+    crime_weight optionally weights crimes by row position, e.g. by time of week.
+    """
+    summaries = []
+    for original_index, route in enumerate(routes):
+        lats, lngs, edge_piece, pieces, duration, distance = path_of(route)
+        summary = score_path(index, is_violent, lats, lngs, edge_piece, pieces, corridor_feet, crime_weight)
+        summary.update({
+            'original_index': original_index,
+            'duration_seconds': duration,
+            'distance_meters': distance,
+            'corridor_feet': corridor_feet
+        })
+        summaries.append(summary)
+
+    if not summaries:
+        return routes
+
+    costs = blended_costs(
+        [s['duration_seconds'] for s in summaries],
+        [s['violent_crimes'] for s in summaries],
+        safety_weight
+    )
+    for summary, cost in zip(summaries, costs):
+        summary['cost'] = round(float(cost), 4)
+
+    ranked = sorted(zip(routes, summaries), key=lambda pair: pair[1]['cost'])
+    return [dict(route, safety=summary) for route, summary in ranked]
+
+
+def rank_directions_routes(payload, index, is_violent, safety_weight=DEFAULT_SAFETY_WEIGHT,
+                           corridor_feet=DEFAULT_CORRIDOR_FEET, crime_weight=None):
+    """Rank the alternatives of a Directions API response in place"""
+    payload['routes'] = rank_routes(
+        payload.get('routes', []), _directions_route_path, index, is_violent, safety_weight, corridor_feet, crime_weight
+    )
+    return payload
+
+
+def rank_routes_api_routes(payload, index, is_violent, safety_weight=DEFAULT_SAFETY_WEIGHT,
+                           corridor_feet=DEFAULT_CORRIDOR_FEET, crime_weight=None):
+    """Rank the alternatives of a Routes API (computeRoutes) response in place"""
+    payload['routes'] = rank_routes(
+        payload.get('routes', []), _routes_api_route_path, index, is_violent, safety_weight, corridor_feet, crime_weight
+    )
+    return payload
+
+
+def rank_polylines(routes, index, is_violent, safety_weight=DEFAULT_SAFETY_WEIGHT,
+                   corridor_feet=DEFAULT_CORRIDOR_FEET, crime_weight=None):
+    """
+    Score client-supplied alternatives given as {"polyline", "duration_seconds"} dicts.
+    Returns their safety summaries sorted by blended cost.
+    Raises ValueError before scoring anything if any route is over the limits.
+    """
+    if len(routes) > MAX_SCORED_ROUTES:
+        raise ValueError(f"At most {MAX_SCORED_ROUTES} routes can be scored at once")
+    decoded = [{'route': route, 'path': route_polyline_path(route['polyline'])} for route in routes]
+
+    def path_of(item):
+        route, (lats, lngs) = item['route'], item['path']
+        edge_piece, pieces = _fixed_length_pieces(lats, lngs)
+        return lats, lngs, edge_piece, pieces, route.get('duration_seconds', 0), route.get('distance_meters')
+
+    ranked = rank_routes(decoded, path_of, index, is_violent, safety_weight, corridor_feet, crime_weight)
+    return [route['safety'] for route in ranked]
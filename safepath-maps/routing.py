@@ -0,0 +1,603 @@
+import heapq
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+# Detour in meters worth taking to avoid one expected violent crime, at safety_weight 1
+CRIME_PENALTY_METERS = 250.0
+
+ROUTING_ALGORITHMS = ('astar', 'dijkstra')
+
+# Idle search scratch spaces kept for reuse, about one per concurrent request
+SCRATCH_POOL_LIMIT = 8
+
+# Alternative routes: most searches per request, the largest share of an
+# alternative's length it may have in common with a route already chosen,
+# how much longer than the shortest route it may be, and the cost factor
+# applied to roads already used when looking for detours
+MAX_ALTERNATIVE_SEARCHES = 8
+MAX_ALTERNATIVE_OVERLAP = 0.7
+MAX_ALTERNATIVE_STRETCH = 1.6
+ALTERNATIVE_PENALTY = 0.6
+
+# Route matrix searches: origins per batch, batches run at once, and the
+# delta-stepping bucket width as a multiple of the mean edge cost
+MATRIX_BATCH_ORIGINS = 16
+MATRIX_WORKERS = min(4, os.cpu_count() or 1)
+MATRIX_DELTA_EDGES = 1.5
+
+
+def edge_costs(graph, exposure, safety_weight):
+    """
+    Routing cost of every edge: its length plus a crime penalty.
+    safety_weight 0 gives plain shortest paths; 1 charges CRIME_PENALTY_METERS
+    per expected violent crime along the edge. Costs never drop below the
+    length, so the straight-line A* heuristic stays admissible.
+    """
+    return graph.lengths + np.float32(safety_weight * CRIME_PENALTY_METERS) * exposure
+
+
+class SearchSpace:
+    """
+    Per-node state of one search direction, reused from query to query.
+
+    Entries only count where stamp[node] equals the current generation, so
+    starting a new search bumps the generation instead of refilling lists
+    the size of the graph. Plain lists are used because element access from
+    Python is much cheaper than on NumPy arrays.
+    """
+
+    def __init__(self, node_count):
+        self.distances = [0.0] * node_count
+        self.previous_edge = [-1] * node_count
+        self.stamp = [0] * node_count
+        self.settled = [0] * node_count
+        self.generation = 0
+
+    def reset(self):
+        self.generation += 1
+        return self.generation
+
+
+class SearchScratch:
+    """Forward and backward search spaces for one graph size"""
+
+    def __init__(self, node_count):
+        self.node_count = node_count
+        self.forward = SearchSpace(node_count)
+        self.backward = SearchSpace(node_count)
+
+
+class ScratchPool:
+    """Hands out search scratch so concurrent requests never share one, and keeps idle ones for reuse"""
+
+    def __init__(self, limit=SCRATCH_POOL_LIMIT):
+        self.limit = limit
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def borrow(self, node_count):
+        scratch = None
+        with self._lock:
+            while self._idle and scratch is None:
+                candidate = self._idle.pop()
+                # Scratch sized for a graph that has since been replaced is dropped
+                if candidate.node_count == node_count:
+                    scratch = candidate
+        if scratch is None:
+            scratch = SearchScratch(node_count)
+        try:
+            yield scratch
+        finally:
+            with self._lock:
+                if len(self._idle) < self.limit:
+                    self._idle.append(scratch)
+
+
+scratch_pool = ScratchPool()
+
+
+def _search(space, offsets, targets, costs, source, target=None, heuristic=None):
+    """
+    Dijkstra / A* over CSR arrays from source, stopping as soon as target is
+    settled (or exhausting the graph when target is None). The heap only
+    holds (priority, node) pairs; distances and the edge used to reach each
+    node live in the search space. Returns the number of nodes settled.
+    """
+    generation = space.reset()
+    distances, previous_edge, stamp, settled = space.distances, space.previous_edge, space.stamp, space.settled
+    remaining = heuristic.tolist() if heuristic is not None else None
+    settled_count = 0
+
+    distances[source] = 0.0
+    previous_edge[source] = -1
+    stamp[source] = generation
+    heap = [(0.0, source)]
+
+    while heap:
+        _, node = heapq.heappop(heap)
+        if settled[node] == generation:
+            continue
+        settled[node] = generation
+        settled_count += 1
+        if node == target:
+            break
+
+        distance = distances[node]
+        start, end = int(offsets[node]), int(offsets[node + 1])
+        for edge, neighbor, cost in zip(range(start, end), targets[start:end].tolist(), costs[start:end].tolist()):
+            candidate = distance + cost
+            if stamp[neighbor] != generation or candidate < distances[neighbor]:
+                stamp[neighbor] = generation
+                distances[neighbor] = candidate
+                previous_edge[neighbor] = edge
+                priority = candidate + remaining[neighbor] if remaining is not None else candidate
+                heapq.heappush(heap, (priority, neighbor))
+
+    return settled_count
+
+
+def single_source_costs(offsets, targets, costs, source):
+    """Cheapest cost from source to every node (inf where unreachable)"""
+    node_count = len(offsets) - 1
+    space = SearchSpace(node_count)
+    _search(space, offsets, targets, costs, source)
+
+    distances = np.asarray(space.distances)
+    distances[np.asarray(space.stamp) != space.generation] = np.inf
+    return distances
+
+
+def _bidirectional_search(scratch, graph, costs, source, target, potential=None):
+    """
+    Search from source and target at once, always advancing the side with
+    the smaller queue head, and stop as soon as the two heads together can't
+    beat the best meeting point found. For A*, potential is the average of
+    the forward and backward bounds, (to_target - from_source) / 2; the
+    forward side adds it and the backward side subtracts it, which keeps
+    both searches on the same consistent reduced costs.
+    Returns (meeting node or None, nodes settled).
+    """
+    reverse_offsets, reverse_sources, reverse_edges = graph.reverse_csr()
+    forward, backward = scratch.forward, scratch.backward
+    forward_generation, backward_generation = forward.reset(), backward.reset()
+    if potential is None:
+        forward_potential = backward_potential = None
+    else:
+        forward_potential = potential.tolist()
+        backward_potential = (-potential).tolist()
+
+    # Each side: (heap, its search space, generation, CSR arrays, potential, the other side's space and generation)
+    sides = (
+        ([], forward, forward_generation, graph.offsets, graph.targets, costs, None, forward_potential,
+         backward, backward_generation),
+        ([], backward, backward_generation, reverse_offsets, reverse_sources, costs[reverse_edges], reverse_edges,
+         backward_potential, forward, forward_generation)
+    )
+    for heap, space, generation, _, _, _, _, node_potential, _, _ in sides:
+        node = source if space is forward else target
+        space.distances[node] = 0.0
+        space.previous_edge[node] = -1
+        space.stamp[node] = generation
+        heap.append((node_potential[node] if node_potential else 0.0, node))
+
+    forward_heap, backward_heap = sides[0][0], sides[1][0]
+    best, meeting = (0.0, source) if source == target else (float('inf'), None)
+    settled_count = 0
+
+    while forward_heap and backward_heap and forward_heap[0][0] + backward_heap[0][0] < best:
+        side = sides[0] if forward_heap[0][0] <= backward_heap[0][0] else sides[1]
+        heap, space, generation, offsets, neighbors, side_costs, edge_ids, node_potential, other, other_generation = side
+        other_heap = backward_heap if heap is forward_heap else forward_heap
+        distances, stamp, settled, previous_edge = space.distances, space.stamp, space.settled, space.previous_edge
+        other_stamp, other_distances = other.stamp, other.distances
+
+        # Keep expanding this side while its queue head is the smaller one
+        while heap and heap[0][0] <= other_heap[0][0] and heap[0][0] + other_heap[0][0] < best:
+            _, node = heapq.heappop(heap)
+            if settled[node] == generation:
+                continue
+            settled[node] = generation
+            settled_count += 1
+
+            start, end = int(offsets[node]), int(offsets[node + 1])
+            # Backward edges are stored by original edge id, so paths can be rebuilt from either side
+            edges = range(start, end) if edge_ids is None else edge_ids[start:end].tolist()
+            distance = distances[node]
+            for edge, neighbor, cost in zip(edges, neighbors[start:end].tolist(), side_costs[start:end].tolist()):
+                candidate = distance + cost
+                if stamp[neighbor] != generation or candidate < distances[neighbor]:
+                    stamp[neighbor] = generation
+                    distances[neighbor] = candidate
+                    previous_edge[neighbor] = edge
+                    priority = candidate + node_potential[neighbor] if node_potential else candidate
+                    heapq.heappush(heap, (priority, neighbor))
+
+                    if other_stamp[neighbor] == other_generation:
+                        total = candidate + other_distances[neighbor]
+                        if total < best:
+                            best, meeting = total, neighbor
+
+    return meeting, settled_count
+
+
+def shortest_path(graph, source, target, costs, heuristic=None):
+    """
+    Cheapest path from source to target over the CSR graph.
+    Runs Dijkstra's algorithm, or A* when heuristic gives a lower bound on
+    the remaining cost from every node.
+    Returns (edge ids along the path or None when unreachable, nodes settled).
+    """
+    with scratch_pool.borrow(graph.node_count) as scratch:
+        space = scratch.forward
+        settled_count = _search(space, graph.offsets, graph.targets, costs, source, target, heuristic)
+        if space.settled[target] != space.generation:
+            return None, settled_count
+
+        edges = []
+        node = target
+        while node != source:
+            edge = space.previous_edge[node]
+            edges.append(edge)
+            node = int(graph.sources[edge])
+    edges.reverse()
+    return edges, settled_count
+
+
+def bidirectional_shortest_path(graph, source, target, costs, to_target=None, from_source=None):
+    """
+    Cheapest path from source to target, searching from both ends.
+    Plain bidirectional Dijkstra, or bidirectional A* when given lower
+    bounds on the cost from every node to target and from source to every node.
+    Returns (edge ids along the path or None when unreachable, nodes settled).
+    """
+    potential = None
+    if to_target is not None and from_source is not None:
+        with np.errstate(invalid='ignore'):
+            potential = (np.asarray(to_target, dtype=np.float64) - np.asarray(from_source, dtype=np.float64)) / 2.0
+        # inf - inf where neither side can reach a node; it is never settled, so any finite value does
+        potential[np.isnan(potential)] = 0.0
+
+    with scratch_pool.borrow(graph.node_count) as scratch:
+        meeting, settled_count = _bidirectional_search(scratch, graph, costs, source, target, potential)
+        if meeting is None:
+            return None, settled_count
+
+        # Forward half: walk predecessor edges back to source
+        edges = []
+        node = meeting
+        while node != source:
+            edge = scratch.forward.previous_edge[node]
+            edges.append(edge)
+            node = int(graph.sources[edge])
+        edges.reverse()
+
+        # Backward half: each node's edge leads one step closer to target
+        node = meeting
+        while node != target:
+            edge = scratch.backward.previous_edge[node]
+            edges.append(edge)
+            node = int(graph.targets[edge])
+
+    return edges, settled_count
+
+
+def find_route(graph, exposure, source, target, safety_weight, algorithm='astar', landmarks=None,
+               bidirectional=None):
+    """
+    Safety-weighted route between two nodes.
+    A* uses landmark lower bounds when landmark tables are given, otherwise
+    the straight-line distance. bidirectional searches from both ends; by
+    default only Dijkstra does, since bidirectional A* needs a second set of
+    bounds that costs more to compute than the nodes it saves.
+    Returns a summary dict with the node path, or None when unreachable.
+    """
+    if bidirectional is None:
+        bidirectional = algorithm == 'dijkstra'
+    costs = edge_costs(graph, exposure, safety_weight)
+
+    def bound(reverse):
+        if landmarks is not None:
+            return landmarks.heuristic(graph, source, target, safety_weight, reverse=reverse)
+        return graph.straight_line_meters(source if reverse else target)
+
+    if bidirectional:
+        if algorithm == 'astar':
+            edges, settled_count = bidirectional_shortest_path(graph, source, target, costs, bound(False), bound(True))
+        else:
+            edges, settled_count = bidirectional_shortest_path(graph, source, target, costs)
+    else:
+        heuristic = bound(False) if algorithm == 'astar' else None
+        edges, settled_count = shortest_path(graph, source, target, costs, heuristic)
+
+    if edges is None:
+        return None
+
+    edges = np.asarray(edges, dtype=np.int64)
+    nodes = np.concatenate(([source], graph.targets[edges])).astype(np.int64)
+
+    return {
+        'nodes': nodes,
+        'distance_meters': float(graph.lengths[edges].sum()),
+        'crime_exposure': float(exposure[edges].sum()),
+        'cost': float(costs[edges].sum()),
+        'settled_nodes': settled_count,
+        'bidirectional': bidirectional
+    }
+
+
+def _matrix_batch(graph, exposure, costs, sources, destinations, delta):
+    """
+    Costs from a batch of sources to every destination by delta-stepping,
+    run for all sources at once on flat (source, node) labels so each round
+    is a handful of NumPy operations.
+
+    Each round relaxes every pending label below the current threshold,
+    which moves up by delta once none is left. Labels can never be cheaper
+    than the most expensive destination label of their source, so those
+    are dropped, and the search ends when every source has reached all its
+    destinations. Returns (cost, distance, exposure) arrays of shape
+    (sources, destinations), inf/NaN where unreachable.
+    """
+    node_count = graph.node_count
+    offsets = np.asarray(graph.offsets, dtype=np.int64)
+    degrees = np.diff(offsets)
+    targets = np.asarray(graph.targets, dtype=np.int64)
+    rows = np.arange(len(sources))
+
+    labels = np.full(len(sources) * node_count, np.inf)
+    previous_edge = np.full(len(sources) * node_count, -1, dtype=np.int64)
+    is_pending = np.zeros(len(sources) * node_count, dtype=bool)
+    pending = rows * node_count + sources
+    labels[pending] = 0.0
+    is_pending[pending] = True
+    destination_labels = rows[:, None] * node_count + destinations[None, :]
+    threshold = delta
+
+    while pending.size:
+        bound = labels[destination_labels].max(axis=1)
+        pending_labels = labels[pending]
+        useful = pending_labels < bound[pending // node_count]
+        if not useful.all():
+            is_pending[pending[~useful]] = False
+            pending, pending_labels = pending[useful], pending_labels[useful]
+            if not pending.size:
+                break
+
+        current = pending_labels < threshold
+        if not current.any():
+            threshold = pending_labels.min() + delta
+            continue
+        frontier = pending[current]
+        pending = pending[~current]
+        is_pending[frontier] = False
+
+        # Every edge out of the frontier, as (source row, edge id) pairs
+        row = frontier // node_count
+        nodes = frontier - row * node_count
+        counts = degrees[nodes]
+        ends = np.cumsum(counts)
+        edges = np.repeat(offsets[nodes] - ends + counts, counts) + np.arange(ends[-1] if ends.size else 0)
+        edge_rows = np.repeat(row, counts)
+        candidates = np.repeat(labels[frontier], counts) + costs[edges]
+        reached = edge_rows * node_count + targets[edges]
+
+        better = (candidates < labels[reached]) & (candidates < bound[edge_rows])
+        if not better.any():
+            continue
+        edges, candidates, reached = edges[better], candidates[better], reached[better]
+        np.minimum.at(labels, reached, candidates)
+        won = candidates == labels[reached]
+        previous_edge[reached[won]] = edges[won]
+
+        fresh = reached[~is_pending[reached]]
+        if fresh.size:
+            fresh = np.unique(fresh)
+            is_pending[fresh] = True
+            pending = np.concatenate((pending, fresh))
+
+    # Walk every (source, destination) route back at once to total its length and exposure
+    cost = labels[destination_labels]
+    distance = np.zeros(cost.shape)
+    crime = np.zeros(cost.shape)
+    current = destination_labels.copy()
+    while True:
+        edge = previous_edge[current]
+        walking = edge >= 0
+        if not walking.any():
+            break
+        edge = np.where(walking, edge, 0)
+        distance += np.where(walking, graph.lengths[edge], 0.0)
+        crime += np.where(walking, exposure[edge], 0.0)
+        current = np.where(walking, current - targets[edge] + graph.sources[edge], current)
+
+    unreachable = ~np.isfinite(cost)
+    distance[unreachable] = np.nan
+    crime[unreachable] = np.nan
+    return cost, distance, crime
+
+
+def route_matrix(graph, exposure, sources, destinations, safety_weight, workers=MATRIX_WORKERS):
+    """
+    Safety-weighted routes from every source node to every destination node.
+    Distinct sources are searched in batches of MATRIX_BATCH_ORIGINS, several
+    batches at a time.
+    Returns a dict of (sources, destinations) arrays: cost, distance_meters
+    and crime_exposure of the cheapest route, NaN where there is none.
+    """
+    costs = np.asarray(edge_costs(graph, exposure, safety_weight), dtype=np.float64)
+    delta = MATRIX_DELTA_EDGES * float(costs.mean()) if costs.size else 1.0
+    distinct_sources, row_index = np.unique(np.asarray(sources, dtype=np.int64), return_inverse=True)
+    distinct_destinations, column_index = np.unique(np.asarray(destinations, dtype=np.int64), return_inverse=True)
+
+    batches = [distinct_sources[start:start + MATRIX_BATCH_ORIGINS]
+               for start in range(0, len(distinct_sources), MATRIX_BATCH_ORIGINS)]
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches)))) as executor:
+        results = list(executor.map(
+            lambda batch: _matrix_batch(graph, exposure, costs, batch, distinct_destinations, delta), batches
+        ))
+
+    # Expand back to the requested order, where several points may share a node
+    cost, distance, crime = (np.concatenate(parts)[row_index][:, column_index] for parts in zip(*results))
+    return {
+        'cost': np.where(np.isfinite(cost), cost, np.nan),
+        'distance_meters': distance,
+        'crime_exposure': crime
+    }
+
+
+class _AlternativeSearch:
+    """
+    Point-to-point searches between one source and target at several
+    weights, sharing the straight-line distances and the A* bounds of each
+    weight between searches.
+    """
+
+    def __init__(self, graph, exposure, source, target, landmarks=None):
+        self.graph = graph
+        self.exposure = exposure
+        self.source = source
+        self.target = target
+        self.landmarks = landmarks
+        self.straight_line = graph.straight_line_meters(target)
+        self.heuristics = {}
+        self.searches = 0
+
+    def heuristic(self, safety_weight):
+        if self.landmarks is None:
+            return self.straight_line
+        if safety_weight not in self.heuristics:
+            self.heuristics[safety_weight] = self.landmarks.heuristic(
+                self.graph, self.source, self.target, safety_weight, straight_line=self.straight_line
+            )
+        return self.heuristics[safety_weight]
+
+    def route(self, safety_weight, penalized=None):
+        """
+        Edge ids of the cheapest route at safety_weight, or None. Edges in
+        penalized cost ALTERNATIVE_PENALTY more each time they appear there;
+        costs only grow, so the bounds for safety_weight still hold.
+        """
+        costs = edge_costs(self.graph, self.exposure, safety_weight)
+        if penalized is not None and len(penalized):
+            costs = costs * (1.0 + ALTERNATIVE_PENALTY * np.bincount(penalized, minlength=len(costs)))
+        self.searches += 1
+        edges, _ = shortest_path(self.graph, self.source, self.target, costs, self.heuristic(safety_weight))
+        if edges is None:
+            return None
+        return np.asarray(edges, dtype=np.int64)
+
+
+def _shared_length(graph, edges, other):
+    return float(graph.lengths[np.intersect1d(edges, other)].sum())
+
+
+def alternative_routes(graph, exposure, source, target, count=3, landmarks=None):
+    """
+    Up to count distinct routes trading distance against violent crime exposure.
+
+    The supported points of the distance/exposure Pareto frontier are found by
+    weighted-sum search between the shortest (weight 0) and safest (weight 1)
+    routes: the weight at which two neighbouring routes cost the same either
+    yields a route below the line between them, which splits that stretch of
+    the frontier, or proves there is none. When that gives fewer than count
+    routes that are different enough, detours are found by penalizing roads
+    already used. Dominated routes and near-copies of chosen ones are dropped.
+
+    Returns route summaries like find_route's, ordered from shortest to
+    safest, each with the safety_weight it was found at.
+    """
+    search = _AlternativeSearch(graph, exposure, source, target, landmarks)
+    found = {}
+
+    def add(edges, safety_weight):
+        key = edges.tobytes()
+        if key not in found:
+            found[key] = {
+                'edges': edges,
+                'distance_meters': float(graph.lengths[edges].sum()),
+                'crime_exposure': float(exposure[edges].sum()),
+                'safety_weight': safety_weight
+            }
+        return found[key]
+
+    shortest = search.route(0.0)
+    if shortest is None:
+        return None
+    frontier = [add(shortest, 0.0), add(search.route(1.0), 1.0)]
+
+    # Split frontier stretches, widest first, until there are enough routes or searches run out
+    stretches = [(frontier[0], frontier[1])]
+    while (stretches and search.searches < MAX_ALTERNATIVE_SEARCHES and
+           len(_pick_alternatives(graph, found.values(), count)) < count):
+        stretches.sort(key=lambda pair: pair[1]['distance_meters'] - pair[0]['distance_meters'])
+        short, safe = stretches.pop()
+        exposure_saved = short['crime_exposure'] - safe['crime_exposure']
+        if exposure_saved <= 0:
+            continue
+        safety_weight = (safe['distance_meters'] - short['distance_meters']) / (CRIME_PENALTY_METERS * exposure_saved)
+        if not 0 < safety_weight < 1:
+            continue
+
+        edges = search.route(safety_weight)
+        penalty = safety_weight * CRIME_PENALTY_METERS
+        tie = short['distance_meters'] + penalty * short['crime_exposure']
+        if edges is None or float(graph.lengths[edges].sum() + penalty * exposure[edges].sum()) >= tie * (1 - 1e-6):
+            continue
+        route = add(edges, safety_weight)
+        stretches += [(short, route), (route, safe)]
+
+    # Detours around the roads used so far, at the middle weight, a few tries at most
+    penalized = []
+    for _ in range(count):
+        if search.searches >= MAX_ALTERNATIVE_SEARCHES or len(_pick_alternatives(graph, found.values(), count)) >= count:
+            break
+        penalized = np.concatenate([penalized] + [route['edges'] for route in found.values()]).astype(np.int64)
+        edges = search.route(0.5, penalized)
+        if edges is None or edges.tobytes() in found:
+            break
+        add(edges, 0.5)
+
+    routes = _pick_alternatives(graph, found.values(), count)
+    for route in routes:
+        edges = route.pop('edges')
+        route['nodes'] = np.concatenate(([source], graph.targets[edges])).astype(np.int64)
+        route['cost'] = route['distance_meters'] + route['safety_weight'] * CRIME_PENALTY_METERS * route['crime_exposure']
+    return routes
+
+
+def _pick_alternatives(graph, routes, count):
+    """
+    Non-dominated routes within MAX_ALTERNATIVE_STRETCH of the shortest, always
+    the shortest and the safest, then the most different of the rest as long
+    as they overlap no chosen route by more than MAX_ALTERNATIVE_OVERLAP.
+    """
+    routes = sorted(routes, key=lambda route: (route['distance_meters'], route['crime_exposure']))
+    if not routes:
+        return []
+    limit = routes[0]['distance_meters'] * MAX_ALTERNATIVE_STRETCH
+
+    frontier = []
+    for route in routes:
+        if frontier and route['crime_exposure'] >= frontier[-1]['crime_exposure']:
+            continue
+        if route['distance_meters'] <= limit or not frontier:
+            frontier.append(route)
+
+    chosen = [frontier[0]]
+    if len(frontier) > 1 and count > 1:
+        chosen.append(frontier[-1])
+    candidates = frontier[1:-1]
+    while len(chosen) < count and candidates:
+        overlaps = [max(_shared_length(graph, route['edges'], other['edges']) / max(route['distance_meters'], 1e-9)
+                        for other in chosen) for route in candidates]
+        best = int(np.argmin(overlaps))
+        if overlaps[best] > MAX_ALTERNATIVE_OVERLAP:
+            break
+        chosen.append(candidates.pop(best))
+
+    return sorted(chosen, key=lambda route: route['distance_meters'])
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules are imported flat, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graphs import make_exposure, make_graph  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def graph():
+    return make_graph()
+
+
+@pytest.fixture(scope='session')
+def exposure(graph):
+    return make_exposure(graph)
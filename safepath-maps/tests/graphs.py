@@ -0,0 +1,80 @@
+"""
+Small road graphs for the routing tests, and a brute-force reference to
+check searches against.
+"""
+import numpy as np
+
+from geo import EARTH_RADIUS_METERS, haversine_pairwise
+from road_graph import RoadGraph
+
+NODE_COUNT = 60
+
+# Nodes of a separate cluster nothing else connects to
+ISLAND_SIZE = 4
+
+
+def make_graph(seed=7):
+    """
+    A few dozen intersections around Philadelphia, each linked to its
+    nearest neighbours. Some links are one-way, some are a little shorter
+    than the straight line between their ends, and the last nodes form an
+    island unreachable from the rest. One more node only has a one-way
+    link out, so nothing can reach it.
+    """
+    rng = np.random.default_rng(seed)
+    main = NODE_COUNT - ISLAND_SIZE - 1
+    lats = np.concatenate((39.95 + rng.uniform(0, 0.02, main), 40.2 + rng.uniform(0, 0.002, ISLAND_SIZE), [39.94]))
+    lngs = np.concatenate((-75.16 + rng.uniform(0, 0.02, main), -75.4 + rng.uniform(0, 0.002, ISLAND_SIZE), [-75.17]))
+
+    sources, targets = [], []
+
+    def link(nodes):
+        for node in nodes:
+            offsets = (lats[nodes] - lats[node]) ** 2 + (lngs[nodes] - lngs[node]) ** 2
+            for neighbor in nodes[np.argsort(offsets)[1:4]]:
+                sources.append(node)
+                targets.append(neighbor)
+                if rng.random() > 0.25:
+                    sources.append(neighbor)
+                    targets.append(node)
+
+    link(np.arange(main))
+    link(np.arange(main, main + ISLAND_SIZE))
+    sources.append(NODE_COUNT - 1)
+    targets.append(0)
+
+    # Drop repeated links, keeping one cost per directed pair
+    pairs = np.unique(np.column_stack((sources, targets)), axis=0)
+    sources, targets = pairs[:, 0], pairs[:, 1]
+    straight = haversine_pairwise(lats[sources], lngs[sources], lats[targets], lngs[targets], EARTH_RADIUS_METERS)
+    lengths = straight * rng.choice([0.8, 1.0, 1.2, 1.5], len(sources))
+    return RoadGraph.from_edges(lats, lngs, sources, targets, lengths, bidirectional=False)
+
+
+def make_exposure(graph, seed=11):
+    """Per-edge violent crime exposure: mostly small, with a few bad blocks"""
+    rng = np.random.default_rng(seed)
+    return (rng.gamma(0.5, 1.0, graph.edge_count) * (1 + 20 * (rng.random(graph.edge_count) < 0.1))).astype(np.float32)
+
+
+def brute_force_costs(graph, costs, source):
+    """Cheapest cost from source to every node by Bellman-Ford relaxation of every edge"""
+    costs = np.asarray(costs, dtype=np.float64)
+    distances = np.full(graph.node_count, np.inf)
+    distances[source] = 0.0
+    for _ in range(graph.node_count):
+        relaxed = distances.copy()
+        np.minimum.at(relaxed, graph.targets, distances[graph.sources] + costs)
+        if np.array_equal(relaxed, distances):
+            break
+        distances = relaxed
+    return distances
+
+
+def path_cost(graph, costs, edges, source, target):
+    """Total cost of an edge path, checking that it leads from source to target"""
+    edges = np.asarray(edges, dtype=np.int64)
+    nodes = np.concatenate(([source], graph.targets[edges]))
+    assert nodes[-1] == target
+    assert np.array_equal(graph.sources[edges], nodes[:-1])
+    return float(np.asarray(costs, dtype=np.float64)[edges].sum())
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from graphs import brute_force_costs
+from landmarks import LANDMARK_WEIGHTS, LandmarkTables
+from routing import edge_costs, find_route
+
+# Table weights, weights between them that use the scaled bound of the next
+# table up, and one past the last table
+SAFETY_WEIGHTS = sorted(set(LANDMARK_WEIGHTS) | {0.1, 0.4, 0.75, 0.9, 1.5})
+
+PAIRS = [(0, 30), (12, 3), (45, 7), (20, 20), (33, 58), (57, 56), (59, 10)]
+
+# float32 tables: differences of two bounds can be off by a few ulps of the larger
+TOLERANCE = 1e-3
+
+
+@pytest.fixture(scope='module')
+def landmarks(graph, exposure):
+    return LandmarkTables.build(graph, exposure)
+
+
+@pytest.fixture(scope='module')
+def all_pairs_costs(graph, exposure):
+    """All-pairs route costs at each safety weight, (from, to)"""
+    return {
+        weight: np.stack([brute_force_costs(graph, edge_costs(graph, exposure, weight), node)
+                          for node in range(graph.node_count)])
+        for weight in SAFETY_WEIGHTS
+    }
+
+
+def assert_admissible_and_consistent(graph, costs, bound, true_costs, reverse):
+    assert (bound >= 0).all()
+    # Never above the true cost; infinite only where there is no route
+    assert (bound <= true_costs + TOLERANCE).all()
+
+    # Consistent along every edge, in the direction the search runs
+    tail, head = (graph.targets, graph.sources) if reverse else (graph.sources, graph.targets)
+    with np.errstate(invalid='ignore'):
+        slack = costs + bound[head] - bound[tail]
+    assert (np.isnan(slack) | (slack >= -TOLERANCE)).all()
+
+
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+def test_heuristic_is_admissible_and_consistent(graph, exposure, landmarks, all_pairs_costs, safety_weight):
+    costs = np.asarray(edge_costs(graph, exposure, safety_weight), dtype=np.float64)
+    true_costs = all_pairs_costs[safety_weight]
+
+    for source, target in PAIRS:
+        to_target = landmarks.heuristic(graph, source, target, safety_weight)
+        assert_admissible_and_consistent(graph, costs, to_target, true_costs[:, target], reverse=False)
+
+        from_source = landmarks.heuristic(graph, source, target, safety_weight, reverse=True)
+        assert_admissible_and_consistent(graph, costs, from_source, true_costs[source], reverse=True)
+
+
+def test_heuristic_beats_straight_line(graph, landmarks):
+    straight = graph.straight_line_meters(30)
+    bound = landmarks.heuristic(graph, 0, 30, 0.5)
+    assert (bound >= straight).all() and (bound > straight).any()
+
+
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+def test_landmark_routes_are_cheapest(graph, exposure, landmarks, all_pairs_costs, safety_weight):
+    true_costs = all_pairs_costs[safety_weight]
+    for source, target in PAIRS:
+        route = find_route(graph, exposure, source, target, safety_weight, 'astar', landmarks, bidirectional=False)
+        if np.isinf(true_costs[source, target]):
+            assert route is None
+        else:
+            assert route['cost'] == pytest.approx(true_costs[source, target], rel=1e-6)
+
+
+def test_stale_crime_tables_are_dropped(graph, exposure, landmarks):
+    other = landmarks.usable_for('another exposure')
+    assert list(other.tables) == [0.0]
+    assert landmarks.usable_for(landmarks.exposure_checksum) is landmarks
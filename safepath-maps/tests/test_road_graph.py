@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from road_graph import GRAPH_ARRAYS, RoadGraph, read_array_file_header
+
+
+def test_from_edges_builds_csr():
+    graph = RoadGraph.from_edges([39.95, 39.96, 39.97], [-75.16, -75.16, -75.16], [0, 1], [1, 2])
+
+    assert graph.node_count == 3
+    assert graph.edge_count == 4
+    assert graph.offsets.tolist() == [0, 1, 3, 4]
+    for node in range(graph.node_count):
+        edges = range(graph.offsets[node], graph.offsets[node + 1])
+        assert all(graph.sources[edge] == node for edge in edges)
+    assert sorted(zip(graph.sources.tolist(), graph.targets.tolist())) == [(0, 1), (1, 0), (1, 2), (2, 1)]
+    np.testing.assert_allclose(graph.lengths, 1112, rtol=1e-3)
+
+
+def test_save_and_load_round_trip(graph, exposure, tmp_path):
+    path = str(tmp_path / 'road_graph.bin')
+    original = graph.with_crime_exposure(exposure, {'source': 'test'})
+    original.save(path)
+
+    loaded = RoadGraph.load(path)
+
+    assert loaded.checksum == original.checksum
+    assert loaded.heuristic_scale == original.heuristic_scale
+    assert loaded.crime_data == {'source': 'test'}
+    for name, dtype in GRAPH_ARRAYS.items():
+        array = getattr(loaded, name)
+        assert array.dtype == np.dtype(dtype)
+        np.testing.assert_array_equal(array, getattr(original, name))
+
+
+def test_load_rejects_a_corrupted_file(graph, tmp_path):
+    path = str(tmp_path / 'road_graph.bin')
+    graph.save(path)
+    _, data_offset = read_array_file_header(path)
+
+    with open(path, 'r+b') as f:
+        f.seek(data_offset + 100)
+        byte = f.read(1)
+        f.seek(data_offset + 100)
+        f.write(bytes([byte[0] ^ 0xff]))
+
+    with pytest.raises(ValueError, match='checksum'):
+        RoadGraph.load(path)
+    # Skipping the check maps the damaged file anyway
+    assert RoadGraph.load(path, verify=False).node_count == graph.node_count
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'road_graph.bin'
+    path.write_bytes(b'not a graph file')
+
+    with pytest.raises(ValueError):
+        RoadGraph.load(str(path))
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from graphs import brute_force_costs, path_cost
+from landmarks import LandmarkTables
+from routing import (CRIME_PENALTY_METERS, MATRIX_BATCH_ORIGINS, bidirectional_shortest_path, edge_costs, find_route,
+                     route_matrix, shortest_path, single_source_costs)
+
+SAFETY_WEIGHTS = (0.0, 0.3, 0.5, 1.0)
+
+# Every third node as a source, every node as a target
+SOURCES = range(0, 60, 3)
+
+
+@pytest.fixture(scope='module')
+def landmarks(graph, exposure):
+    return LandmarkTables.build(graph, exposure)
+
+
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+def test_single_source_costs_match_brute_force(graph, exposure, safety_weight):
+    costs = edge_costs(graph, exposure, safety_weight)
+    for source in SOURCES:
+        np.testing.assert_allclose(
+            single_source_costs(graph.offsets, graph.targets, costs, source),
+            brute_force_costs(graph, costs, source), rtol=1e-9
+        )
+
+
+def test_graph_has_unreachable_pairs(graph):
+    costs = single_source_costs(graph.offsets, graph.targets, graph.lengths, 0)
+    assert np.isinf(costs).sum() > 1
+
+
+@pytest.mark.parametrize('algorithm, use_landmarks', [('dijkstra', False), ('astar', False), ('astar', True)])
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+def test_find_route_costs_match_brute_force(graph, exposure, landmarks, algorithm, use_landmarks, safety_weight):
+    costs = edge_costs(graph, exposure, safety_weight)
+    for source in SOURCES:
+        expected = brute_force_costs(graph, costs, source)
+        for target in range(graph.node_count):
+            route = find_route(graph, exposure, source, target, safety_weight, algorithm,
+                               landmarks if use_landmarks else None, bidirectional=False)
+            if np.isinf(expected[target]):
+                assert route is None
+                continue
+
+            assert route['nodes'][0] == source and route['nodes'][-1] == target
+            assert route['cost'] == pytest.approx(expected[target], rel=1e-6)
+            penalty = safety_weight * CRIME_PENALTY_METERS * route['crime_exposure']
+            assert route['distance_meters'] + penalty == pytest.approx(route['cost'], rel=1e-5)
+
+
+def test_shortest_path_returns_a_connected_path(graph, exposure):
+    costs = edge_costs(graph, exposure, 0.5)
+    for source in SOURCES:
+        expected = brute_force_costs(graph, costs, source)
+        heuristic = graph.straight_line_meters(7)
+        edges, settled = shortest_path(graph, source, 7, costs, heuristic)
+        if np.isinf(expected[7]):
+            assert edges is None
+            continue
+        assert settled >= 1
+        assert path_cost(graph, costs, edges, source, 7) == pytest.approx(expected[7], rel=1e-9)
+
+
+def test_path_to_itself_is_empty(graph, exposure):
+    costs = edge_costs(graph, exposure, 0.5)
+    assert shortest_path(graph, 5, 5, costs) == ([], 1)
+
+
+# Destinations all reachable from the main sources, so searches are pruned
+# against the costliest one, and destinations on the island and the
+# one-way-out node, which no main source can reach
+MATRIX_DESTINATIONS = ([1, 3, 3, 20, 41, 4, 1], [1, 3, 3, 20, 41, 56, 57, 59, 4, 1])
+
+
+@pytest.mark.parametrize('bounds', ['none', 'straight_line', 'landmarks'])
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+def test_bidirectional_matches_shortest_path(graph, exposure, landmarks, bounds, safety_weight):
+    costs = edge_costs(graph, exposure, safety_weight)
+    # Includes source == target and sources and targets off the main component
+    for source in list(SOURCES) + [57, 59]:
+        for target in range(graph.node_count):
+            to_target = from_source = None
+            if bounds == 'straight_line':
+                to_target, from_source = graph.straight_line_meters(target), graph.straight_line_meters(source)
+            elif bounds == 'landmarks':
+                to_target = landmarks.heuristic(graph, source, target, safety_weight)
+                from_source = landmarks.heuristic(graph, source, target, safety_weight, reverse=True)
+
+            expected, _ = shortest_path(graph, source, target, costs)
+            edges, _ = bidirectional_shortest_path(graph, source, target, costs, to_target, from_source)
+            if expected is None:
+                assert edges is None
+            elif source == target:
+                assert edges == []
+            else:
+                assert path_cost(graph, costs, edges, source, target) == pytest.approx(
+                    path_cost(graph, costs, expected, source, target), rel=1e-9
+                )
+
+
+@pytest.mark.parametrize('safety_weight', SAFETY_WEIGHTS)
+@pytest.mark.parametrize('workers', [1, 4])
+@pytest.mark.parametrize('destinations', MATRIX_DESTINATIONS)
+def test_route_matrix_matches_single_source_costs(graph, exposure, safety_weight, workers, destinations):
+    # More distinct sources than one batch, repeated nodes, and island and one-way-out sources
+    sources = np.array(list(range(0, 2 * MATRIX_BATCH_ORIGINS + 6, 2)) + [4, 4, 57, 59])
+    destinations = np.array(destinations)
+    assert len(np.unique(sources)) > MATRIX_BATCH_ORIGINS
+
+    matrix = route_matrix(graph, exposure, sources, destinations, safety_weight, workers=workers)
+
+    costs = edge_costs(graph, exposure, safety_weight)
+    expected = np.stack([single_source_costs(graph.offsets, graph.targets, costs, source)[destinations]
+                         for source in sources])
+    unreachable = np.isinf(expected)
+    assert unreachable.any() and not unreachable.all()
+
+    for name in ('cost', 'distance_meters', 'crime_exposure'):
+        assert matrix[name].shape == (len(sources), len(destinations))
+        assert np.array_equal(np.isnan(matrix[name]), unreachable)
+    np.testing.assert_allclose(matrix['cost'][~unreachable], expected[~unreachable], rtol=1e-9)
+    np.testing.assert_allclose(
+        matrix['distance_meters'] + safety_weight * CRIME_PENALTY_METERS * matrix['crime_exposure'],
+        matrix['cost'], rtol=1e-5
+    )
+    # A source's route to its own node is empty
+    same = sources[:, None] == destinations[None, :]
+    assert (matrix['cost'][same] == 0).all() and (matrix['distance_meters'][same] == 0).all()